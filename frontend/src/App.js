@@ -23,6 +23,13 @@ function App() {
       await fetch('http://localhost:5050/lights_off', { method: 'POST' });
       console.log('Requested lights off on app load');
       
+      // Put the selected color in the server palette so keys change color without rebinding
+      await fetch('http://localhost:5050/palette', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ colors: [selectedColor] })
+      });
+
       // Bind all regions with the selected color
       await fetch('http://localhost:5050/bind_regions_color', {
         method: 'POST',
@@ -33,21 +40,21 @@ function App() {
       
       // Prime keyboard with all keys using the selected color
       console.log('Starting keyboard priming...');
-      const allKeys = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 !@#$%^&*()_+-=[]{}|;':\",./<>?`~";
+      const allKeys = "abcdefghijklmnopqrstuvwxyz";
       
-      for (let i = 0; i < allKeys.length; i++) {
-        const key = allKeys[i];
-        await fetch('http://localhost:5050/lights_on_key', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({
+      // One batched request binds every key with the selected color
+      await fetch('http://localhost:5050/lights_batch', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          ops: allKeys.split('').map(key => ({
+            op: 'on',
             key: key,
             color: selectedColor,
             duration: 0.05
-          })
-        });
-        await new Promise(resolve => setTimeout(resolve, 10));
-      }
+          }))
+        })
+      });
       
       // Turn all lights off after priming
       await fetch('http://localhost:5050/lights_off', { method: 'POST' });
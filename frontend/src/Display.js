@@ -3,6 +3,7 @@ import React, { useState, useEffect, useRef, useCallback } from "react";
 import WordRenderer from "./WordRenderer.jsx";
 import SettingsModal from "./SettingsModal.jsx";
 import FireworkCanvas from "./FireworkCanvas.jsx";
+import LightingChannel from "./LightingChannel";
 import { useNavigate } from "react-router-dom";
 import "./Display.css";
 
@@ -49,6 +50,7 @@ function Display() {
   const wordContainerRef = useRef(null);
   const lastKeypressRef = useRef(null);
   const intervalsRef = useRef([]);
+  const missesRef = useRef(0); // wrong keys typed since the last advance, reported with it
 
   // Set fixed font size without auto-scaling
   useEffect(() => {
@@ -60,37 +62,35 @@ function Display() {
     localStorage.setItem("fontSize", fontSize.toString());
   }, [fontSize]);
 
-  // Light up a key on the keyboard (individual or region mode)
-  const lightKey = useCallback((key) => {
-    const endpoint = lightingMode === "regional" 
-      ? "http://localhost:5050/lights_on_region"
-      : "http://localhost:5050/lights_on_key";
-    
-    fetch(endpoint, {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        key: key === ' ' ? ' ' : key,
-        color: ledColor
-        // No duration - key stays lit until explicitly turned off
-      })
-    }).catch(err => console.error("Error lighting key:", err));
+  // Upload the section as a lesson: the server lights its first key and moves the
+  // light itself on each "advance" message, so a keystroke is one tiny message.
+  // Resolves with the lesson id (null if the upload failed).
+  const lessonRef = useRef(Promise.resolve(null));
+  const startLesson = useCallback((text) => {
+    lessonRef.current = LightingChannel.send({
+      op: "lesson",
+      text,
+      mode: lightingMode === "regional" ? "region" : "key",
+      color: ledColor,
+    })
+      .then(ack => (ack.status === 200 ? ack.body.id : null))
+      .catch(err => {
+        console.error("Error uploading lesson:", err);
+        return null;
+      });
   }, [lightingMode, ledColor]);
 
-  // Turn off a key on the keyboard (individual or region mode)
-  const turnOffKey = useCallback((key) => {
-    const endpoint = lightingMode === "regional"
-      ? "http://localhost:5050/lights_off_region_for_key"
-      : "http://localhost:5050/lights_off_key";
-    
-    fetch(endpoint, {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        key: key === ' ' ? ' ' : key
-      })
-    }).catch(err => console.error("Error turning off key:", err));
-  }, [lightingMode]);
+  // Move the server-side cursor to `cursor`. It is absolute and the server ignores one that
+  // is not past its current cursor, so a repeated or late (HTTP fallback) message never moves
+  // the light back; `misses` feeds the server's per-key error rates
+  const advanceLesson = useCallback((cursor, misses) => {
+    lessonRef.current.then(lesson => {
+      if (lesson == null) return;
+      // Goes over the persistent WebSocket when connected, HTTP otherwise
+      LightingChannel.send({ op: "advance", lesson, cursor, misses })
+        .catch(err => console.error("Error advancing lesson:", err));
+    });
+  }, []);
 
   // Reset all keyboard lights
   const resetKeyLights = useCallback(() => {
@@ -100,9 +100,6 @@ function Display() {
   }, []);
 
 
-  // Keep track of the previous section for smooth transitions
-  const previousSectionRef = useRef("");
-
   // ----------------- LOAD CURRENT SECTION -----------------
   useEffect(() => {
     if (contentSections.length === 0) return;
@@ -115,26 +112,17 @@ function Display() {
     // Reset timing data for new section
     lastKeypressRef.current = Date.now(); // Set to now so first letter timing is recorded
     intervalsRef.current = [];
+    missesRef.current = 0;
     
-    // Turn off the first key of the previous section to avoid flashing
-    if (previousSectionRef.current && previousSectionRef.current.length > 0) {
-      turnOffKey(previousSectionRef.current[0]);
-      
-      // Add small delay before lighting the new key to prevent timing race conditions
-      setTimeout(() => {
-        if (section.length > 0) {
-          lightKey(section[0]);
-          previousSectionRef.current = section;
-        }
-      }, 50);
+    // Replaces the previous section's lesson (its light goes off in the same batch)
+    if (section.length > 0) {
+      startLesson(section);
     } else {
-      // If no previous section, light immediately
-      if (section.length > 0) {
-        lightKey(section[0]);
-        previousSectionRef.current = section;
-      }
+      lessonRef.current = Promise.resolve(null);
+      fetch("http://localhost:5050/lesson", { method: "DELETE" })
+        .catch(err => console.error("Error ending lesson:", err));
     }
-  }, [contentSections, currentIndex, lightKey, turnOffKey]);
+  }, [contentSections, currentIndex, startLesson]);
 
   // ----------------- KEYBOARD INPUT -----------------
   useEffect(() => {
@@ -153,18 +141,13 @@ function Display() {
         intervalsRef.current.push(interval);
         lastKeypressRef.current = now;
         
-        // Turn off the current key
-        turnOffKey(currentSection[currentLetterIndex]);
-        
         const next = currentLetterIndex + 1;
         setCurrentLetterIndex(next);
         updateProgressBar(next, currentSection.length);
         
-        // Light up the next key (if not at end of section)
-        if (next < currentSection.length) {
-          const nextKey = currentSection[next];
-          lightKey(nextKey);
-        }
+        // The server turns off the current key and lights the next one (none at the end)
+        advanceLesson(next, missesRef.current);
+        missesRef.current = 0;
 
         if (next === currentSection.length) {
           setSectionCompleted(true);
@@ -236,12 +219,14 @@ function Display() {
             ...newFireworks,
           ]);
         }
+      } else {
+        missesRef.current += 1;
       }
     };
 
     window.addEventListener("keydown", handleKeyPress);
     return () => window.removeEventListener("keydown", handleKeyPress);
-  }, [currentSection, currentLetterIndex, sectionCompleted, lightingMode, lightKey, turnOffKey]);
+  }, [currentSection, currentLetterIndex, sectionCompleted, advanceLesson]);
 
   // ----------------- PROGRESS BAR -----------------
   const updateProgressBar = (current, total) => {
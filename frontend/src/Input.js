@@ -130,13 +130,30 @@ function Input() {
       .catch((err) => alert("Error: " + err));
   }
 
+  // Starts the server's lighting self-test job and follows its progress until it finishes
   function runTestPy() {
     fetch("http://localhost:5050/run_test", {
-      method: "POST"
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({})
     })
       .then((res) => res.json())
       .then((data) => {
-        alert("Test.py finished!\nSTDOUT:\n" + data.stdout + "\nSTDERR:\n" + data.stderr);
+        if (!data.job) {
+          alert("Error: " + (data.error || "could not start the test"));
+          return;
+        }
+        const steps = [];
+        const events = new EventSource("http://localhost:5050" + data.events);
+        events.addEventListener("step", (e) => {
+          const step = JSON.parse(e.data);
+          steps.push(`${step.passed ? "ok  " : "FAIL"} ${step.op} (${step.status}, ${step.ms.toFixed(1)} ms)`);
+        });
+        events.addEventListener("done", (e) => {
+          events.close();
+          const done = JSON.parse(e.data);
+          alert(`Lighting test ${done.state}!\n` + steps.join("\n") + (done.error ? "\n" + done.error : ""));
+        });
       })
       .catch((err) => alert("Error: " + err));
   }
@@ -0,0 +1,73 @@
+// LightingChannel.js
+// Persistent WebSocket connection to the light server (port 5051).
+// Messages are acknowledged by id; when the socket is not open, send()
+// falls back to the equivalent HTTP endpoint so lighting keeps working.
+
+const CHANNEL_URL = "ws://localhost:5051";
+const HTTP_URL = "http://localhost:5050";
+const RECONNECT_DELAY_MS = 1000;
+
+// op -> HTTP endpoint used as fallback
+const FALLBACK_ENDPOINTS = {
+  on: "/lights_on_key",
+  off: "/lights_off_key",
+  region_on: "/lights_on_region",
+  region_off: "/lights_off_region_for_key",
+  batch: "/lights_batch",
+  lesson: "/lesson",
+  advance: "/lesson/advance",
+};
+
+let socket = null;
+let nextId = 1;
+const pending = new Map();
+
+function connect() {
+  if (socket && (socket.readyState === WebSocket.OPEN || socket.readyState === WebSocket.CONNECTING)) {
+    return;
+  }
+  socket = new WebSocket(CHANNEL_URL);
+
+  socket.onmessage = (event) => {
+    const ack = JSON.parse(event.data);
+    const resolve = pending.get(ack.id);
+    if (resolve) {
+      pending.delete(ack.id);
+      resolve(ack);
+    }
+  };
+
+  socket.onclose = () => {
+    // Resolve anything still waiting so callers never hang
+    for (const resolve of pending.values()) {
+      resolve({ status: 0, body: { error: "Channel closed" } });
+    }
+    pending.clear();
+    setTimeout(connect, RECONNECT_DELAY_MS);
+  };
+}
+
+function sendHttp(message) {
+  const { op, id, ...body } = message;
+  return fetch(HTTP_URL + FALLBACK_ENDPOINTS[op], {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body)
+  }).then(async (res) => ({ id, status: res.status, body: await res.json() }));
+}
+
+// Send a lighting message ({op, ...fields}); resolves with {id, status, body}
+export function send(message) {
+  connect();
+  if (socket.readyState !== WebSocket.OPEN) {
+    return sendHttp(message);
+  }
+  const id = nextId++;
+  return new Promise((resolve) => {
+    pending.set(id, resolve);
+    socket.send(JSON.stringify({ ...message, id }));
+  });
+}
+
+const LightingChannel = { send };
+export default LightingChannel;
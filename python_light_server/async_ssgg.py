@@ -0,0 +1,424 @@
+import asyncio
+import contextlib
+import json
+import time
+from typing import Optional
+
+import requests
+
+from layout import Layout, load_layout
+from log import get_logger
+from metrics import REGISTRY
+from ssgg import SteelSeriesLighting, read_core_props
+from transport import AsyncPooledTransport, CircuitBreaker, RequestsTransport
+
+logger = get_logger(__name__)
+
+
+class AsyncSteelSeriesLighting:
+    """
+    asyncio 版 SteelSeriesLighting：接口相同，方法均为协程
+
+    所有请求经由 AsyncPooledTransport（少量长连接 + 流水线）发送，
+    刷新器是 asyncio 任务而不是线程，停止/取消不会阻塞事件循环。
+    一个事件循环即可同时处理数百个并发的灯光操作。
+
+    与同步版语义一致：同一事件的开/关按分片锁（asyncio.Lock）串行；
+    GG 不可用时由同一个 CircuitBreaker 快速失败，恢复后在事件循环上重放注册/绑定；
+    定时的区域点亮结束后执行 lights_off()。
+    不支持同步版的调色板、合成模式、清单文件与心跳保活。
+
+        async with AsyncSteelSeriesLighting(game="MYAPP") as lighting:
+            await lighting.register_game("Python Test", "Me")
+            await lighting.lights_on_key("AKEY_EVENT", "a", "#00ff00", duration=2)
+    """
+
+    REGIONS = SteelSeriesLighting.REGIONS
+    ALL_OFF_EVENT = SteelSeriesLighting.ALL_OFF_EVENT
+    EVENT_LOCK_STRIPES = SteelSeriesLighting.EVENT_LOCK_STRIPES
+
+    def __init__(self, game="MYAPP", core_props_path=None, transport=None, pool_size=4, metrics=None, layout=None,
+                 retry_interval=5):
+        """
+        创建客户端（不发请求；调用 connect() 或使用 async with 等待 GG 可用）
+
+        :param game: 游戏/应用标识符（字符串，必须唯一，例如 "MYAPP"）
+        :param core_props_path: coreProps.json 的路径（优先使用此值；若为空将自动探测）
+        :param transport: 异步 HTTP 传输层（需实现 async post/close）；默认 AsyncPooledTransport
+        :param pool_size: 默认传输层的长连接数
+        :param metrics: 指标注册表（默认使用全局 metrics.REGISTRY）
+        :param layout: 键盘布局（Layout，或 layouts/ 中的名称/文件路径）；默认 qwerty
+        :param retry_interval: 断路器打开后的探测间隔（秒）
+        """
+        address, self.core_props_path = read_core_props(core_props_path)
+        self._core_props_arg = core_props_path
+        self.game = game
+        self.base_url = f"http://{address}"
+        self.transport = transport if transport is not None else AsyncPooledTransport(pool_size=pool_size)
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.layout = layout if isinstance(layout, Layout) else load_layout(layout)
+        self._bound_events = set()   # 已注册的事件
+        self._bindings = {}          # event -> canonical handlers JSON that GG currently has
+        self._refreshers = {}        # event -> asyncio.Task
+        self._game_metadata = None
+        # 锁分片：同一事件的操作不会交错（见 _event_lock）
+        self._event_locks = tuple(asyncio.Lock() for _ in range(self.EVENT_LOCK_STRIPES))
+        # 断路器：探测在其后台线程中同步进行，恢复后的重放提交到事件循环（见 _recover）
+        self.breaker = CircuitBreaker(probe=self._probe, on_recover=self._recover, probe_interval=retry_interval)
+        self._probe_transport = RequestsTransport()
+        self._loop = None
+
+    async def connect(self, retry_interval=5):
+        """等待 SteelSeries GG 可用，并预绑定全黑事件"""
+        self._loop = asyncio.get_running_loop()
+        while not await self._health_check():
+            logger.warning("SteelSeries GG not available at %s, retrying in %ss...", self.base_url, retry_interval)
+            await asyncio.sleep(retry_interval)
+        await self._ensure_all_off_event()
+        return self
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """取消全部刷新任务并关闭连接"""
+        for task in self._refreshers.values():
+            task.cancel()
+        self._refreshers.clear()
+        await self.transport.close()
+
+    async def _post(self, endpoint, payload=None, body=None, timeout=None):
+        """
+        发送 POST 请求到 SteelSeries GG API，若 GG 返回错误则打印详细信息
+
+        :param payload: 请求体对象（自动转 JSON）
+        :param body: 预先序列化好的请求体（提供时忽略 payload）
+        :param timeout: 单次调用的超时（秒，或 (connect, read) 元组）
+        """
+        name = str(endpoint).lstrip('/')
+        # GG 不可用时直接失败（CircuitOpenError 是 requests.ConnectionError）
+        self.breaker.check()
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        url = f"{self.base_url}/{name}"
+        start = time.perf_counter()
+        try:
+            r = await self.transport.post(url, payload=payload, body=body, timeout=timeout)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            self.metrics.observe("gg_call", name, time.perf_counter() - start)
+            self.metrics.inc("gg_call_errors", name)
+            if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                # GG 已停止或挂起：累计失败，达到阈值后断路器打开；恢复时重放全部绑定
+                self.breaker.record_failure()
+            if isinstance(e, requests.HTTPError):
+                logger.warning("GG returned HTTP %d for POST %s: %s (request: %.500s)", r.status_code, url,
+                               r.text[:500], body if body is not None else json.dumps(payload, separators=(",", ":")),
+                               extra={"fields": {"endpoint": name, "status": r.status_code}})
+            raise
+        self.metrics.observe("gg_call", name, time.perf_counter() - start)
+        self.breaker.record_success()
+        return r.json() if r.content else {}
+
+    def _probe(self):
+        """断路器探测（在断路器线程中同步执行）：重新读取 coreProps.json 并做一次健康检查"""
+        try:
+            address, self.core_props_path = read_core_props(self._core_props_arg)
+        except (OSError, ValueError):
+            return False
+        self.base_url = f"http://{address}"
+        payload = {"game": self.game, "game_display_name": "HealthCheck", "developer": "Checker",
+                   "deinitialize_timer_length_ms": 1000}
+        try:
+            r = self._probe_transport.post(f"{self.base_url}/game_metadata", payload=payload, timeout=(0.25, 0.5))
+            return r.status_code in (200, 204)
+        except requests.RequestException:
+            return False
+
+    def _recover(self):
+        """断路器恢复回调：在事件循环上重放状态并等待完成，失败则抛出，断路器继续探测"""
+        asyncio.run_coroutine_threadsafe(self._replay(), self._loop).result()
+
+    async def _replay(self):
+        """GG 恢复后重放应用元数据、事件注册、绑定，以及正在刷新的事件数值"""
+        if self._game_metadata is not None:
+            await self._post("game_metadata", self._game_metadata)
+        bindings = dict(self._bindings)
+        events = set(self._bound_events) | set(bindings)
+
+        async def replay_one(event):
+            if event in self._bound_events:
+                await self.register_event(event)
+            if event in bindings:
+                handlers = [json.loads(h) for h in json.loads(bindings[event])]
+                await self._post("bind_game_event", {"game": self.game, "event": event, "handlers": handlers})
+
+        await asyncio.gather(*(replay_one(event) for event in events))
+        await self._ensure_all_off_event()
+        if self._refreshers:
+            await self.set_event_values(dict.fromkeys(self._refreshers, 1))
+        logger.info("Reconnected to SteelSeries GG at %s; replayed %d event(s)", self.base_url, len(events))
+
+    async def wait_until_connected(self, timeout=None):
+        """等待 GG 可用（断路器关闭）；超时返回 False"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.breaker.wait_closed, timeout)
+
+    def _event_lock(self, event):
+        """The lock stripe that serializes every operation on `event`."""
+        return self._event_locks[hash(event) % len(self._event_locks)]
+
+    @contextlib.asynccontextmanager
+    async def _events_locked(self, events=None):
+        """Hold the stripes of all `events` (every stripe if None), always taken in stripe order."""
+        if events is None:
+            stripes = range(len(self._event_locks))
+        else:
+            stripes = sorted({hash(event) % len(self._event_locks) for event in events})
+        async with contextlib.AsyncExitStack() as stack:
+            for stripe in stripes:
+                await stack.enter_async_context(self._event_locks[stripe])
+            yield
+
+    async def _health_check(self):
+        try:
+            payload = {
+                "game": self.game,
+                "game_display_name": "HealthCheck",
+                "developer": "Checker",
+                "deinitialize_timer_length_ms": 1000
+            }
+            r = await self.transport.post(f"{self.base_url}/game_metadata", payload=payload, timeout=1)
+            return r.status_code in (200, 204)
+        except requests.RequestException:
+            return False
+
+    async def register_game(self, display_name="My Python App", developer="Me", deinitialize_timer_length_ms: Optional[int] = None):
+        """
+        注册应用（告诉 GG 有一个新应用接入）
+
+        :param display_name: 在 GG UI 中显示的应用名
+        :param developer: 开发者名称
+        :return: API 响应
+        """
+        payload = {
+            "game": self.game,
+            "game_display_name": display_name,
+            "developer": developer,
+            "deinitialize_timer_length_ms": 10000
+        }
+        if deinitialize_timer_length_ms is not None:
+            payload["deinitialize_timer_length_ms"] = deinitialize_timer_length_ms
+        result = await self._post("game_metadata", payload)
+        self._game_metadata = payload
+        return result
+
+    async def register_event(self, event, min_value=0, max_value=1, icon_id=1):
+        """
+        注册一个事件（类似一个灯光开关）
+
+        :param event: 事件名称（字符串）
+        :param min_value: 最小值（通常为 0）
+        :param max_value: 最大值（通常为 1）
+        :param icon_id: GG 内置的图标 ID（用于 UI 显示）
+        :return: API 响应
+        """
+        payload = {
+            "game": self.game,
+            "event": event,
+            "min_value": min_value,
+            "max_value": max_value,
+            "icon_id": icon_id
+        }
+        result = await self._post("register_game_event", payload)
+        self._bound_events.add(event)
+        return result
+
+    async def bind_handlers(self, event, handlers):
+        """
+        绑定事件的 handlers；与 GG 当前已有的绑定完全相同时不发请求
+
+        :param event: 事件名称
+        :param handlers: bind_game_event 的 handlers 列表
+        :return: API 响应（缓存命中时为 {}）
+        """
+        key = SteelSeriesLighting._canonical_handlers(handlers)
+        if self._bindings.get(event) == key:
+            self.metrics.inc("binding_cache", "hit")
+            return {}
+        self.metrics.inc("binding_cache", "miss")
+        payload = {"game": self.game, "event": event, "handlers": handlers}
+        try:
+            result = await self._post("bind_game_event", payload)
+        except Exception:
+            self._bindings.pop(event, None)
+            raise
+        self._bindings[event] = key
+        return result
+
+    async def bind_key_color(self, event, key, hex_color):
+        """
+        绑定某个按键与颜色
+
+        :param event: 事件名称
+        :param key: 键位标识（例如 "q", "w", "a"）
+        :param hex_color: 十六进制颜色 "#RRGGBB"
+        :return: API 响应
+        """
+        return await self.bind_zones_color(event, [key], hex_color)
+
+    async def bind_zones_color(self, event, zones, hex_color):
+        """
+        一次性把多个键位绑定到同一事件、同一颜色
+
+        :param event: 事件名称
+        :param zones: 键位标识列表
+        :param hex_color: 十六进制颜色 "#RRGGBB"
+        :return: API 响应
+        """
+        return await self.bind_handlers(event, SteelSeriesLighting._color_handlers(zones, hex_color))
+
+    def invalidate_bindings(self):
+        """清空注册/绑定缓存（删除应用后调用）；GG 重启由断路器重放处理"""
+        self._bound_events.clear()
+        self._bindings.clear()
+
+    async def set_event_value(self, event, value=1):
+        """
+        触发事件，控制灯光开/关
+
+        :param event: 事件名称
+        :param value: 数值（1 表示点亮，0 表示熄灭）
+        :return: API 响应
+        """
+        payload = {"game": self.game, "event": event, "data": {"value": value}}
+        return await self._post("game_event", payload)
+
+    async def set_event_values(self, values):
+        """
+        一次请求触发多个事件（multiple_game_events）
+
+        :param values: {事件名称: 数值}
+        :return: API 响应
+        """
+        payload = {
+            "game": self.game,
+            "events": [{"event": event, "data": {"value": value}} for event, value in values.items()]
+        }
+        return await self._post("multiple_game_events", payload)
+
+    async def ensure_event_registered(self, event):
+        """
+        确保事件已注册（不绑定颜色），已注册则不发请求
+
+        :param event: 事件名称
+        """
+        if event not in self._bound_events:
+            await self.register_event(event)
+
+    async def lights_on_key(self, event, key, hex_color="#FFFFFF", interval=1, duration=3600):
+        """
+        点亮并保持按键持续亮着（由 asyncio 任务刷新）。
+        如果 duration 为 None -> 无限刷新直到调用 lights_off()。
+        """
+        async with self._event_lock(event):
+            await self.ensure_event_registered(event)
+            await self.bind_key_color(event, key, hex_color)
+            await self.set_event_value(event, 1)
+            self._start_event_refresher(event, interval=interval, duration=duration)
+
+    async def lights_on_region(self, event, key, hex_color="#FFFFFF", interval=1, duration=3600):
+        """
+        区域点亮：输入区域内任意 key，点亮整个区域
+        结束后自动执行 lights_off()
+        """
+        region = self.layout.region_keys(key)
+        if not region:
+            raise ValueError(f"Key '{key}' not in any region")
+        async with self._event_lock(event):
+            await self.ensure_event_registered(event)
+            await self.bind_zones_color(event, region, hex_color)
+            await self.set_event_value(event, 1)
+            self._start_event_refresher(event, interval=interval, duration=duration,
+                                        on_finish=(self.lights_off if duration is not None else None))
+
+    async def lights_off_event(self, event):
+        """
+        熄灭单个事件（按键或区域）：取消其刷新任务并置 0
+
+        :param event: 事件名称
+        """
+        async with self._event_lock(event):
+            self._stop_event_refresher(event)
+            # 从未注册/绑定的事件不可能亮着；发送 0 只会让 GG 隐式创建一个没有绑定的事件
+            if event not in self._bound_events and event not in self._bindings:
+                return
+            await self.set_event_value(event, 0)
+
+    async def lights_off(self):
+        """
+        熄灭所有键：取消全部刷新任务，并通过一次批量请求把亮着的事件置 0、触发全黑事件
+        """
+        await self._ensure_all_off_event()
+        async with self._events_locked():
+            refreshers, self._refreshers = self._refreshers, {}
+            for task in refreshers.values():
+                task.cancel()
+            values = dict.fromkeys(refreshers, 0)
+            values[self.ALL_OFF_EVENT] = 1
+            await self.set_event_values(values)
+
+    async def remove_game(self):
+        result = await self._post("remove_game", {"game": self.game})
+        # GG 已丢弃该应用的全部事件与绑定，本地缓存随之失效
+        self.invalidate_bindings()
+        return result
+
+    async def _ensure_all_off_event(self):
+        """只在第一次把 ALL_OFF_EVENT 绑定到全键黑色，后续仅触发 event 即可"""
+        await self.ensure_event_registered(self.ALL_OFF_EVENT)
+        await self.bind_zones_color(self.ALL_OFF_EVENT, ["all"], "#000000")
+
+    def _start_event_refresher(self, event, interval=1, duration=None, on_finish=None):
+        """Start a task re-sending value 1 every `interval` seconds (the caller already sent the first).
+        An existing refresher for `event` is cancelled without sending value 0 or running its on_finish.
+        on_finish (coroutine function) is awaited after the duration elapsed and the event was turned off.
+        """
+        previous = self._refreshers.get(event)
+        if previous is not None:
+            previous.cancel()
+        self._refreshers[event] = asyncio.ensure_future(self._refresh(event, interval, duration, on_finish))
+
+    def _stop_event_refresher(self, event):
+        """Cancel the refresher for `event` if present (does not wait for it)."""
+        task = self._refreshers.pop(event, None)
+        if task is not None:
+            task.cancel()
+
+    async def _refresh(self, event, interval, duration, on_finish=None):
+        loop = asyncio.get_running_loop()
+        end = loop.time() + duration if duration is not None else None
+        while True:
+            delay = interval if end is None else min(interval, end - loop.time())
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if end is not None and loop.time() >= end:
+                break
+            try:
+                await self.set_event_value(event, 1)
+            except requests.RequestException:
+                pass
+        # the duration elapsed (cancellation never gets here): turn the event off
+        if self._refreshers.get(event) is asyncio.current_task():
+            del self._refreshers[event]
+        try:
+            await self.set_event_value(event, 0)
+        except requests.RequestException:
+            pass
+        if on_finish is not None:
+            try:
+                await on_finish()
+            except Exception:
+                pass
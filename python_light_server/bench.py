@@ -0,0 +1,261 @@
+"""
+End-to-end latency benchmark for light_server.py against the mock GG engine.
+
+Starts mock_gg.py in a separate process (so its CPU time is not counted),
+imports light_server.py pointed at it, serves the Flask app and the
+WebSocket channel on free ports, then types text at a fixed keystroke
+rate the way Display.js does and reports per-keystroke latency
+percentiles, GG calls, thread count and CPU time:
+
+    python3 bench.py --mode http --rate 10 --seconds 10
+    python3 bench.py --mode batch --sessions 4 --gg-latency-ms 2
+    python3 bench.py --mode channel --json > baseline.json
+
+Modes: http (separate lights_off_key + lights_on_key requests, the original
+frontend behaviour), batch (one /lights_batch per keystroke), channel (one
+batch message over the WebSocket channel).
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_TEXT = "the quick brown fox jumps over the lazy dog "
+MODES = ("http", "batch", "channel")
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """p50/p95/p99/max in milliseconds for a list of seconds."""
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "max_ms": max(samples) * 1000 if samples else 0.0,
+    }
+
+
+class Stack:
+    """
+    Mock GG process + in-process light server (HTTP and channel) on free ports.
+
+    :param gg_latency_ms: latency injected by the mock for every GG call
+    :param gg_jitter_ms: extra random latency per GG call
+    :param gg_failure_rate: probability that a GG call fails with HTTP 500
+    """
+
+    def __init__(self, gg_latency_ms=0.0, gg_jitter_ms=0.0, gg_failure_rate=0.0):
+        self._mock = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "mock_gg.py"),
+             "--latency-ms", str(gg_latency_ms), "--jitter-ms", str(gg_jitter_ms),
+             "--failure-rate", str(gg_failure_rate), "--seed", "1"],
+            stdout=subprocess.PIPE, text=True,
+        )
+        self.gg_url = None
+        for line in self._mock.stdout:
+            if line.startswith("Mock GG listening on "):
+                self.gg_url = line.split()[-1]
+            if line.startswith("STEELSERIES_COREPROPS="):
+                os.environ["STEELSERIES_COREPROPS"] = line.strip().split("=", 1)[1]
+                break
+
+        # synthetic traffic stays out of the typing analytics log and any capture, unless asked for
+        os.environ.setdefault("LIGHT_EVENT_LOG", "off")
+        os.environ.setdefault("LIGHT_CAPTURE", "off")
+        sys.path.insert(0, HERE)
+        # per-request access lines would dominate the output (and the CPU time)
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        import light_server
+        self.light_server = light_server
+        if not light_server.wait_until_ready(timeout=30):
+            raise RuntimeError(f"Light server failed to prime: {light_server.priming_status}")
+        # let the background warmer pre-bind the non-letter keys first, so it is not part of the measurement
+        deadline = time.monotonic() + 30
+        while light_server.lighting.warm([]) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        self._http = make_server("127.0.0.1", 0, light_server.app, threaded=True)
+        self.url = f"http://127.0.0.1:{self._http.server_port}"
+        threading.Thread(target=self._http.serve_forever, daemon=True).start()
+        self.channel = light_server.LightingChannel(light_server.CHANNEL_HANDLERS, port=0,
+                                                   capture=light_server.capture).start()
+
+    def gg_stats(self):
+        return requests.get(f"{self.gg_url}/__stats", timeout=5).json()
+
+    def gg_reset(self):
+        requests.post(f"{self.gg_url}/__reset", timeout=5)
+
+    def close(self):
+        self.channel.stop()
+        self._http.shutdown()
+        self._mock.terminate()
+        self._mock.wait(timeout=5)
+
+
+class Session(threading.Thread):
+    """One simulated typist sending lighting traffic for each keystroke."""
+
+    def __init__(self, stack, mode, rate, seconds, text=SAMPLE_TEXT):
+        super().__init__(daemon=True)
+        self.stack = stack
+        self.mode = mode
+        self.interval = 1.0 / rate
+        self.seconds = seconds
+        self.text = text
+        self.latencies = []
+        self.errors = 0
+        self.late = 0  # keystrokes that started behind schedule (server backed up)
+
+    def _keystroke_http(self, http, prev_key, next_key):
+        http.post(f"{self.stack.url}/lights_off_key", json={"key": prev_key})
+        http.post(f"{self.stack.url}/lights_on_key", json={"key": next_key, "color": "#00ff00"})
+
+    def _keystroke_batch(self, http, prev_key, next_key):
+        http.post(f"{self.stack.url}/lights_batch", json={"ops": [
+            {"op": "off", "key": prev_key},
+            {"op": "on", "key": next_key, "color": "#00ff00"},
+        ]})
+
+    def _keystroke_channel(self, client, prev_key, next_key):
+        client.request({"op": "batch", "ops": [
+            {"op": "off", "key": prev_key},
+            {"op": "on", "key": next_key, "color": "#00ff00"},
+        ]})
+
+    def run(self):
+        if self.mode == "channel":
+            from ws_channel import ChannelClient
+            conn = ChannelClient(port=self.stack.channel.port)
+        else:
+            # browsers keep connections to the light server alive as well
+            conn = requests.Session()
+        keystroke = getattr(self, f"_keystroke_{self.mode}")
+        start = time.perf_counter()
+        i = 0
+        while True:
+            due = start + i * self.interval
+            if due - start >= self.seconds:
+                break
+            now = time.perf_counter()
+            if now < due:
+                time.sleep(due - now)
+            elif now - due > self.interval:
+                self.late += 1
+            prev_key = self.text[i % len(self.text)]
+            next_key = self.text[(i + 1) % len(self.text)]
+            t0 = time.perf_counter()
+            try:
+                keystroke(conn, prev_key, next_key)
+            except Exception:
+                self.errors += 1
+            self.latencies.append(time.perf_counter() - t0)
+            i += 1
+        conn.close()
+
+
+def run(stack, mode, rate, seconds, sessions):
+    stack.gg_reset()
+    peak_threads = threading.active_count()
+    stop = threading.Event()
+
+    def sample_threads():
+        nonlocal peak_threads
+        while not stop.wait(0.05):
+            peak_threads = max(peak_threads, threading.active_count())
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+    sampler.start()
+    workers = [Session(stack, mode, rate, seconds) for _ in range(sessions)]
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    stop.set()
+    sampler.join()
+    gg = stack.gg_stats()
+
+    latencies = [lat for w in workers for lat in w.latencies]
+    keystrokes = len(latencies)
+    return {
+        "mode": mode,
+        "rate": rate,
+        "sessions": sessions,
+        "seconds": round(wall, 3),
+        "keystrokes": keystrokes,
+        "errors": sum(w.errors for w in workers),
+        "late_keystrokes": sum(w.late for w in workers),
+        "latency": summarize(latencies),
+        "gg_calls": gg["calls"],
+        "gg_calls_total": gg["total_calls"],
+        "gg_calls_per_keystroke": gg["total_calls"] / keystrokes if keystrokes else 0.0,
+        "peak_threads": peak_threads,
+        "cpu_seconds": round(cpu, 3),
+        "cpu_ms_per_keystroke": cpu * 1000 / keystrokes if keystrokes else 0.0,
+    }
+
+
+def print_report(result):
+    lat = result["latency"]
+    print(f"== {result['mode']}: {result['keystrokes']} keystrokes, {result['sessions']} session(s) "
+          f"at {result['rate']}/s over {result['seconds']}s")
+    print(f"   latency  p50 {lat['p50_ms']:.2f} ms  p95 {lat['p95_ms']:.2f} ms  "
+          f"p99 {lat['p99_ms']:.2f} ms  max {lat['max_ms']:.2f} ms")
+    print(f"   GG calls {result['gg_calls_total']} ({result['gg_calls_per_keystroke']:.2f}/keystroke) {result['gg_calls']}")
+    print(f"   threads  peak {result['peak_threads']}   CPU {result['cpu_seconds']} s "
+          f"({result['cpu_ms_per_keystroke']:.2f} ms/keystroke)   errors {result['errors']}  late {result['late_keystrokes']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end light server latency benchmark (mock GG)")
+    parser.add_argument("--mode", choices=MODES + ("all",), default="all")
+    parser.add_argument("--rate", type=float, default=10.0, help="keystrokes per second per session")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--gg-latency-ms", type=float, default=1.0)
+    parser.add_argument("--gg-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--gg-failure-rate", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    # the server's own console output goes to stderr so stdout stays a clean report
+    with contextlib.redirect_stdout(sys.stderr):
+        stack = Stack(args.gg_latency_ms, args.gg_jitter_ms, args.gg_failure_rate)
+        try:
+            modes = MODES if args.mode == "all" else (args.mode,)
+            results = []
+            for mode in modes:
+                results.append(run(stack, mode, args.rate, args.seconds, args.sessions))
+                stack.light_server.lighting.lights_off()
+                time.sleep(0.2)
+        finally:
+            stack.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print_report(result)
+
+
+if __name__ == "__main__":
+    main()
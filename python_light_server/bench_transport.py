@@ -0,0 +1,83 @@
+"""
+Benchmark: per-event GG latency with a bare `requests.post` vs the pooled keep-alive transport.
+
+Runs against the local mock GG server, so no SteelSeries hardware is needed:
+
+    python3 bench_transport.py [--calls 500] [--threads 4]
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from mock_gg import MockGG
+from ssgg import SteelSeriesLighting
+from transport import PooledTransport, RequestsTransport
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(mock, transport, calls, threads):
+    lighting = SteelSeriesLighting(game="BENCH", core_props_path=mock.core_props_path, transport=transport)
+    lighting.register_game("Bench", "Bench")
+    lighting.register_event("BENCH_EVENT")
+    mock.reset()
+
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(n):
+        local = []
+        for i in range(n):
+            start = time.perf_counter()
+            lighting.set_event_value("BENCH_EVENT", i % 2)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    per_thread = calls // threads
+    workers = [threading.Thread(target=worker, args=(per_thread,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    transport.close()
+    return {
+        "calls": len(latencies),
+        "elapsed": elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.mean(latencies),
+        "connections": mock.connections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    with MockGG() as mock:
+        transports = [
+            ("requests.post", RequestsTransport()),
+            ("pooled", PooledTransport(pool_size=args.threads)),
+        ]
+        print(f"{'transport':<14}{'calls':>7}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'conns':>7}")
+        for name, transport in transports:
+            r = run(mock, transport, args.calls, args.threads)
+            print(
+                f"{name:<14}{r['calls']:>7}{r['calls'] / r['elapsed']:>10.0f}"
+                f"{r['p50'] * 1000:>9.2f}{r['p95'] * 1000:>9.2f}{r['p99'] * 1000:>9.2f}{r['connections']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
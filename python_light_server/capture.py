@@ -0,0 +1,147 @@
+"""
+Capture of incoming lighting requests as a replayable trace (see replay.py).
+
+A trace is a JSON-lines file. The first line describes the capture, each
+following line is one request as it arrived:
+
+    {"trace": 1, "started": 1760750000.123456, "layout": "qwerty"}
+    {"at": 1760750001.250113, "session": "127.0.0.1", "via": "http", "method": "POST",
+     "path": "/lesson/advance", "body": {"lesson": 3, "cursor": 5}, "status": 200, "ms": 0.41}
+    {"at": 1760750001.391870, "session": "127.0.0.1:53122", "via": "channel",
+     "body": {"op": "advance", "lesson": 3, "cursor": 6}, "status": 200, "ms": 0.12}
+
+"at" is the wall-clock arrival time (so traces written by several worker
+processes merge), "session" the client: the X-Session header or remote
+address for HTTP, the connection for the WebSocket channel. "status" and
+"ms" are what the server answered and how long the handler took, for
+comparison with a replay.
+
+`record` only appends to a deque; a writer thread serializes whatever is
+pending every `flush_interval` seconds and appends it with one write, so
+capturing adds nothing measurable to a request.
+
+    recorder = TraceRecorder("lighting.trace")
+    recorder.record("127.0.0.1", "http", {"key": "a"}, 200, 0.4, method="POST", path="/lights_on_key")
+"""
+import collections
+import json
+import threading
+import time
+
+from log import get_logger
+from metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+TRACE_VERSION = 1
+
+
+class TraceRecorder:
+    """
+    Appends captured requests to a trace file in the background.
+
+    :param path: trace file (appended to; a header line is written when it is created)
+    :param layout: name of the keyboard layout the server runs with (recorded in the header)
+    :param flush_interval: seconds between background writes
+    :param max_pending: requests kept in memory while the writer is behind (oldest dropped beyond)
+    :param metrics: metrics registry (default: the shared REGISTRY)
+    """
+
+    def __init__(self, path, layout=None, flush_interval=0.2, max_pending=65536, metrics=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self._pending = collections.deque(maxlen=max_pending)
+        self._write_lock = threading.Lock()
+        # O_APPEND: each flush is one write of whole lines, so workers sharing the file never interleave
+        self._file = open(path, "ab", buffering=0)
+        if self._file.tell() == 0:
+            self._file.write(json.dumps({"trace": TRACE_VERSION, "started": time.time(),
+                                         "layout": layout}).encode("utf-8") + b"\n")
+        self.stats = {"captured": 0, "writes": 0}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-capture", daemon=True)
+        self._thread.start()
+        self.metrics.gauge("capture", lambda: dict(self.stats, pending=len(self._pending), path=self.path))
+
+    def record(self, session, via, body, status, ms, method=None, path=None, at=None):
+        """
+        Queue one request (returns at once; written by the background thread).
+
+        :param session: client the request came from
+        :param via: "http" or "channel"
+        :param body: the request's JSON body (channel: the message, with its "op")
+        :param status: status the server answered
+        :param ms: handler time in milliseconds
+        :param method: HTTP method (HTTP only)
+        :param path: request path (HTTP only)
+        :param at: arrival time (epoch seconds; default now)
+        """
+        self._pending.append((time.time() if at is None else at, session, via, method, path, body, status, ms))
+
+    def flush(self):
+        """Write every queued request now (the writer thread does this every flush_interval)."""
+        with self._write_lock:
+            count = len(self._pending)
+            if not count:
+                return 0
+            lines = []
+            for _ in range(count):
+                at, session, via, method, path, body, status, ms = self._pending.popleft()
+                entry = {"at": round(at, 6), "session": session, "via": via}
+                if via == "http":
+                    entry["method"] = method
+                    entry["path"] = path
+                entry.update(body=body, status=status, ms=round(ms, 3))
+                lines.append(json.dumps(entry, separators=(",", ":"), default=str))
+            self._file.write(("\n".join(lines) + "\n").encode("utf-8"))
+            self.stats["captured"] += count
+            self.stats["writes"] += 1
+            return count
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Trace capture write failed: %s", e)
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join(timeout=2)
+        self.flush()
+        self._file.close()
+
+
+def read_trace(path):
+    """
+    Load a trace file.
+
+    :return: (header, entries) with entries sorted by arrival time; the header is {} if missing
+    :raises ValueError: if a line is not valid JSON
+    """
+    header = {}
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}")
+            if "trace" in entry:
+                header = header or entry
+            elif "at" in entry:
+                entries.append(entry)
+    entries.sort(key=lambda entry: entry["at"])
+    return header, entries
+
+
+def sessions(entries):
+    """Entries grouped by session, in order of each session's first request."""
+    grouped = collections.OrderedDict()
+    for entry in entries:
+        grouped.setdefault(entry.get("session") or "", []).append(entry)
+    return grouped
+
@@ -0,0 +1,144 @@
+import collections
+import threading
+import time
+
+from log import get_logger
+from metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised by `CommandQueue.submit` when the queue stays full and nothing can be shed."""
+
+
+class CommandQueue:
+    """
+    Write-behind queue of desired per-event state in front of SteelSeriesLighting.
+
+    `submit` records the latest command for each event and returns at once;
+    a dispatcher thread sends everything pending as one `apply_batch`, so
+    request latency no longer depends on GG latency. A command for an event
+    that is already waiting replaces it (on -> off -> on is sent as one on).
+
+    The queue holds at most `maxsize` events. When it is full, `submit`
+    waits up to `put_timeout` for the dispatcher (backpressure), then sheds
+    the oldest "on" command that has waited longer than `stale_after`
+    seconds; "off" commands are never shed. If nothing can be shed,
+    `QueueFull` is raised. At dispatch, timed "on" commands lose the time
+    they waited, and are dropped if their duration already ran out.
+
+    :param lighting: SteelSeriesLighting the commands are applied to
+    :param maxsize: maximum number of events waiting
+    :param stale_after: age in seconds after which a waiting "on" may be shed
+    :param put_timeout: seconds `submit` waits for room before shedding
+    :param metrics: metrics registry (default: the shared REGISTRY)
+    """
+
+    def __init__(self, lighting, maxsize=256, stale_after=0.5, put_timeout=0.05, metrics=None):
+        self.lighting = lighting
+        self.maxsize = maxsize
+        self.stale_after = stale_after
+        self.put_timeout = put_timeout
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self._pending = collections.OrderedDict()  # event -> (op, enqueued_at)
+        self._barriers = collections.deque()       # (pending before the barrier, fn)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="lighting-commands", daemon=True)
+        self._thread.start()
+        self.metrics.gauge("command_queue_depth", self.depth)
+
+    def depth(self):
+        with self._cond:
+            return len(self._pending) + sum(len(pending) for pending, _ in self._barriers)
+
+    def submit(self, op):
+        """
+        Queue one apply_batch operation ({"event", "action", ...}).
+
+        :return: "queued", or "coalesced" if it replaced a waiting command for the same event
+        """
+        event = op.get("event")
+        now = time.monotonic()
+        with self._cond:
+            if event in self._pending:
+                self._pending[event] = (op, now)
+                self.metrics.inc("command_queue", "coalesced")
+                return "coalesced"
+            if len(self._pending) >= self.maxsize:
+                self._cond.wait_for(lambda: len(self._pending) < self.maxsize, self.put_timeout)
+            if len(self._pending) >= self.maxsize and not self._shed(now):
+                self.metrics.inc("command_queue", "rejected")
+                raise QueueFull(f"Lighting command queue is full ({self.maxsize} events waiting)")
+            self._pending[event] = (op, now)
+            self._cond.notify_all()
+        self.metrics.inc("command_queue", "queued")
+        return "queued"
+
+    def _shed(self, now):
+        # called with the lock held: drop the oldest stale "on" to make room
+        for event, (op, enqueued_at) in self._pending.items():
+            if op.get("action") == "on" and now - enqueued_at >= self.stale_after:
+                del self._pending[event]
+                self.metrics.inc("command_queue", "shed")
+                return True
+        return False
+
+    def run_after(self, fn):
+        """Run `fn()` on the dispatcher once every command submitted so far has been applied."""
+        with self._cond:
+            self._barriers.append((self._pending, fn))
+            self._pending = collections.OrderedDict()
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or self._pending or self._barriers)
+                if self._stopped:
+                    return
+                if self._barriers:
+                    pending, fn = self._barriers.popleft()
+                else:
+                    pending, fn = self._pending, None
+                    self._pending = collections.OrderedDict()
+                # room was made; wake submitters waiting on a full queue
+                self._cond.notify_all()
+            self._dispatch(pending)
+            if fn is not None:
+                try:
+                    fn()
+                except Exception as e:
+                    logger.warning("Queued lighting call failed: %s", e)
+
+    def _dispatch(self, pending):
+        now = time.monotonic()
+        ops = []
+        for op, enqueued_at in pending.values():
+            waited = now - enqueued_at
+            self.metrics.observe("command_queue_wait", op.get("action") or "", waited)
+            duration = op.get("duration")
+            if op.get("action") == "on" and duration is not None:
+                if waited >= duration:
+                    self.metrics.inc("command_queue", "expired")
+                    continue
+                # the light still goes out when the requester expected it to
+                op = dict(op, duration=duration - waited)
+            ops.append(op)
+        if not ops:
+            return
+        try:
+            results = self.lighting.apply_batch(ops)
+        except Exception as e:
+            logger.warning("Queued lighting batch failed: %s", e)
+            self.metrics.inc("command_queue", "failed", len(ops))
+            return
+        for result in results:
+            self.metrics.inc("command_queue", "failed" if result["status"] == "error" else "applied")
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout=2)
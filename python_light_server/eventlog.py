@@ -0,0 +1,378 @@
+"""
+Append-only binary log of lighting and keystroke events, with typing analytics on top.
+
+Every record is 24 bytes (RECORD): wall-clock time, session (lesson id, 0
+outside lessons), kind, region, misses, zone and a value in milliseconds
+(handler latency for lighting events, dwell for keystrokes: how long the
+key was lit before it was typed). Zones and regions are stored as indexes
+into the tables in the file header, so a log only ever appends to a file
+written with the same layout; a log written with another layout is moved
+aside (to <path>.<timestamp>) and a new one is started.
+
+`record` only appends a tuple to a deque, so logging adds nothing
+measurable to a request; a writer thread packs whatever is pending every
+`flush_interval` seconds and appends it with one write. Queries map the
+file read-only and, when NumPy is installed, run vectorized over the
+mapped records (np.frombuffer, no copy); otherwise the same results are
+computed in pure Python.
+
+    log = EventLog(".keystrokes.log", load_layout())
+    log.record(KEYSTROKE, "f", value=412.0, session=3, misses=1)
+    log.keys()        # {"f": {"count": 1, "mean_ms": 412.0, "misses": 1, "error_rate": 0.5, ...}}
+    log.weak_keys()   # slowest / most mistyped keys first
+"""
+import collections
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # queries fall back to pure Python
+    np = None
+
+from layout import KEYBOARD_ZONES
+from log import get_logger
+from metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+MAGIC = b"KEYLOG1\n"
+HEADER_LENGTH = struct.Struct("<I")
+# time, session, kind, region (index + 1, 0 = none), misses, zone (index, NO_ZONE = unknown), value (ms)
+RECORD = struct.Struct("<dIBBHHxxf")
+NO_ZONE = 0xFFFF
+# shortest period keystroke rates are computed over, so a burst of a few keys is not read as thousands a minute
+MIN_RATE_WINDOW = 60.0
+
+# record kinds
+KEY_ON, KEY_OFF, REGION_ON, REGION_OFF, KEYSTROKE = 1, 2, 3, 4, 5
+KINDS = {"key_on": KEY_ON, "key_off": KEY_OFF, "region_on": REGION_ON, "region_off": REGION_OFF,
+         "keystroke": KEYSTROKE}
+
+if np is not None:
+    DTYPE = np.dtype({
+        "names": ["t", "session", "kind", "region", "misses", "zone", "value"],
+        "formats": ["<f8", "<u4", "u1", "u1", "<u2", "<u2", "<f4"],
+        "offsets": [0, 8, 12, 13, 14, 16, 20],
+        "itemsize": RECORD.size,
+    })
+
+
+class EventLog:
+    """
+    Append-only keystroke/lighting event log (see the module docstring).
+
+    :param path: log file (created if missing)
+    :param layout: Layout used to resolve keys to zones and regions
+    :param flush_interval: seconds between background writes
+    :param max_pending: records kept in memory while the writer is behind (oldest dropped beyond)
+    :param metrics: metrics registry (default: the shared REGISTRY)
+    """
+
+    def __init__(self, path, layout, flush_interval=0.2, max_pending=65536, metrics=None):
+        self.path = path
+        self.layout = layout
+        self.flush_interval = flush_interval
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.zone_names = list(KEYBOARD_ZONES) + sorted(
+            {zone for zones in layout.regions.values() for zone in zones} - set(KEYBOARD_ZONES))
+        self.region_names = list(layout.regions)
+        self._zone_index = {zone: i for i, zone in enumerate(self.zone_names)}
+        self._region_index = {region: i + 1 for i, region in enumerate(self.region_names)}
+        self._pending = collections.deque(maxlen=max_pending)
+        self._write_lock = threading.Lock()
+        self._header_size = self._open()
+        self.stats = {"written": 0, "writes": 0}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+        self.metrics.gauge("event_log", lambda: dict(self.stats, pending=len(self._pending),
+                                                     records=self.count()))
+
+    # -- writing --
+
+    def _header(self):
+        # deterministic, so processes sharing the file write identical headers
+        meta = json.dumps({"record": RECORD.format, "zones": self.zone_names, "regions": self.region_names,
+                           "layout": self.layout.name}).encode("utf-8")
+        # records start on an 8-byte boundary so the file maps straight onto DTYPE
+        meta += b" " * (-(len(MAGIC) + HEADER_LENGTH.size + len(meta)) % 8)
+        return MAGIC + HEADER_LENGTH.pack(len(meta)) + meta
+
+    def _read_header(self, f):
+        if f.read(len(MAGIC)) != MAGIC:
+            return None, None
+        (length,) = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+        try:
+            meta = json.loads(f.read(length))
+        except ValueError:
+            return None, None
+        return meta, len(MAGIC) + HEADER_LENGTH.size + length
+
+    def _open(self):
+        """Open the log for appending; returns the header size."""
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                meta, size = self._read_header(f)
+            if (meta is not None and meta.get("record") == RECORD.format
+                    and meta.get("zones") == self.zone_names and meta.get("regions") == self.region_names):
+                # drop a partial record left by a crash mid-write
+                excess = (os.path.getsize(self.path) - size) % RECORD.size
+                if excess:
+                    os.truncate(self.path, os.path.getsize(self.path) - excess)
+                self._file = open(self.path, "ab", buffering=0)
+                return size
+            aside = f"{self.path}.{int(time.time())}"
+            os.replace(self.path, aside)
+            logger.info("Event log %s was written with another layout; moved to %s", self.path, aside)
+        header = self._header()
+        try:
+            # O_EXCL: if another process sharing the log created it first, its header is the same
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+        # O_APPEND: each flush is one write of whole records, so writers never interleave mid-record
+        self._file = open(self.path, "ab", buffering=0)
+        return len(header)
+
+    def record(self, kind, key, value=0.0, session=0, misses=0):
+        """
+        Queue one event (returns at once; written by the background thread).
+
+        :param kind: KEY_ON, KEY_OFF, REGION_ON, REGION_OFF or KEYSTROKE
+        :param key: typed key (resolved to its zone and region through the layout)
+        :param value: milliseconds (handler latency, or dwell for a keystroke)
+        :param session: lesson id, 0 outside lessons
+        :param misses: wrong keys typed before this keystroke
+        """
+        self._pending.append((time.time(), kind, key, value, session, misses))
+
+    def flush(self):
+        """Write every queued event now (the writer thread does this every flush_interval)."""
+        with self._write_lock:
+            count = len(self._pending)
+            if not count:
+                return 0
+            buffer = bytearray(count * RECORD.size)
+            written = 0
+            for _ in range(count):
+                t, kind, key, value, session, misses = self._pending.popleft()
+                if not isinstance(key, str) or not key:
+                    continue
+                zone = self.layout.zone(key)
+                RECORD.pack_into(
+                    buffer, written * RECORD.size, t, session or 0, kind,
+                    self._region_index.get(self.layout.region_of(key), 0),
+                    max(0, min(int(misses or 0), 0xFFFF)),
+                    self._zone_index.get(zone, NO_ZONE), value,
+                )
+                written += 1
+            if written:
+                self._file.write(memoryview(buffer)[:written * RECORD.size])
+                self.stats["written"] += written
+                self.stats["writes"] += 1
+            return written
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Event log write failed: %s", e)
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join(timeout=2)
+        self.flush()
+        self._file.close()
+
+    def count(self):
+        """Records on disk."""
+        try:
+            return (os.path.getsize(self.path) - self._header_size) // RECORD.size
+        except OSError:
+            return 0
+
+    # -- reading --
+
+    def _records(self):
+        """All records: a NumPy structured array over the mapped file, or a list of RECORD tuples."""
+        self.flush()
+        count = self.count()
+        if count <= 0:
+            return np.zeros(0, DTYPE) if np is not None else []
+        with open(self.path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), self._header_size + count * RECORD.size, access=mmap.ACCESS_READ)
+        if np is not None:
+            # the array keeps the mapping alive; it is unmapped when the last view is gone
+            return np.frombuffer(mapped, DTYPE, count, self._header_size)
+        with mapped, memoryview(mapped) as view:
+            return list(RECORD.iter_unpack(view[self._header_size:]))
+
+    def _select(self, records, kinds, since=None, session=None):
+        """Records of the given kinds, optionally from `since` (epoch seconds) and one session."""
+        if np is not None:
+            mask = np.isin(records["kind"], kinds)
+            if since is not None:
+                mask &= records["t"] >= since
+            if session is not None:
+                mask &= records["session"] == session
+            return records[mask]
+        return [r for r in records
+                if r[2] in kinds and (since is None or r[0] >= since) and (session is None or r[1] == session)]
+
+    def keys(self, since=None, session=None):
+        """
+        Per-key typing stats: dwell (ms the key was lit before it was typed) and error rate.
+
+        :return: {zone: {"count", "mean_ms", "median_ms", "misses", "error_rate", "lit", "light_ms"}}
+        """
+        records = self._records()
+        strokes = self._select(records, [KEYSTROKE], since, session)
+        lit = self._select(records, [KEY_ON], since, session)
+        if np is not None:
+            stats = self._keys_numpy(strokes, lit)
+        else:
+            stats = self._keys_python(strokes, lit)
+        result = {}
+        for index, (count, mean, median, misses, lit_count, light_ms) in stats.items():
+            attempts = count + misses
+            result[self.zone_names[index]] = {
+                "count": count,
+                "mean_ms": round(float(mean), 1),
+                "median_ms": round(float(median), 1),
+                "misses": misses,
+                "error_rate": round(misses / attempts, 4) if attempts else 0.0,
+                "lit": lit_count,
+                "light_ms": round(float(light_ms), 3),
+            }
+        return result
+
+    def _keys_numpy(self, strokes, lit):
+        size = len(self.zone_names)
+        strokes = strokes[strokes["zone"] < size]
+        lit = lit[lit["zone"] < size]
+        zone = strokes["zone"].astype(np.intp)
+        value = strokes["value"].astype(np.float64)
+        counts = np.bincount(zone, minlength=size)
+        sums = np.bincount(zone, weights=value, minlength=size)
+        misses = np.bincount(zone, weights=strokes["misses"], minlength=size)
+        lit_counts = np.bincount(lit["zone"].astype(np.intp), minlength=size)
+        lit_sums = np.bincount(lit["zone"].astype(np.intp), weights=lit["value"].astype(np.float64), minlength=size)
+        # medians: one sort of zone * span + value puts each zone's values in one ascending run
+        # (much faster than lexsort); subtracting the zone offsets gives the values back
+        low_value = value.min() if len(value) else 0.0
+        span = (value.max() - low_value if len(value) else 0.0) + 1.0
+        offsets = np.arange(size) * span
+        ordered = np.sort(offsets[zone] + (value - low_value)) - np.repeat(offsets, counts) + low_value
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        present = counts > 0
+        low = starts[present] + (counts[present] - 1) // 2
+        high = starts[present] + counts[present] // 2
+        medians = np.zeros(size)
+        medians[present] = (ordered[low] + ordered[high]) / 2
+        stats = {}
+        for index in np.flatnonzero(present | (lit_counts > 0) | (misses > 0)):
+            count = int(counts[index])
+            stats[int(index)] = (count, sums[index] / count if count else 0.0, float(medians[index]),
+                                 int(misses[index]), int(lit_counts[index]),
+                                 lit_sums[index] / lit_counts[index] if lit_counts[index] else 0.0)
+        return stats
+
+    def _keys_python(self, strokes, lit):
+        values = collections.defaultdict(list)
+        misses = collections.Counter()
+        lit_values = collections.defaultdict(list)
+        size = len(self.zone_names)
+        for _, _, _, _, miss, zone, value in strokes:
+            if zone < size:
+                values[zone].append(value)
+                misses[zone] += miss
+        for *_, zone, value in lit:
+            if zone < size:
+                lit_values[zone].append(value)
+        stats = {}
+        for index in set(values) | set(lit_values) | set(misses):
+            ordered = sorted(values[index])
+            count = len(ordered)
+            median = (ordered[(count - 1) // 2] + ordered[count // 2]) / 2 if count else 0.0
+            light = lit_values[index]
+            stats[index] = (count, sum(ordered) / count if count else 0.0, median, misses[index],
+                            len(light), sum(light) / len(light) if light else 0.0)
+        return stats
+
+    def regions(self, since=None, session=None):
+        """
+        Per-region throughput: keystrokes, keystrokes per minute, mean dwell, lights.
+
+        The rate is over the queried period (`since` to now), or over the
+        period typed when the query is unbounded, and never over less than
+        MIN_RATE_WINDOW seconds.
+
+        :return: {region: {"keystrokes", "per_minute", "mean_ms", "misses", "lit"}}
+        """
+        records = self._records()
+        strokes = self._select(records, [KEYSTROKE], since, session)
+        lit = self._select(records, [KEY_ON, REGION_ON], since, session)
+        size = len(self.region_names) + 1
+        if np is not None:
+            region = strokes["region"].astype(np.intp)
+            counts = np.bincount(region, minlength=size)
+            sums = np.bincount(region, weights=strokes["value"].astype(np.float64), minlength=size)
+            misses = np.bincount(region, weights=strokes["misses"], minlength=size)
+            lit_counts = np.bincount(lit["region"].astype(np.intp), minlength=size)
+            span = float(strokes["t"].max() - strokes["t"].min()) if len(strokes) > 1 else 0.0
+        else:
+            counts, sums, misses, lit_counts = [0] * size, [0.0] * size, [0] * size, [0] * size
+            for _, _, _, region, miss, _, value in strokes:
+                counts[region] += 1
+                sums[region] += value
+                misses[region] += miss
+            for r in lit:
+                lit_counts[r[3]] += 1
+            times = [r[0] for r in strokes]
+            span = max(times) - min(times) if len(times) > 1 else 0.0
+        if since is not None:
+            span = time.time() - since
+        span = max(span, MIN_RATE_WINDOW)
+        result = {}
+        for index, name in enumerate(self.region_names, 1):
+            count = int(counts[index])
+            result[name] = {
+                "keystrokes": count,
+                "per_minute": round(count / span * 60, 1),
+                "mean_ms": round(float(sums[index]) / count, 1) if count else 0.0,
+                "misses": int(misses[index]),
+                "lit": int(lit_counts[index]),
+            }
+        return result
+
+    def weak_keys(self, count=5, min_samples=3, since=None, session=None):
+        """
+        Keys to practise: scored by error rate plus how much slower than average they are typed.
+
+        :param count: number of keys returned
+        :param min_samples: keys typed fewer times than this are not scored
+        :return: [{"key": zone, "score", "error_rate", "mean_ms", "count"}], weakest first
+        """
+        keys = {zone: stats for zone, stats in self.keys(since, session).items() if stats["count"] >= min_samples}
+        if not keys:
+            return []
+        typed = sum(stats["count"] for stats in keys.values())
+        overall = sum(stats["mean_ms"] * stats["count"] for stats in keys.values()) / typed
+        scored = []
+        for zone, stats in keys.items():
+            slowness = max(0.0, stats["mean_ms"] / overall - 1) if overall else 0.0
+            score = stats["error_rate"] + slowness
+            if score > 0:
+                scored.append({"key": zone, "score": round(score, 4), "error_rate": stats["error_rate"],
+                               "mean_ms": stats["mean_ms"], "count": stats["count"]})
+        scored.sort(key=lambda entry: entry["score"], reverse=True)
+        return scored[:count]
@@ -0,0 +1,217 @@
+"""
+Keyboard layouts: which keys light which GG zone, and which zones form a region.
+
+A layout is a JSON file in layouts/ (or any path):
+
+    {
+      "name": "dvorak",
+      "description": "...",
+      "regions": {"region1": "qweasdzxc", "region2": ["r", "t", "semicolon"]},
+      "keymap": {"o": "s", ";": "z"}
+    }
+
+Region keys are GG zone names (physical keys, named after their US QWERTY
+legend); a string is shorthand for one zone per character. `keymap` maps
+what the user types to the zone it is on, on top of STANDARD_KEYMAP (the
+US legends: "1" -> "keyboard-1", " " -> "spacebar", "enter" -> "return",
+...); every zone in KEYBOARD_ZONES can also be named directly. Region
+names end up in event names, so they may only use letters, digits, "_"
+and "-".
+
+`Layout` compiles this into flat dicts, so looking up a key's zone or
+region is one dict lookup, and region zone tuples are shared rather than
+rebuilt. `color_handlers` keeps the bind_game_event handlers for each
+(zones, color) ready-built and serialized, so binding a region or key
+color does no per-call work beyond a cache lookup.
+
+    layout = load_layout("fingers")
+    layout.region_of("k")        # "right_middle"
+    layout.region_keys("k")      # ("keyboard-8", "i", "k", "comma")
+"""
+import collections
+import functools
+import json
+import os
+import re
+
+LAYOUTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "layouts")
+DEFAULT_LAYOUT = "qwerty"
+
+# every per-key zone of a full-size GG keyboard
+KEYBOARD_ZONES = (
+    "escape", "f1", "f2", "f3", "f4", "f5", "f6", "f7", "f8", "f9", "f10", "f11", "f12",
+    "backquote", "keyboard-1", "keyboard-2", "keyboard-3", "keyboard-4", "keyboard-5", "keyboard-6",
+    "keyboard-7", "keyboard-8", "keyboard-9", "keyboard-0", "dash", "equal", "backspace",
+    "tab", "q", "w", "e", "r", "t", "y", "u", "i", "o", "p", "l-bracket", "r-bracket", "backslash",
+    "caps", "a", "s", "d", "f", "g", "h", "j", "k", "l", "semicolon", "quote", "return",
+    "l-shift", "z", "x", "c", "v", "b", "n", "m", "comma", "period", "slash", "r-shift",
+    "l-ctrl", "l-win", "l-alt", "spacebar", "r-alt", "r-win", "win-menu", "r-ctrl",
+    "printscreen", "scrolllock", "pause", "insert", "home", "pageup", "delete", "end", "pagedown",
+    "uarrow", "larrow", "darrow", "rarrow",
+    "keypad-numlock", "keypad-divide", "keypad-times", "keypad-minus", "keypad-plus", "keypad-enter",
+    "keypad-period", "keypad-0", "keypad-1", "keypad-2", "keypad-3", "keypad-4", "keypad-5",
+    "keypad-6", "keypad-7", "keypad-8", "keypad-9",
+)
+
+# typed characters and browser key names (lower-cased KeyboardEvent.key) -> zone on a US keyboard
+STANDARD_KEYMAP = {
+    "`": "backquote", "1": "keyboard-1", "2": "keyboard-2", "3": "keyboard-3", "4": "keyboard-4",
+    "5": "keyboard-5", "6": "keyboard-6", "7": "keyboard-7", "8": "keyboard-8", "9": "keyboard-9",
+    "0": "keyboard-0", "-": "dash", "=": "equal", "[": "l-bracket", "]": "r-bracket", "\\": "backslash",
+    ";": "semicolon", "'": "quote", ",": "comma", ".": "period", "/": "slash",
+    " ": "spacebar", "\t": "tab", "\n": "return",
+    "enter": "return", "esc": "escape", "capslock": "caps", "shift": "l-shift", "control": "l-ctrl",
+    "alt": "l-alt", "meta": "l-win", "contextmenu": "win-menu", "arrowup": "uarrow", "arrowdown": "darrow",
+    "arrowleft": "larrow", "arrowright": "rarrow", "numlock": "keypad-numlock", "scrolllock": "scrolllock",
+}
+
+_REGION_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+_HEX_COLOR = re.compile(r"^[0-9a-f]{6}$")
+
+
+class Layout:
+    """
+    A compiled keyboard layout.
+
+    :param name: layout name
+    :param regions: region name -> zones (list of GG zone names, or a string of one-character zones)
+    :param keymap: typed key -> GG zone, for keys whose zone has a different name
+    :param description: free text shown to users
+    """
+
+    def __init__(self, name, regions, keymap=None, description=""):
+        self.name = name
+        self.description = description
+        self.keymap = dict(keymap or {})
+        self.regions = {}                 # region -> tuple of zones, in file order
+        zone_region = {}
+        for region, zones in regions.items():
+            if not _REGION_NAME.match(str(region)):
+                raise ValueError(f"Layout '{name}': invalid region name '{region}'")
+            zones = tuple(zones)
+            for zone in zones:
+                if zone in zone_region:
+                    raise ValueError(f"Layout '{name}': zone '{zone}' is in both '{zone_region[zone]}' and '{region}'")
+                zone_region[zone] = region
+            self.regions[region] = zones
+        # typed key -> zone and typed key -> region; later sources win:
+        # zone names, then the US legends, then this layout's own keymap
+        self._zone = {}
+        self._region = {}
+        for zone in KEYBOARD_ZONES + tuple(zone_region):
+            self._add_key(zone, zone, zone_region.get(zone))
+        for key, zone in list(STANDARD_KEYMAP.items()) + list(self.keymap.items()):
+            self._add_key(key, zone, zone_region.get(zone))
+        self.zones = frozenset(self._zone.values())
+
+    def _add_key(self, key, zone, region):
+        for variant in {key, key.lower(), key.upper()} if len(key) == 1 and key.isalpha() else {key}:
+            self._zone[variant] = zone
+            if region is None:
+                self._region.pop(variant, None)
+            else:
+                self._region[variant] = region
+
+    def zone(self, key):
+        """GG zone lit for typed `key` (a character or key name), or None if the keyboard has no such key."""
+        zone = self._zone.get(key)
+        return zone if zone is not None else self._zone.get(key.lower())
+
+    def region_of(self, key):
+        """Name of the region typed `key` belongs to, or None."""
+        region = self._region.get(key)
+        return region if region is not None else self._region.get(key.lower())
+
+    def region_keys(self, key):
+        """Zones of the region typed `key` belongs to (a shared tuple), or None."""
+        region = self.region_of(key)
+        return self.regions[region] if region is not None else None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "description": self.description,
+            "regions": {region: list(zones) for region, zones in self.regions.items()},
+            "keymap": dict(self.keymap),
+        }
+
+    @classmethod
+    def from_dict(cls, data, name=None):
+        """Build a layout from its JSON form; raises ValueError if it is malformed."""
+        if not isinstance(data, dict) or not isinstance(data.get("regions"), dict):
+            raise ValueError(f"Layout '{name or data}' has no regions")
+        keymap = data.get("keymap") or {}
+        if not isinstance(keymap, dict):
+            raise ValueError(f"Layout '{name}': keymap must be an object")
+        return cls(data.get("name") or name, data["regions"], keymap, data.get("description", ""))
+
+
+def layout_names():
+    """Names of the layouts shipped in layouts/."""
+    try:
+        return sorted(name[:-5] for name in os.listdir(LAYOUTS_DIR) if name.endswith(".json"))
+    except OSError:
+        return []
+
+
+@functools.lru_cache(maxsize=None)
+def load_layout(name_or_path=None):
+    """
+    Load and compile a layout by name (a file in layouts/) or path; loaded once per process.
+
+    :raises ValueError: if the layout does not exist or is malformed
+    """
+    name_or_path = name_or_path or DEFAULT_LAYOUT
+    if os.sep in name_or_path or name_or_path.endswith(".json"):
+        path = name_or_path
+    else:
+        path = os.path.join(LAYOUTS_DIR, f"{name_or_path}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"Unknown layout '{name_or_path}' (available: {', '.join(layout_names())})")
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Cannot read layout '{name_or_path}': {e}")
+    return Layout.from_dict(data, os.path.splitext(os.path.basename(path))[0])
+
+
+def normalize_color(hex_color):
+    """"#RRGGBB" -> "rrggbb"; raises ValueError for anything else."""
+    color = str(hex_color).lstrip("#").lower()
+    if not _HEX_COLOR.match(color):
+        raise ValueError(f"Invalid color '{hex_color}' (expected #RRGGBB)")
+    return color
+
+
+@functools.lru_cache(maxsize=4096)
+def rgb(hex_color):
+    """Interned (red, green, blue) for a "#RRGGBB" color."""
+    color = normalize_color(hex_color)
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def canonical_handlers(handlers):
+    """Cache key for a handlers list: handler and field order do not change what GG does."""
+    return json.dumps(sorted(json.dumps(h, sort_keys=True, separators=(",", ":")) for h in handlers))
+
+
+# handlers: the bind_game_event handlers (never mutate); key: canonical_handlers(handlers);
+# json: handlers serialized compactly, for splicing into a pre-serialized request body
+ColorHandlers = collections.namedtuple("ColorHandlers", "color handlers key json")
+
+
+@functools.lru_cache(maxsize=4096)
+def _compiled_handlers(zones, hex_color):
+    color = normalize_color(hex_color)
+    red, green, blue = rgb(color)
+    handlers = tuple(
+        {"device-type": "keyboard", "zone": zone, "mode": "color", "color": {"red": red, "green": green, "blue": blue}}
+        for zone in zones
+    )
+    return ColorHandlers(color, handlers, canonical_handlers(handlers), json.dumps(handlers, separators=(",", ":")))
+
+
+def color_handlers(zones, hex_color):
+    """Ready-built static color handlers for `zones` in `hex_color` (cached per zones and color)."""
+    return _compiled_handlers(zones if isinstance(zones, tuple) else tuple(zones), hex_color)
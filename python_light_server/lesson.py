@@ -0,0 +1,236 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from eventlog import KEYSTROKE
+from metrics import REGISTRY
+
+
+def build_transitions(targets):
+    """
+    Precompute the apply_batch ops for every cursor position of a lesson.
+
+    `targets[i]` is the "on" op that lights character i (None if it cannot
+    be lit). Entry i of the result moves the light from character i-1 to
+    character i; entry len(targets) turns the last light off. A character
+    lit by the same event as the previous one (a double letter, or the
+    same region) produces no ops, so the light stays on without a flicker.
+    """
+    transitions = []
+    previous = None
+    for target in targets + [None]:
+        transitions.append(transition_ops(previous, target))
+        previous = target
+    return transitions
+
+
+def transition_ops(previous, target):
+    """Ops that move the light from `previous` to `target` (either may be None)."""
+    if previous is not None and target is not None and previous["event"] == target["event"]:
+        return []
+    ops = []
+    if previous is not None:
+        ops.append({"event": previous["event"], "action": "off"})
+    if target is not None:
+        ops.append(target)
+    return ops
+
+
+class Lesson:
+    """
+    Server-side cursor over a lesson text whose lighting sequence is computed once.
+
+    The client uploads the text once; each keystroke then only moves the
+    cursor (`advance`) and the precomputed ops for that step are handed to
+    `apply`. Events of the next `prebind_ahead` characters are registered
+    and bound in the background (`lighting.prebind`), so a keystroke only
+    switches values and never waits for a bind. With an event `log`, each
+    single-character advance is recorded as a keystroke: the character, how
+    long it was lit before it was typed, and the wrong keys typed meanwhile.
+
+    :param lesson_id: id the client echoes back so stale advances are rejected
+    :param text: the lesson text
+    :param mode: "key" or "region"
+    :param targets: per-character "on" op (apply_batch format) or None
+    :param lighting: SteelSeriesLighting (or LightingClient) used for prebinding
+    :param apply: callable taking a list of apply_batch ops (the write-behind queue or apply_batch)
+    :param prebind_ahead: number of characters ahead of the cursor kept bound
+    :param log: EventLog keystrokes are recorded in (None = not recorded)
+    :param metrics: metrics registry (default: the shared REGISTRY)
+    """
+
+    def __init__(self, lesson_id, text, mode, targets, lighting, apply, prebind_ahead=8, log=None, metrics=None):
+        self.id = lesson_id
+        self.text = text
+        self.mode = mode
+        self.targets = targets
+        self.lighting = lighting
+        self.apply = apply
+        self.prebind_ahead = prebind_ahead
+        self.log = log
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.cursor = 0
+        self._lit_at = time.monotonic()  # when the character at the cursor was lit
+        self._transitions = build_transitions(targets)
+        self._lock = threading.Lock()
+        self._prebound = set()  # events already handed to the prebinder
+        self._prebind_until = 0
+        self._prebinder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lesson-prebind")
+
+    def start_ops(self, cursor=0):
+        """Ops that light the character at `cursor`; also starts prebinding from there."""
+        with self._lock:
+            self.cursor = max(0, min(cursor, len(self.text)))
+            self._lit_at = time.monotonic()
+            self._prebind_from(self.cursor)
+            return transition_ops(None, self._target(self.cursor))
+
+    def stop_ops(self):
+        """Ops that turn off whatever the lesson currently has lit."""
+        with self._lock:
+            return transition_ops(self._target(self.cursor), None)
+
+    def advance(self, count=1, cursor=None, misses=0, restart=False):
+        """
+        Move the cursor by `count` characters, or to `cursor` if given, and apply the lighting change.
+
+        An absolute `cursor` that is not past the current one is ignored
+        unless `restart` is set: advances sent over HTTP can arrive out of
+        order, and a late one must not move the light back.
+
+        :param misses: wrong keys typed before this advance (recorded with a single-character advance)
+        :param restart: allow `cursor` to move the light back (the client restarted the text)
+        :return: the new cursor position
+        """
+        now = time.monotonic()
+        with self._lock:
+            old = self.cursor
+            new = old + count if cursor is None else cursor
+            if not 0 <= new <= len(self.text):
+                raise ValueError(f"Cursor {new} is outside the lesson (0-{len(self.text)})")
+            if cursor is not None and new < old and not restart:
+                self.metrics.inc("lesson", "stale")
+                return old
+            if new == old:
+                return new
+            if new == old + 1:
+                ops = self._transitions[new]
+                if self.log is not None:
+                    self.log.record(KEYSTROKE, self.text[old], (now - self._lit_at) * 1000, self.id, misses)
+            else:
+                ops = transition_ops(self._target(old), self._target(new))
+            self.cursor = new
+            self._lit_at = now
+            self._prebind_from(new)
+        if ops:
+            self.apply(ops)
+        self.metrics.inc("lesson", "advance")
+        return new
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "mode": self.mode,
+                "length": len(self.text),
+                "cursor": self.cursor,
+                "done": self.cursor >= len(self.text),
+            }
+
+    def close(self):
+        self._prebinder.shutdown(wait=False)
+
+    def _target(self, index):
+        return self.targets[index] if index < len(self.targets) else None
+
+    def _prebind_from(self, index):
+        # called with the lock held: queue binds for events not yet seen in the window ahead
+        end = min(len(self.targets), index + 1 + self.prebind_ahead)
+        ops = []
+        for target in self.targets[max(index, self._prebind_until):end]:
+            if target is not None and target["event"] not in self._prebound:
+                self._prebound.add(target["event"])
+                ops.append(target)
+        self._prebind_until = max(self._prebind_until, end)
+        if ops:
+            self._prebinder.submit(self._prebind, ops)
+
+    def _prebind(self, ops):
+        try:
+            errors = self.lighting.prebind(ops)
+        except Exception as e:
+            errors = {op["event"]: str(e) for op in ops}
+        for event in errors:
+            # try again when the window next passes it
+            with self._lock:
+                self._prebound.discard(event)
+                self._prebind_until = min(self._prebind_until, self.cursor)
+        self.metrics.inc("lesson", "prebind", len(ops) - len(errors))
+
+
+class Lessons:
+    """
+    The one lesson being typed, with the ids that tell a stale client it was replaced.
+
+    Lives wherever the GG connection lives: in light_server.py for a
+    single process, in lighting_daemon.py when several workers share one
+    daemon, so every worker sees the same lesson and cursor. Results are
+    (body, status) pairs like light_server.py's handlers, so they cross
+    the daemon socket unchanged.
+
+    :param lighting: SteelSeriesLighting used for prebinding
+    :param apply: callable taking a list of apply_batch ops
+    :param log: EventLog keystrokes are recorded in (None = not recorded)
+    :param metrics: metrics registry (default: the shared REGISTRY)
+    """
+
+    def __init__(self, lighting, apply, log=None, metrics=None):
+        self.lighting = lighting
+        self.apply = apply
+        self.log = log
+        self.metrics = metrics
+        self.current = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, text, mode, targets, cursor=0):
+        """Replace the current lesson; the old light goes off in the same batch that lights the new one."""
+        with self._lock:
+            previous = self.current
+            lesson = self.current = Lesson(next(self._ids), text, mode, targets, self.lighting, self.apply,
+                                           log=self.log, metrics=self.metrics)
+            ops = (previous.stop_ops() if previous is not None else []) + lesson.start_ops(cursor)
+        if previous is not None:
+            previous.close()
+        if ops:
+            self.apply(ops)
+        return lesson.snapshot(), 200
+
+    def advance(self, lesson_id=None, count=1, cursor=None, misses=0, restart=False):
+        """Move the current lesson's cursor (see Lesson.advance); 409 if `lesson_id` is no longer current."""
+        lesson = self.current
+        if lesson is None:
+            return {"error": "No lesson uploaded"}, 404
+        if lesson_id is not None and lesson_id != lesson.id:
+            return {"error": f"Lesson {lesson_id} is no longer current", "lesson": lesson.id}, 409
+        cursor = lesson.advance(count=count, cursor=cursor, misses=misses, restart=restart)
+        return {"lesson": lesson.id, "cursor": cursor, "done": cursor >= len(lesson.text)}, 200
+
+    def end(self):
+        """Drop the current lesson and turn its light off."""
+        with self._lock:
+            lesson, self.current = self.current, None
+        if lesson is None:
+            return {"error": "No lesson uploaded"}, 404
+        lesson.close()
+        ops = lesson.stop_ops()
+        if ops:
+            self.apply(ops)
+        return lesson.snapshot(), 200
+
+    def get(self):
+        lesson = self.current
+        if lesson is None:
+            return {"error": "No lesson uploaded"}, 404
+        return lesson.snapshot(), 200
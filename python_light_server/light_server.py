@@ -1,73 +1,266 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
+from capture import TraceRecorder
+from command_queue import CommandQueue, QueueFull
+from eventlog import EventLog, KEY_OFF, KEY_ON, REGION_OFF, REGION_ON
+from layout import STANDARD_KEYMAP
+from lesson import Lessons
+from metrics import REGISTRY as metrics
+from selftest import SelfTestRunner
+from requests import ConnectionError as GGConnectionError
+from lighting_daemon import LightingClient
+from log import adopt, get_logger, records as log_records, set_level as set_log_level
 from ssgg import SteelSeriesLighting
+from ws_channel import LightingChannel
+import functools
+import json
 import threading
 import time
 import re
-import subprocess
 import os      
 import string
 
+logger = get_logger("light_server")
+# per-request access lines go through the same background writer and rate limits as everything else
+adopt("werkzeug")
+
 # Create Flask app instance
 app = Flask(__name__)
 # Enable CORS so frontend (React) can call backend
 CORS(app)
 
-lighting = SteelSeriesLighting(game="MYAPP")
-try:
-    lighting.remove_game() 
-except Exception:
-    pass
-lighting.register_game("Python Test", "Me", deinitialize_timer_length_ms=60000)  # 60秒先验证
-
-# Define keyboard regions for regional lighting
-KEYBOARD_REGIONS = {
-    "region1": list("qweasdzxc"),
-    "region2": list("rtyfghvbn"),
-    "region3": list("ujmikolp")
-}
+# Per-route latency histograms for /metrics (and trace capture, see LIGHT_CAPTURE below)
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if capture is not None:
+        g.request_at = time.time()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        label = f"{request.method} {route}"
+        metrics.observe("route", label, elapsed)
+        metrics.inc("route_status", f"{label} {response.status_code}")
+        if (capture is not None and request.method not in CAPTURE_SKIP_METHODS
+                and not request.path.startswith(CAPTURE_SKIP_PREFIXES)):
+            capture.record(request.headers.get("X-Session") or request.remote_addr, "http",
+                           request.get_json(silent=True), response.status_code, elapsed * 1000,
+                           method=request.method, path=request.path, at=g.pop("request_at", None))
+    return response
+
+# With LIGHT_DAEMON set to a lighting_daemon.py socket, GG state lives in that one process and
+# this server can run as several workers; otherwise it owns the GG connection itself
+LIGHT_DAEMON = os.getenv("LIGHT_DAEMON")
+if LIGHT_DAEMON:
+    lighting = LightingClient(LIGHT_DAEMON)
+else:
+    lighting = SteelSeriesLighting(game="MYAPP", layout=os.getenv("LIGHT_LAYOUT"))
+
+# Each worker process registers with the daemon once (after a fork too), so the daemon knows how many
+# workers share it; self-tests are refused while there is more than one (see /run_test)
+registered_pid = None
+
+@app.before_request
+def register_worker():
+    global registered_pid
+    if LIGHT_DAEMON and registered_pid != os.getpid():
+        try:
+            lighting.register_worker(os.getpid())
+            registered_pid = os.getpid()
+        except GGConnectionError as e:
+            logger.warning("Could not register with the lighting daemon: %s", e)
+
+# Keyboard regions come from the lighting object's layout (LIGHT_LAYOUT: a name in layouts/ or a JSON file),
+# so the server and the GG bindings can never disagree about which keys form a region
+layout = lighting.layout
+KEYBOARD_REGIONS = layout.regions
+REGION_EVENTS = {region_name: f"{region_name.upper()}_REGION_EVENT" for region_name in KEYBOARD_REGIONS}
 
 def get_region_for_key(key):
     """Returns the region name for a given key, or None if not found"""
-    for region_name, keys in KEYBOARD_REGIONS.items():
-        if key in keys:
-            return region_name
-    return None
-
-# Pre-bind all letter keys (A-Z) with unique event names to avoid flashing on first use
-# This ensures each letter key is ready to light instantly when requested
-for letter in string.ascii_lowercase:
-    event = f"{letter.upper()}KEY_EVENT"  # Unique event name for each letter
-    try:
-        lighting.register_event(event)  # Register the event with SteelSeries GG
-        lighting.bind_key_color(event, letter, "#ffffff")  # Bind the key to the event with a default color
-    except Exception as e:
-        print(f"Failed to pre-bind {letter}: {e}")
+    return layout.region_of(key)
 
-# Register region events (but don't bind colors yet - will be done during priming)
-for region_name in KEYBOARD_REGIONS.keys():
-    event = f"{region_name.upper()}_REGION_EVENT"
-    try:
-        lighting.register_event(event)
-    except Exception as e:
-        print(f"Failed to register region event {region_name}: {e}")
+# Every key lit or turned off and every lesson keystroke goes to an append-only log for typing analytics
+# (LIGHT_EVENT_LOG: file path, "off" disables it); recording only queues, a background thread writes
+EVENT_LOG_PATH = os.getenv(
+    "LIGHT_EVENT_LOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".keystrokes.log"),
+)
+event_log = None
+if EVENT_LOG_PATH.lower() not in ("", "0", "off", "false", "no"):
+    event_log = EventLog(EVENT_LOG_PATH, layout)
+
+# Capture mode (LIGHT_CAPTURE: trace file path): every lighting request that changes state is appended
+# to a trace with its arrival time, for replay.py; reads, CORS preflights and self-tests are left out
+LIGHT_CAPTURE = os.getenv("LIGHT_CAPTURE", "")
+capture = None
+if LIGHT_CAPTURE.lower() not in ("", "0", "off", "false", "no"):
+    capture = TraceRecorder(LIGHT_CAPTURE, layout.name)
+CAPTURE_SKIP_METHODS = ("GET", "HEAD", "OPTIONS")
+CAPTURE_SKIP_PREFIXES = ("/run_test", "/debug")
+
+def logged(kind):
+    """Records each successful call of a key handler in the event log, with the handler's latency"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        def logged_handler(data):
+            start = time.perf_counter()
+            result = handler(data)
+            if event_log is not None and result[1] < 400:
+                event_log.record(kind, data.get("key"), (time.perf_counter() - start) * 1000)
+            return result
+        return logged_handler
+    return decorate
+
+def key_event_name(key):
+    """Returns the event name used for a single key (letters, space and special keys)"""
+    if key == " ":
+        key_name = "space"
+    elif len(key) == 1 and key.isalpha():
+        key_name = key.lower()
+    elif len(key) == 1 and key in STANDARD_KEYMAP:
+        # punctuation is not allowed in GG event names; use the key's name (";" -> SEMICOLONKEY_EVENT)
+        key_name = STANDARD_KEYMAP[key]
+    else:
+        key_name = key.lower().replace(" ", "_")
+    return re.sub(r"[^A-Z0-9_-]", "_", f"{key_name.upper()}KEY_EVENT")
 
-# Add a startup initializer to ensure all lights are off when the server starts
+def respond(result):
+    """Turns a handler's (body, status) tuple into a Flask response"""
+    body, status = result
+    return jsonify(body), status
+
+# Add a startup initializer to ensure all lights are off when the server starts. With LIGHT_DAEMON
+# the lights are shared by every worker, so the daemon clears them only for the first one to start
 def initialize_lighting():
     try:
-        lighting.lights_off()
-        print("Initialized lighting: all keys turned off.")
+        if LIGHT_DAEMON:
+            if not lighting.startup_clear():
+                logger.info("Lighting daemon already initialized by another worker; leaving lights as they are.")
+                return
+        else:
+            lighting.lights_off()
+        logger.info("Initialized lighting: all keys turned off.")
     except Exception as e:
-        print(f"Failed to initialize lighting during startup: {e}")
+        logger.error("Failed to initialize lighting during startup: %s", e)
 
-# Track current colors to avoid unnecessary rebinding
-key_colors = {}
+# Manifest of what is already registered/bound in GG for this game, so warm restarts skip rebinding
+MANIFEST_PATH = os.getenv(
+    "LIGHT_MANIFEST",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), f".{lighting.game.lower()}_manifest.json"),
+)
 
-# Endpoint to light a single letter key
-@app.route("/lights_on_key", methods=["POST"])
-def lights_on_key():
-    data = request.get_json()
-    key = data.get("key")  # The letter to light
+# Startup priming runs in the background so the server accepts requests immediately;
+# /ready reports when it has finished
+priming_status = {"state": "pending"}
+priming_done = threading.Event()
+
+def priming_plan():
+    """Events to have registered at startup: (event, zones, color); zones None means register only"""
+    # Pre-bind all letter keys (A-Z) with unique event names to avoid flashing on first use
+    plan = [(lighting.ALL_OFF_EVENT, ["all"], "#000000")]
+    plan += [(f"{letter.upper()}KEY_EVENT", [layout.zone(letter)], "#ffffff") for letter in string.ascii_lowercase]
+    # Register region events (but don't bind colors yet - /bind_regions_color does that)
+    plan += [(event, None, None) for event in REGION_EVENTS.values()]
+    return plan
+
+def prime_lighting():
+    start = time.perf_counter()
+    priming_status.update(state="priming", started=time.time())
+    # GG may be down at startup or drop out while priming; wait for it (without blocking requests) and retry
+    while True:
+        try:
+            if not lighting.wait_until_connected(timeout=0):
+                priming_status["state"] = "waiting_for_gg"
+                lighting.wait_until_connected()
+                priming_status["state"] = "priming"
+            prime_once()
+            break
+        except GGConnectionError as e:
+            logger.warning("Lost SteelSeries GG while priming, retrying when it is back: %s", e)
+            time.sleep(0.2)
+        except Exception as e:
+            logger.error("Failed to prime lighting: %s", e)
+            priming_status.update(state="failed", error=str(e))
+            break
+    priming_status["duration_ms"] = (time.perf_counter() - start) * 1000
+    logger.info("Lighting priming %s in %.0f ms", priming_status["state"], priming_status["duration_ms"])
+    priming_done.set()
+    if priming_status["state"] == "ready":
+        # Everything else is bound on first use; the warmer binds the likeliest keys while the server is idle
+        lighting.warm(warm_plan())
+
+# Keys other than letters, most likely first (names as the browser's KeyboardEvent.key sends them)
+WARM_KEYS = ([" ", ".", ",", "'", "Enter", "Backspace", "-", ";", "/", "Shift"] + list("1234567890")
+             + ["Tab", "=", "[", "]", "\\", "`", "Escape", "CapsLock", "Control", "Alt", "Meta",
+                "ArrowLeft", "ArrowRight", "ArrowUp", "ArrowDown", "Delete", "Home", "End", "PageUp",
+                "PageDown", "Insert"] + [f"F{i}" for i in range(1, 13)])
+
+def warm_plan():
+    """apply_batch "on" ops pre-binding WARM_KEYS that the layout has a zone for"""
+    return [{"event": key_event_name(key), "action": "on", "zones": [layout.zone(key)], "color": "#ffffff"}
+            for key in WARM_KEYS if layout.zone(key)]
+
+def prime_once():
+    # Cold start (no matching manifest) clears anything GG still has for this game first
+    result = lighting.prime_startup(priming_plan(), MANIFEST_PATH, "Python Test", "Me",
+                                    deinitialize_timer_length_ms=60000)  # 60秒先验证
+    for event, error in result["failed"].items():
+        logger.warning("Failed to prime %s: %s", event, error)
+    initialize_lighting()
+    priming_status.update(state="ready", **result)
+
+def wait_until_ready(timeout=None):
+    """Blocks until startup priming has finished; returns True if it succeeded"""
+    priming_done.wait(timeout)
+    return priming_status["state"] == "ready"
+
+# Opt-in whole-keyboard frame buffer: lighting requests only update the buffer,
+# which is flushed to GG at a fixed frame rate (LIGHT_COMPOSITOR_FPS, default 30)
+if os.getenv("LIGHT_COMPOSITOR", "").lower() in ("1", "true", "yes"):
+    lighting.enable_compositor(fps=float(os.getenv("LIGHT_COMPOSITOR_FPS", "30")))
+
+# Keepalive: with "heartbeat" (default) lit events are sent only when they change and one
+# game_heartbeat per deinitialize period keeps them alive; LIGHT_KEEPALIVE=refresh re-sends
+# every lit event each second instead
+if os.getenv("LIGHT_KEEPALIVE", "heartbeat").lower() == "heartbeat":
+    lighting.enable_heartbeat()
+
+# Write-behind command queue: lighting endpoints record the desired state per event and
+# return without waiting for GG; LIGHT_WRITE_BEHIND=0 applies requests synchronously instead
+command_queue = None
+if os.getenv("LIGHT_WRITE_BEHIND", "1").lower() not in ("0", "false", "no"):
+    command_queue = CommandQueue(lighting)
+
+def queue_op(op, status):
+    """Queues one /lights_batch-style op; returns a handler result without waiting for GG"""
+    try:
+        queued = command_queue.submit(batch_op_to_lighting(op))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except QueueFull as e:
+        return {"error": str(e)}, 503
+    return {"status": status, "queued": queued}, 202
+
+threading.Thread(target=prime_lighting, name="lighting-priming", daemon=True).start()
+
+# Endpoint reporting whether startup priming has finished and GG is reachable (503 otherwise)
+@app.route("/ready", methods=["GET"])
+def ready():
+    status = dict(priming_status)
+    # Ready means primed and GG currently reachable (circuit closed); 503 while degraded
+    status["gg"] = lighting.breaker.snapshot()
+    ok = status["state"] == "ready" and status["gg"]["state"] == "closed"
+    return jsonify(status), 200 if ok else 503
+
+# Endpoint to light a single key (letters, digits, punctuation, space and named keys such as "Enter")
+@logged(KEY_ON)
+def handle_lights_on_key(data):
+    key = data.get("key")  # The key to light
     color = data.get("color", "#ffffff")  # Color to use (default white)
     # If duration is omitted, treat as "no timeout" (leave lit until explicitly turned off)
     duration = data.get("duration")  # None if not provided
@@ -77,35 +270,31 @@ def lights_on_key():
         except Exception:
             duration = None
 
-    # Only allow single letter keys (A-Z)
-    if key and len(key) == 1 and key.isalpha():
-        event = f"{key.upper()}KEY_EVENT"  # Use the unique event for this letter
+    # Any key the layout has a zone for; keys other than letters are registered and bound on first use
+    zone = layout.zone(key) if isinstance(key, str) and key else None
+    if zone:
+        event = key_event_name(key)  # Use the unique event for this key
+        if command_queue is not None:
+            return queue_op({"op": "on", "key": key, "color": color, "duration": duration},
+                            f"Key '{key}' lit using lights_on_key()")
         try:
-            # Only rebind if color has changed
-            key_upper = key.upper()
-            if key_upper not in key_colors or key_colors[key_upper] != color:
-                lighting.bind_key_color(event, key, color)
-                key_colors[key_upper] = color
-            
-            # Stop any existing refresher
-            lighting._stop_event_refresher(event)
-            # Start new refresher
-            if duration is None:
-                lighting._start_event_refresher(event, interval=1, duration=None)
-            else:
-                lighting._start_event_refresher(event, interval=1, duration=duration)
-            return jsonify({"status": f"Key '{key}' lit using lights_on_key()"})
+            # Binds only if the key's color changed, then starts (or replaces) its refresher
+            lighting.lights_on_key(event, zone, color, interval=1, duration=duration)
+            return {"status": f"Key '{key}' lit using lights_on_key()"}, 200
         except Exception as e:
-            return jsonify({"error": str(e)}), 500
+            return {"error": str(e)}, 500
     else:
-        return jsonify({"error": "No valid letter key provided"}), 400
+        return {"error": "No valid key provided"}, 400
+
+@app.route("/lights_on_key", methods=["POST"])
+def lights_on_key():
+    return respond(handle_lights_on_key(request.get_json(silent=True) or {}))
 
 # Endpoint to light a specific key region
-@app.route("/lights_on_region", methods=["POST"])
-def lights_on_region():
-    data = request.json
+@logged(REGION_ON)
+def handle_lights_on_region(data):
     key = data.get("key")
-    color = data.get("color", "#FFFFFF")
+    color = data.get("color")  # None: the color /bind_regions_color gave the region
     # If duration omitted, treat as no timeout
     duration = data.get("duration")
     if duration is not None:
@@ -115,7 +304,7 @@ def lights_on_region():
             duration = None
 
     if not key:
-        return jsonify({"error": "Missing key"}), 400
+        return {"error": "Missing key"}, 400
 
     # Normalize key
     key_lower = key.lower() if key != " " else key
@@ -123,193 +312,536 @@ def lights_on_region():
     # Find which region this key belongs to
     region_name = get_region_for_key(key_lower)
     if not region_name:
-        return jsonify({"error": f"Key '{key}' not in any region"}), 400
-    
-    # Use single event per region (not per key)
-    event = f"{region_name.upper()}_REGION_EVENT"
-    region_keys = KEYBOARD_REGIONS[region_name]
-    
+        return {"error": f"Key '{key}' not in any region"}, 400
+
+    # With a "color" the region is lit (and bound) in that color; without one it lights in the color
+    # /bind_regions_color gave it. Both paths apply the same batch op, so LIGHT_WRITE_BEHIND only
+    # changes when it happens, not what happens
+    op = {"op": "region_on", "key": key, "duration": duration}
+    if color is not None:
+        op["color"] = color
+    status = f"Region {region_name} for key {key} lights on with {color or 'its bound color'}"
+    if command_queue is not None:
+        return queue_op(op, status)
+
     try:
-        # Stop any existing refresher for this event
-        lighting._stop_event_refresher(event)
-        
-        # Start the refresher
-        if duration is None:
-            lighting._start_event_refresher(event, interval=1, duration=None)
-        else:
-            lighting._start_event_refresher(event, interval=1, duration=duration)
-            
-        return jsonify({"status": f"Region {region_name} for key {key} lights on with {color}"})
+        result = lighting.apply_batch([batch_op_to_lighting(op)])[0]
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
+    if result["status"] == "error":
+        return {"error": result["error"]}, 500
+    return {"status": status}, 200
+
+@app.route("/lights_on_region", methods=["POST"])
+def lights_on_region():
+    return respond(handle_lights_on_region(request.get_json(silent=True) or {}))
 
 # Endpoint to turn off a specific key
-@app.route("/lights_off_key", methods=["POST"])
-def lights_off_key():
-    data = request.get_json()
+@logged(KEY_OFF)
+def handle_lights_off_key(data):
     key = data.get("key")  # The letter/key to turn off
     
     if not key:
-        return jsonify({"error": "No key provided"}), 400
-    
+        return {"error": "No key provided"}, 400
+
+    if command_queue is not None:
+        return queue_op({"op": "off", "key": key}, f"Key '{'space' if key == ' ' else key}' turned off")
+
     try:
-        # Determine the key name for the event
-        if key == " ":
-            key_name = "space"
-            key_display = "space"
-        elif len(key) == 1 and key.isalpha():
-            key_name = key.lower()
-            key_display = key
-        else:
-            # Handle special keys like function keys
-            key_name = key.lower().replace(" ", "_")
-            key_display = key
+        key_display = "space" if key == " " else key
+        event = key_event_name(key)
         
-        event = f"{key_name.upper()}KEY_EVENT"
-        
-        # Stop the refresher thread for this specific key's event
-        lighting._stop_event_refresher(event)
-        
-        # Light the key with black color (off) for just a moment
+        # Stop the refresher for this specific key's event and set it to 0
         try:
-            # Use the event to set the key to black with no duration
-            payload = {
-                "game": lighting.game,
-                "event": event,
-                "data": {"value": 0}
-            }
-            lighting._post("game_event", payload)
-        except:
+            lighting.lights_off_event(event)
+        except Exception:
             pass  # If posting fails, the refresher stop should still work
         
-        return jsonify({"status": f"Key '{key_display}' turned off"})
+        return {"status": f"Key '{key_display}' turned off"}, 200
     except Exception as e:
-        print(f"Error turning off key '{key}': {e}")
-        return jsonify({"error": str(e)}), 500
+        logger.warning("Error turning off key '%s': %s", key, e)
+        return {"error": str(e)}, 500
+
+@app.route("/lights_off_key", methods=["POST"])
+def lights_off_key():
+    return respond(handle_lights_off_key(request.get_json(silent=True) or {}))
 
 # Endpoint to turn off a specific key region based on the key
-@app.route("/lights_off_region_for_key", methods=["POST"])
-def lights_off_region_for_key():
+@logged(REGION_OFF)
+def handle_lights_off_region_for_key(data):
     """Turn off a region based on the key provided"""
-    data = request.get_json()
     key = data.get("key")  # The letter/key to determine region
     
     if not key:
-        return jsonify({"error": "No key provided"}), 400
+        return {"error": "No key provided"}, 400
     
     try:
         key_lower = key.lower() if key != " " else key  # Normalize to lowercase
         region_name = get_region_for_key(key_lower)
         if not region_name:
-            return jsonify({"error": f"Key '{key_lower}' not in any region"}), 400
-        
+            return {"error": f"Key '{key_lower}' not in any region"}, 400
+
+        if command_queue is not None:
+            return queue_op({"op": "region_off", "key": key}, f"Region {region_name} turned off for key '{key_lower}'")
+
         # Use single event per region (not per key)
-        event = f"{region_name.upper()}_REGION_EVENT"
+        event = REGION_EVENTS[region_name]
         
-        # Stop the refresher thread for this event
-        lighting._stop_event_refresher(event)
+        # Stop the refresher for this event and turn the region off
+        lighting.lights_off_event(event)
         
-        # Turn off the region by posting value 0
-        payload = {
-            "game": lighting.game,
-            "event": event,
-            "data": {"value": 0}
-        }
-        lighting._post("game_event", payload)
-        
-        return jsonify({"status": f"Region {region_name} turned off for key '{key_lower}'"})
+        return {"status": f"Region {region_name} turned off for key '{key_lower}'"}, 200
     except Exception as e:
-        print(f"Error turning off region for key '{key}': {e}")
-        return jsonify({"error": str(e)}), 500
+        logger.warning("Error turning off region for key '%s': %s", key, e)
+        return {"error": str(e)}, 500
 
-# Endpoint to bind all regions with a specific color
+@app.route("/lights_off_region_for_key", methods=["POST"])
+def lights_off_region_for_key():
+    return respond(handle_lights_off_region_for_key(request.get_json(silent=True) or {}))
+
+# Endpoint to bind all regions with a specific color (regions already bound to it are skipped)
 @app.route("/bind_regions_color", methods=["POST"])
 def bind_regions_color():
     data = request.json
     color = data.get("color", "#FFFFFF")
     
     try:
-        hex_color = color.lstrip("#")
-        r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-        
         for region_name, region_keys in KEYBOARD_REGIONS.items():
-            event = f"{region_name.upper()}_REGION_EVENT"
-            handlers = []
-            for k in region_keys:
-                handlers.append({
-                    "device-type": "keyboard",
-                    "zone": k,
-                    "mode": "color",
-                    "color": {"red": r, "green": g, "blue": b}
-                })
-            payload = {
-                "game": lighting.game,
-                "event": event,
-                "handlers": handlers
-            }
-            lighting._post("bind_game_event", payload)
+            event = REGION_EVENTS[region_name]
+            if lighting.palette_value(color) is not None:
+                # the color is recorded, so a colorless "on" later sends its palette value (not 1)
+                lighting.ensure_palette_bound(event, region_keys, color)
+            else:
+                lighting.bind_zones_color(event, region_keys, color)
         
         return jsonify({"status": f"All regions bound with color {color}"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Endpoint to get or set the color palette; palette colors switch by event value instead of a rebind
+@app.route("/palette", methods=["GET", "POST"])
+def palette():
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        colors = data.get("colors")
+        if not isinstance(colors, list):
+            return jsonify({"error": "No colors provided"}), 400
+        try:
+            lighting.set_palette(colors)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify({"colors": [f"#{color}" for color in lighting.palette]})
+
+def batch_op_to_lighting(op):
+    """Translate one /lights_batch operation into a SteelSeriesLighting.apply_batch operation"""
+    kind = op.get("op")
+    key = op.get("key")
+    if not key:
+        raise ValueError("No key provided")
+    duration = op.get("duration")
+    if duration is not None:
+        try:
+            duration = float(duration)
+        except Exception:
+            duration = None
+
+    if kind == "on":
+        zone = layout.zone(key)
+        if not zone:
+            raise ValueError(f"Key '{key}' is not on the keyboard")
+        return {"event": key_event_name(key), "action": "on", "zones": [zone],
+                "color": op.get("color", "#ffffff"), "duration": duration,
+                "intensity": op.get("intensity", 1.0)}
+    if kind == "off":
+        return {"event": key_event_name(key), "action": "off"}
+    if kind in ("region_on", "region_off"):
+        key_lower = key.lower() if key != " " else key
+        region_name = get_region_for_key(key_lower)
+        if not region_name:
+            raise ValueError(f"Key '{key}' not in any region")
+        event = REGION_EVENTS[region_name]
+        if kind == "region_off":
+            return {"event": event, "action": "off"}
+        color = op.get("color")
+        if color is None and lighting.compositor is None:
+            # like light_event: light the region in the color /bind_regions_color gave it, without rebinding
+            # (for a palette binding apply_batch sends that color's palette value)
+            return {"event": event, "action": "on", "duration": duration}
+        return {"event": event, "action": "on", "zones": KEYBOARD_REGIONS[region_name],
+                "color": color or "#FFFFFF", "duration": duration,
+                "intensity": op.get("intensity", 1.0)}
+    raise ValueError(f"Unknown op '{kind}'")
+
+# Endpoint to apply many on/off/region operations in one request (one preflight, minimal GG calls)
+def handle_lights_batch(data):
+    """
+    Body: {"ops": [{"op": "on"|"off"|"region_on"|"region_off", "key": "a", "color": "#ffffff", "duration": 3}, ...]}
+    "intensity" (0-1) may be given for colors in the palette (see /palette).
+    Operations are applied in order; later operations on the same key/region replace earlier ones.
+    With the write-behind queue enabled the ops are queued (202) and each result is "queued" or "coalesced".
+    Invalid operations (e.g. a key outside every region) are reported in their result and skipped;
+    the valid ones are still applied together.
+    """
+    ops = data.get("ops")
+    if not isinstance(ops, list) or not ops:
+        return {"error": "No operations provided"}, 400
+    start = time.perf_counter()
+
+    if command_queue is not None:
+        results = []
+        for op in ops:
+            try:
+                results.append({"status": command_queue.submit(batch_op_to_lighting(op))})
+            except (ValueError, AttributeError) as e:
+                results.append({"status": "error", "error": str(e)})
+            except QueueFull as e:
+                return {"error": str(e)}, 503
+            results[-1]["op"] = op.get("op") if isinstance(op, dict) else None
+            results[-1]["key"] = op.get("key") if isinstance(op, dict) else None
+        failed = sum(1 for result in results if result["status"] == "error")
+        log_batch(ops, results, start)
+        return {"status": f"{len(ops) - failed}/{len(ops)} operations queued", "results": results}, 202
+
+    results = [None] * len(ops)
+    valid = []  # (index, op, lighting_op)
+    for index, op in enumerate(ops):
+        try:
+            valid.append((index, op, batch_op_to_lighting(op)))
+        except (ValueError, AttributeError) as e:
+            results[index] = {"status": "error", "error": str(e)}
+
+    try:
+        applied = lighting.apply_batch([lighting_op for _, _, lighting_op in valid]) if valid else []
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+    for (index, op, lighting_op), result in zip(valid, applied):
+        results[index] = result
+    for op, result in zip(ops, results):
+        result["op"] = op.get("op") if isinstance(op, dict) else None
+        result["key"] = op.get("key") if isinstance(op, dict) else None
+
+    failed = sum(1 for result in results if result["status"] == "error")
+    log_batch(ops, results, start)
+    return {"status": f"{len(ops) - failed}/{len(ops)} operations applied", "results": results}, 200
+
+BATCH_LOG_KINDS = {"on": KEY_ON, "off": KEY_OFF, "region_on": REGION_ON, "region_off": REGION_OFF}
+
+def log_batch(ops, results, start):
+    """Records the applied ops of a batch in the event log (each with the whole batch's latency)"""
+    if event_log is None:
+        return
+    ms = (time.perf_counter() - start) * 1000
+    for op, result in zip(ops, results):
+        if result["status"] != "error":
+            event_log.record(BATCH_LOG_KINDS[op["op"]], op.get("key"), ms)
+
+@app.route("/lights_batch", methods=["POST"])
+def lights_batch():
+    return respond(handle_lights_batch(request.get_json(silent=True) or {}))
+
 # Endpoint to turn off all keyboard lights
 @app.route("/lights_off", methods=["POST"])
 def lights_off():
     try:
-        # Stop all refreshers and turn off individual keys
-        for letter in string.ascii_lowercase:
-            event = f"{letter.upper()}KEY_EVENT"
-            try:
-                lighting._stop_event_refresher(event)
-                # Turn off the event
-                payload = {
-                    "game": lighting.game,
-                    "event": event,
-                    "data": {"value": 0}
-                }
-                lighting._post("game_event", payload)
-            except Exception:
-                pass
-        
-        # Stop all region refreshers and turn them off
-        for region_name in KEYBOARD_REGIONS.keys():
-            event = f"{region_name.upper()}_REGION_EVENT"
-            try:
-                lighting._stop_event_refresher(event)
-                # Turn off the event
-                payload = {
-                    "game": lighting.game,
-                    "event": event,
-                    "data": {"value": 0}
-                }
-                lighting._post("game_event", payload)
-            except Exception:
-                pass
-        
-        # Also call the main lights_off for good measure
+        if command_queue is not None:
+            # Runs after everything queued before it, so an earlier "on" cannot relight a key
+            command_queue.run_after(lighting.lights_off)
+            return jsonify({"status": "All keys lights off", "queued": "queued"}), 202
+        # One bulk call: cancels every refresher and resets all lit events in a single GG request
         lighting.lights_off()
         return jsonify({"status": "All keys lights off"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-# Endpoint to run the test.py script (for testing lighting logic)
-@app.route("/run_test", methods=["POST"])
-def run_test():
+# The lesson being typed: uploaded once, then each keystroke only advances its cursor
+LESSON_MODES = {"key": "key", "individual": "key", "region": "region", "regional": "region"}
+
+def apply_ops(ops):
+    """Applies apply_batch ops (a lesson step, the weak keys) through the write-behind queue when enabled"""
+    if command_queue is not None:
+        for op in ops:
+            command_queue.submit(op)
+    else:
+        lighting.apply_batch(ops)
+
+# With a daemon the lesson and its cursor live there, so every worker advances the same lesson
+lessons = lighting.lessons if LIGHT_DAEMON else Lessons(lighting, apply_ops, log=event_log)
+
+# Endpoint to upload a lesson: lights the first character and precomputes the rest of the sequence
+def handle_lesson_start(data):
+    """
+    Body: {"text": "...", "mode": "key"|"region", "color": "#ffffff", "intensity": 1.0, "cursor": 0,
+           "weak_color": "#ff8800"}
+    Characters that cannot be lit (no key on the layout, or outside every region in region mode) are skipped over.
+    With "weak_color" (key mode), the keys the event log rates weakest are lit in that color instead.
+    Replaces any previous lesson; its light is turned off in the same batch that lights the new one.
+    """
+    text = data.get("text")
+    if not isinstance(text, str) or not text:
+        return {"error": "No lesson text provided"}, 400
+    mode = LESSON_MODES.get(data.get("mode", "key"))
+    if mode is None:
+        return {"error": f"Unknown lesson mode '{data.get('mode')}'"}, 400
+    try:
+        cursor = int(data.get("cursor", 0))
+    except (TypeError, ValueError):
+        return {"error": "Invalid cursor"}, 400
+
+    kind = "on" if mode == "key" else "region_on"
+    color = data.get("color", "#ffffff")
+    weak_color = data.get("weak_color")
+    weak = set()
+    if weak_color and mode == "key" and event_log is not None:
+        weak = {entry["key"] for entry in event_log.weak_keys()}
+    targets = []
+    for char in text:
+        try:
+            char_color = weak_color if weak and layout.zone(char) in weak else color
+            targets.append(batch_op_to_lighting({"op": kind, "key": char, "color": char_color,
+                                                 "intensity": data.get("intensity", 1.0)}))
+        except ValueError:
+            targets.append(None)
+
+    try:
+        result = lessons.start(text, mode, targets, cursor)
+        # The rest of the lesson is bound in the background ahead of the generic keys
+        lighting.warm([target for target in targets if target is not None], priority=-len(targets))
+    except QueueFull as e:
+        return {"error": str(e)}, 503
+    except Exception as e:
+        return {"error": str(e)}, 500
+    return result
+
+# Endpoint to move the lesson cursor (one keystroke = one tiny message)
+def handle_lesson_advance(data):
+    """
+    Body: {"lesson": <id>, "count": 1} or {"lesson": <id>, "cursor": <index>}
+    "lesson" is optional; when given it must match the current lesson (409 otherwise).
+    An absolute "cursor" that is not past the current one is ignored (a late, out-of-order advance)
+    unless "restart" is true. "misses" is the number of wrong keys typed since the last advance.
+    """
     try:
-        test_path = os.path.join(os.path.dirname(__file__), "test.py")  # Absolute path to test.py
-        result = subprocess.run([
-            "python3", test_path
-        ], capture_output=True, text=True, timeout=30)
-        return jsonify({
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "returncode": result.returncode
-        })
+        return lessons.advance(data.get("lesson"), count=int(data.get("count", 1)),
+                               cursor=int(data["cursor"]) if data.get("cursor") is not None else None,
+                               misses=int(data.get("misses") or 0), restart=bool(data.get("restart")))
+    except (TypeError, ValueError) as e:
+        return {"error": str(e)}, 400
+    except QueueFull as e:
+        return {"error": str(e)}, 503
+    except Exception as e:
+        return {"error": str(e)}, 500
+
+@app.route("/lesson", methods=["GET", "POST", "DELETE"])
+def lesson_endpoint():
+    if request.method == "POST":
+        return respond(handle_lesson_start(request.get_json(silent=True) or {}))
+    if request.method == "DELETE":
+        try:
+            return respond(lessons.end())
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+    return respond(lessons.get())
+
+@app.route("/lesson/advance", methods=["POST"])
+def lesson_advance():
+    return respond(handle_lesson_advance(request.get_json(silent=True) or {}))
+
+# Typing analytics over the event log: per-key dwell and error rates, per-region throughput, weak keys.
+# Query parameters: "since" (epoch seconds), "window" (seconds back from now), "session" (lesson id)
+WEAK_KEYS_EVENT = "WEAK_KEYS_EVENT"
+
+def analytics_filters():
+    """Parses since/window/session query parameters; raises ValueError for invalid ones"""
+    since, window, session = (request.args.get(name) for name in ("since", "window", "session"))
+    since = float(since) if since is not None else None
+    if window is not None:
+        since = max(since or 0.0, time.time() - float(window))
+    return {"since": since, "session": int(session) if session is not None else None}
+
+def analytics(query):
+    """Runs an event log query with the request's filters; returns a Flask response"""
+    if event_log is None:
+        return jsonify({"error": "Event log is disabled (LIGHT_EVENT_LOG=off)"}), 404
+    try:
+        filters = analytics_filters()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter: {e}"}), 400
+    return jsonify(query(**filters))
+
+@app.route("/analytics/keys", methods=["GET"])
+def analytics_keys():
+    return analytics(lambda **filters: {"keys": event_log.keys(**filters)})
+
+@app.route("/analytics/regions", methods=["GET"])
+def analytics_regions():
+    return analytics(lambda **filters: {"regions": event_log.regions(**filters)})
+
+# GET lists the weakest keys; POST lights them all in one color (adaptive practice mode); DELETE turns them off
+@app.route("/analytics/weak_keys", methods=["GET", "POST", "DELETE"])
+def analytics_weak_keys():
+    if request.method == "DELETE":
+        try:
+            apply_ops([{"event": WEAK_KEYS_EVENT, "action": "off"}])
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        return jsonify({"status": "Weak keys turned off"})
+    data = (request.get_json(silent=True) or {}) if request.method == "POST" else {}
+    try:
+        count = int(data.get("count", request.args.get("count", 5)))
+        min_samples = int(data.get("min_samples", request.args.get("min_samples", 3)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid count or min_samples"}), 400
+    if request.method == "GET":
+        return analytics(lambda **filters: {"keys": event_log.weak_keys(count, min_samples, **filters)})
+
+    if event_log is None:
+        return jsonify({"error": "Event log is disabled (LIGHT_EVENT_LOG=off)"}), 404
+    weak = event_log.weak_keys(count, min_samples)
+    duration = data.get("duration")
+    try:
+        if weak:
+            apply_ops([{"event": WEAK_KEYS_EVENT, "action": "on", "zones": [entry["key"] for entry in weak],
+                        "color": data.get("color", "#ff8800"),
+                        "duration": float(duration) if duration is not None else None}])
+        else:
+            apply_ops([{"event": WEAK_KEYS_EVENT, "action": "off"}])
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    return jsonify({"status": f"{len(weak)} weak key(s) lit", "keys": weak})
 
-# Run the Flask app on port 5050
+# Endpoint exposing latency histograms, GG call counts and refresher state
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    snapshot = metrics.snapshot()
+    if LIGHT_DAEMON:
+        # GG call latencies, binding cache and refreshers are recorded in the daemon
+        try:
+            snapshot["daemon"] = lighting.metrics_snapshot()
+        except GGConnectionError as e:
+            snapshot["daemon"] = {"error": str(e)}
+    return jsonify(snapshot)
+
+# Recent log records from the in-memory ring buffer (GET; query: level, logger, since=<id>, limit);
+# POST {"level": "DEBUG"} changes the log level at runtime
+@app.route("/debug/log", methods=["GET", "POST"])
+def debug_log():
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        try:
+            level = set_log_level(data.get("level", ""))
+            if LIGHT_DAEMON:
+                lighting.set_log_level(level)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except GGConnectionError as e:
+            return jsonify({"level": level, "daemon": {"error": str(e)}})
+        return jsonify({"level": level})
+    try:
+        query = {
+            "level": request.args.get("level"),
+            "logger": request.args.get("logger"),
+            "since": int(request.args["since"]) if "since" in request.args else None,
+            "limit": int(request.args.get("limit", 200)),
+        }
+        body = {"records": log_records(**query)}
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+    if LIGHT_DAEMON:
+        # GG calls, refreshers and the warmer log in the daemon
+        try:
+            body["daemon"] = lighting.log_records(**query)
+        except GGConnectionError as e:
+            body["daemon"] = {"error": str(e)}
+    return jsonify(body)
+
+# Endpoints for the in-process self-test: jobs run in the background through the same handlers
+# as the lighting endpoints, and are polled, followed (server-sent events) or cancelled by id.
+# A job lives in the worker that started it, so with a daemon they need a single worker
+# (gunicorn -w 1): with more, a poll could reach another worker, and new jobs are refused with 409
+@app.route("/run_test", methods=["GET", "POST"])
+def run_test():
+    if request.method == "GET":
+        return jsonify({"jobs": [job.snapshot() for job in selftest_runner.jobs()]})
+    if LIGHT_DAEMON:
+        try:
+            workers = lighting.worker_count()
+        except GGConnectionError as e:
+            return jsonify({"error": str(e)}), 503
+        if workers > 1:
+            return jsonify({"error": f"Self-tests need a single worker ({workers} share the lighting daemon)",
+                            "workers": workers}), 409
+    data = request.get_json(silent=True) or {}
+    try:
+        job = selftest_runner.submit(data.get("steps"), name=data.get("name", "default"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "job": job.id,
+        "state": job.state,
+        "poll": f"/run_test/{job.id}",
+        "events": f"/run_test/{job.id}/events",
+    }), 202
+
+@app.route("/run_test/<job_id>", methods=["GET"])
+def run_test_status(job_id):
+    job = selftest_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown test job '{job_id}'"}), 404
+    return jsonify(job.snapshot())
+
+@app.route("/run_test/<job_id>/cancel", methods=["POST"])
+def run_test_cancel(job_id):
+    job = selftest_runner.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown test job '{job_id}'"}), 404
+    return jsonify(job.snapshot()), 202
+
+@app.route("/run_test/<job_id>/events", methods=["GET"])
+def run_test_events(job_id):
+    job = selftest_runner.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown test job '{job_id}'"}), 404
+    # EventSource reconnects with Last-Event-ID; resume after the last event it saw
+    since = request.headers.get("Last-Event-ID", request.args.get("since"))
+    since = int(since) + 1 if since is not None and since.lstrip("-").isdigit() else 0
+
+    def stream():
+        position = since
+        while True:
+            last = None
+            for event in job.events(position, timeout=15):
+                position = event["seq"] + 1
+                last = event
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            if last is None:
+                if job.done:
+                    return
+                yield ": keepalive\n\n"
+            elif last["type"] == "done":
+                return
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Handlers reachable over the persistent WebSocket channel (same code as the HTTP endpoints)
+CHANNEL_HANDLERS = {
+    "on": handle_lights_on_key,
+    "off": handle_lights_off_key,
+    "region_on": handle_lights_on_region,
+    "region_off": handle_lights_off_region_for_key,
+    "batch": handle_lights_batch,
+    "lesson": handle_lesson_start,
+    "advance": handle_lesson_advance,
+}
+
+# In-process self-test runner (replaces spawning test.py with its own GG connection per run)
+selftest_runner = SelfTestRunner(CHANNEL_HANDLERS)
+
+# Run the Flask app on port 5050 and the WebSocket channel on port 5051
 if __name__ == "__main__":
-    initialize_lighting()
+    LightingChannel(CHANNEL_HANDLERS, port=5051, capture=capture).start()
     app.run(port=5050)
\ No newline at end of file
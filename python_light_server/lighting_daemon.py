@@ -0,0 +1,425 @@
+"""
+Single owner of the GG connection for multi-process deployments.
+
+The daemon holds the one SteelSeriesLighting instance (GG connection,
+bindings, refreshers, scheduler) and serves it over a Unix socket with a
+JSON-lines protocol:
+
+    -> {"id": 1, "method": "lights_on_key", "args": ["AKEY_EVENT", "a", "#00ff00"], "kwargs": {}}
+    <- {"id": 1, "result": null}
+    <- {"id": 2, "error": {"type": "ValueError", "message": "Key 'x' not in any region"}}
+
+HTTP workers use LightingClient, which has the same methods, so
+light_server.py can run in several processes while GG state stays in one
+place. The current lesson and its cursor (lesson.Lessons) live here too,
+so consecutive keystrokes may reach different workers. Self-test jobs do
+not: they run through one worker's handlers and are polled, followed and
+cancelled on that worker, so light_server.py refuses them while more
+than one worker is registered with the daemon:
+
+    python3 lighting_daemon.py --socket /tmp/lighting.sock
+    LIGHT_DAEMON=/tmp/lighting.sock gunicorn -w 4 -b 127.0.0.1:5050 light_server:app
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+
+import requests
+
+from command_queue import CommandQueue
+from eventlog import EventLog
+from layout import Layout
+from lesson import Lessons
+from log import records as log_records, set_level as set_log_level
+from metrics import REGISTRY
+from ssgg import SteelSeriesLighting
+
+DEFAULT_SOCKET = "/tmp/lighting.sock"
+# light_server.py's default event log, so keystrokes land in the file the workers query
+DEFAULT_EVENT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".keystrokes.log")
+
+# SteelSeriesLighting methods clients may call
+METHODS = frozenset((
+    "apply_batch",
+    "bind_handlers",
+    "bind_key_color",
+    "bind_zones_color",
+    "enable_compositor",
+    "enable_heartbeat",
+    "ensure_event_registered",
+    "ensure_key_bound",
+    "ensure_palette_bound",
+    "light_event",
+    "lights_off",
+    "lights_off_event",
+    "lights_on_key",
+    "lights_on_region",
+    "load_manifest",
+    "palette_value",
+    "prebind",
+    "prime",
+    "prime_startup",
+    "register_event",
+    "register_game",
+    "remove_game",
+    "save_manifest",
+    "send_heartbeat",
+    "set_event_color",
+    "set_event_value",
+    "set_event_values",
+    "set_palette",
+    "wait_until_connected",
+    "warm",
+))
+
+# Lessons methods clients may call (as "lesson_<name>")
+LESSON_METHODS = frozenset(("start", "advance", "end", "get"))
+
+# attributes clients may read
+ATTRIBUTES = frozenset(("game", "base_url", "palette", "refresh_stats", "manifest_path", "keepalive"))
+
+
+def _error_type(e):
+    """Exception category sent to clients (re-raised there as the matching class)."""
+    if isinstance(e, requests.ConnectionError):
+        return "ConnectionError"
+    if isinstance(e, requests.Timeout):
+        return "Timeout"
+    if isinstance(e, requests.HTTPError):
+        return "HTTPError"
+    if isinstance(e, (ValueError, KeyError, TypeError)):
+        return type(e).__name__
+    return "RuntimeError"
+
+
+_ERRORS = {
+    "ConnectionError": requests.ConnectionError,
+    "Timeout": requests.Timeout,
+    "HTTPError": requests.HTTPError,
+    "ValueError": ValueError,
+    "KeyError": KeyError,
+    "TypeError": TypeError,
+}
+
+
+class _RPCHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        daemon = self.server.daemon
+        for line in self.rfile:
+            message = None
+            try:
+                message = json.loads(line)
+                response = {"id": message.get("id"), "result": daemon.call(message.get("method"),
+                                                                           message.get("args") or [],
+                                                                           message.get("kwargs") or {})}
+            except Exception as e:
+                response = {"id": message.get("id") if isinstance(message, dict) else None,
+                            "error": {"type": _error_type(e), "message": str(e)}}
+            try:
+                data = json.dumps(response, default=lambda o: None)
+            except ValueError as e:
+                data = json.dumps({"id": response["id"], "error": {"type": "RuntimeError", "message": str(e)}})
+            try:
+                self.wfile.write(data.encode("utf-8") + b"\n")
+                self.wfile.flush()
+            except OSError:
+                return
+
+
+class _ThreadingUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class LightingDaemon:
+    """
+    Serves one SteelSeriesLighting to LightingClients over a Unix socket.
+
+    Each client connection gets its own thread; the calls themselves are
+    the thread-safe SteelSeriesLighting methods, so concurrent workers are
+    serialized only where the lighting object already serializes (batches,
+    startup priming).
+
+    Lesson steps go through the daemon's own write-behind queue, so an
+    advance returns without waiting for GG, as it does in a single process.
+
+    :param lighting: the SteelSeriesLighting that owns the GG connection
+    :param path: Unix socket path (replaced if it exists)
+    :param event_log: EventLog lesson keystrokes are recorded in (None = not recorded)
+    """
+
+    def __init__(self, lighting, path=DEFAULT_SOCKET, event_log=None):
+        self.lighting = lighting
+        self.path = path
+        self.commands = CommandQueue(lighting)
+        self.lessons = Lessons(lighting, self._apply, log=event_log)
+        self._workers = set()  # pids of the light_server workers using this daemon
+        self._workers_lock = threading.Lock()
+        self._cleared = False  # whether a worker's startup clear has run (once per daemon, not per worker)
+        if os.path.exists(path):
+            os.remove(path)
+        self._server = _ThreadingUnixServer(path, _RPCHandler)
+        self._server.daemon = self
+        self._thread = None
+
+    def call(self, method, args, kwargs):
+        if method in METHODS:
+            return getattr(self.lighting, method)(*args, **kwargs)
+        if method.startswith("lesson_") and method[len("lesson_"):] in LESSON_METHODS:
+            return getattr(self.lessons, method[len("lesson_"):])(*args, **kwargs)
+        if method == "get" and args and args[0] in ATTRIBUTES:
+            return getattr(self.lighting, args[0])
+        if method == "layout_spec":
+            return self.lighting.layout.to_dict()
+        if method == "compositor_enabled":
+            return self.lighting.compositor is not None
+        if method == "breaker_snapshot":
+            return self.lighting.breaker.snapshot()
+        if method == "metrics_snapshot":
+            return REGISTRY.snapshot()
+        if method == "log_records":
+            return log_records(**kwargs)
+        if method == "set_log_level":
+            return set_log_level(*args)
+        if method == "register_worker":
+            with self._workers_lock:
+                self._workers.add(int(args[0]))
+            return self.worker_count()
+        if method == "worker_count":
+            return self.worker_count()
+        if method == "startup_clear":
+            return self.startup_clear()
+        if method == "ping":
+            return "pong"
+        raise ValueError(f"Unknown method '{method}'")
+
+    def worker_count(self):
+        """Number of registered workers still running (exited ones are forgotten)."""
+        with self._workers_lock:
+            for pid in list(self._workers):
+                try:
+                    os.kill(pid, 0)
+                except ProcessLookupError:
+                    self._workers.discard(pid)
+                except PermissionError:
+                    pass
+            return len(self._workers)
+
+    def startup_clear(self):
+        """
+        Turns every light off the first time a worker starts; later workers get False.
+
+        Each gunicorn worker runs light_server.py's startup, but the lights
+        belong to every session on this daemon, so only the first one clears.
+        """
+        with self._workers_lock:
+            if self._cleared:
+                return False
+            self._cleared = True
+        self.lighting.lights_off()
+        return True
+
+    def _apply(self, ops):
+        for op in ops:
+            self.commands.submit(op)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="lighting-daemon", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.commands.stop()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _Breaker:
+    """Client-side view of the daemon's circuit breaker (only what light_server.py reads)."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def snapshot(self):
+        return self._client._call("breaker_snapshot")
+
+
+class _Lessons:
+    """Client-side stand-in for the daemon's lesson.Lessons (same methods and (body, status) results)."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        if name in LESSON_METHODS:
+            return lambda *args, **kwargs: tuple(self._client._call(f"lesson_{name}", *args, **kwargs))
+        raise AttributeError(name)
+
+
+class LightingClient:
+    """
+    Drop-in stand-in for SteelSeriesLighting that forwards calls to a LightingDaemon.
+
+    Every thread keeps its own connection to the daemon (opened on first
+    use), so calls from concurrent request handlers never interleave.
+    Errors raised in the daemon are re-raised here as the same class
+    (requests.ConnectionError while GG is down, ValueError for bad input).
+
+    :param path: the daemon's Unix socket path
+    :param timeout: seconds to wait for a reply (None = no limit, used by blocking waits)
+    """
+
+    ALL_OFF_EVENT = SteelSeriesLighting.ALL_OFF_EVENT
+    REGIONS = SteelSeriesLighting.REGIONS
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self.breaker = _Breaker(self)
+        self.lessons = _Lessons(self)
+        self._local = threading.local()
+        self._compositor = None
+        self._game = None
+        self._layout = None
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                sock.close()
+                raise requests.ConnectionError(f"Lighting daemon not reachable at {self.path}: {e}")
+            conn = self._local.conn = (sock, sock.makefile("rb"), [0])
+        return conn
+
+    def _call(self, method, *args, **kwargs):
+        sock, reader, counter = self._connection()
+        counter[0] += 1
+        request = json.dumps({"id": counter[0], "method": method, "args": args, "kwargs": kwargs})
+        try:
+            sock.sendall(request.encode("utf-8") + b"\n")
+            line = reader.readline()
+        except OSError as e:
+            self._drop_connection()
+            raise requests.ConnectionError(f"Lighting daemon connection lost: {e}")
+        if not line:
+            self._drop_connection()
+            raise requests.ConnectionError("Lighting daemon closed the connection")
+        response = json.loads(line)
+        error = response.get("error")
+        if error:
+            raise _ERRORS.get(error["type"], RuntimeError)(error["message"])
+        return response.get("result")
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+
+    def __getattr__(self, name):
+        if name in METHODS:
+            return lambda *args, **kwargs: self._call(name, *args, **kwargs)
+        if name in ATTRIBUTES:
+            return self._call("get", name)
+        raise AttributeError(name)
+
+    @property
+    def game(self):
+        if self._game is None:
+            self._game = self._call("get", "game")
+        return self._game
+
+    @property
+    def layout(self):
+        # the daemon's layout, compiled locally once, so workers resolve keys exactly as the daemon does
+        if self._layout is None:
+            self._layout = Layout.from_dict(self._call("layout_spec"))
+        return self._layout
+
+    @property
+    def compositor(self):
+        # light_server.py only checks `is not None`; asked once, then updated by enable_compositor
+        if self._compositor is None:
+            self._compositor = self._call("compositor_enabled")
+        return True if self._compositor else None
+
+    def enable_compositor(self, *args, **kwargs):
+        self._call("enable_compositor", *args, **kwargs)
+        self._compositor = True
+        return True
+
+    def wait_until_connected(self, timeout=None):
+        # a blocking wait must not trip the client's socket timeout
+        sock = self._connection()[0]
+        sock.settimeout(None if timeout is None else timeout + self.timeout)
+        try:
+            return self._call("wait_until_connected", timeout)
+        finally:
+            sock.settimeout(self.timeout)
+
+    def metrics_snapshot(self):
+        return self._call("metrics_snapshot")
+
+    def log_records(self, **query):
+        return self._call("log_records", **query)
+
+    def set_log_level(self, level):
+        return self._call("set_log_level", level)
+
+    def register_worker(self, pid):
+        """Tell the daemon process `pid` serves requests with it; returns the number of live workers."""
+        return self._call("register_worker", pid)
+
+    def worker_count(self):
+        return self._call("worker_count")
+
+    def startup_clear(self):
+        """Turn all lights off unless another worker already did; returns True if this call cleared them."""
+        return self._call("startup_clear")
+
+    def ping(self):
+        return self._call("ping")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lighting daemon owning the SteelSeries GG connection")
+    parser.add_argument("--socket", default=os.getenv("LIGHT_DAEMON", DEFAULT_SOCKET))
+    parser.add_argument("--game", default="MYAPP")
+    parser.add_argument("--compositor", action="store_true", help="enable the frame buffer compositor")
+    parser.add_argument("--layout", default=os.getenv("LIGHT_LAYOUT"),
+                        help="keyboard layout: a name in layouts/ or a JSON file (default qwerty)")
+    parser.add_argument("--event-log", default=os.getenv("LIGHT_EVENT_LOG", DEFAULT_EVENT_LOG),
+                        help="event log lesson keystrokes are appended to, shared with the workers (\"off\" disables)")
+    args = parser.parse_args()
+
+    lighting = SteelSeriesLighting(game=args.game, layout=args.layout)
+    if args.compositor:
+        lighting.enable_compositor()
+    event_log = None
+    if args.event_log.lower() not in ("", "0", "off", "false", "no"):
+        event_log = EventLog(args.event_log, lighting.layout)
+    daemon = LightingDaemon(lighting, args.socket, event_log)
+    print(f"Lighting daemon listening on {args.socket}", flush=True)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Logging for the lighting server: levels, rate limiting, sampling, and a background writer.
+
+Every module logs through `get_logger(__name__)` under the "lighting"
+logger. A log call only runs the filters and puts the record on a
+bounded queue. A listener thread formats the records and writes them to
+the console (or to a rotating file), so no request or refresher thread
+ever does console or file I/O. When the queue is full, records are
+dropped and counted rather than blocking the caller.
+
+Filters run in the calling thread:
+- Rate limiting: each message (logger plus format string) gets a token
+  bucket of `burst` records refilled at `rate` per second. The next
+  record that gets through reports how many were suppressed.
+- Sampling: `extra={"sample": n}` keeps one record in n for that message.
+
+A bounded ring buffer keeps the last records for /debug/log. Its entries
+are structured: time, level, logger, thread, message, any
+`extra={"fields": {...}}` and the suppressed count.
+
+Configured from the environment on first use:
+
+    LIGHT_LOG_LEVEL   DEBUG, INFO (default), WARNING, ...
+    LIGHT_LOG_FILE    rotating log file (5 MB x 3) instead of the console
+    LIGHT_LOG_FORMAT  "text" (default) or "json" (one JSON object per line)
+    LIGHT_LOG_RATE    records per second per message (default 1)
+    LIGHT_LOG_BURST   records a message may log at once (default 10)
+    LIGHT_LOG_BUFFER  records kept for /debug/log (default 1000)
+
+    logger = get_logger(__name__)
+    logger.info("Connected to SteelSeries GG at %s", url)
+    logger.debug("Refreshed %d event(s)", n, extra={"sample": 10, "fields": {"events": n}})
+
+Format with %-style arguments, not f-strings, so a message keeps one
+rate-limit bucket whatever its arguments are.
+"""
+import atexit
+import collections
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+from metrics import REGISTRY
+
+ROOT = "lighting"
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per message, plus 1-in-n sampling for records logged with extra={"sample": n}.
+
+    :param rate: records per second each message may log in the long run
+    :param burst: records a message may log at once
+    :param max_keys: messages tracked (all buckets are reset beyond this)
+    """
+
+    def __init__(self, rate=1.0, burst=10, max_keys=4096):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.suppressed = 0
+        self._buckets = {}   # (logger, msg) -> [tokens, last refill, suppressed since last pass]
+        self._samples = {}   # (logger, msg) -> records seen
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        sample = getattr(record, "sample", None)
+        now = time.monotonic()
+        with self._lock:
+            if sample and sample > 1:
+                seen = self._samples.get(key, 0)
+                self._samples[key] = seen + 1
+                if seen % sample:
+                    return False
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.clear()
+                self._samples.clear()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.suppressed += 1
+                return False
+            bucket[0] -= 1
+            record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last `capacity` records as dicts, for /debug/log."""
+
+    def __init__(self, capacity=1000):
+        super().__init__()
+        self._records = collections.deque(maxlen=capacity)
+        self._ids = 0
+
+    def emit(self, record):
+        self._ids += 1
+        entry = {
+            "id": self._ids,
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry["fields"] = fields
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        self._records.append(entry)
+
+    def records(self, level=None, logger=None, since=None, limit=None):
+        """
+        Buffered records, oldest first.
+
+        :param level: minimum level name or number
+        :param logger: logger name prefix
+        :param since: only records with a larger id
+        :param limit: only the newest `limit` records
+        """
+        minimum = logging.getLevelName(level.upper()) if isinstance(level, str) else (level or 0)
+        if not isinstance(minimum, int):
+            raise ValueError(f"Unknown log level '{level}'")
+        entries = [
+            entry for entry in list(self._records)
+            if logging.getLevelName(entry["level"]) >= minimum
+            and (logger is None or entry["logger"].startswith(logger))
+            and (since is None or entry["id"] > since)
+        ]
+        return entries[-limit:] if limit else entries
+
+
+class _ConsoleHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is when a record is written (so contextlib.redirect_stdout applies)."""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread; drops them (counted) instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # formatting (and the args' __str__) is left to the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _JSONFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {"time": record.created, "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+        if getattr(record, "fields", None):
+            entry["fields"] = record.fields
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{text} (+{suppressed} similar suppressed)" if suppressed else text
+
+
+class _Logging:
+    """The configured pipeline: queue handler + filter in front, listener + writers and ring buffer behind."""
+
+    def __init__(self, level, path=None, fmt="text", rate=1.0, burst=10, buffer=1000, max_queue=10000):
+        self.rate_limit = RateLimitFilter(rate, burst)
+        self.ring = RingBufferHandler(buffer)
+        writer = (logging.handlers.RotatingFileHandler(path, maxBytes=5 << 20, backupCount=3, encoding="utf-8")
+                  if path else _ConsoleHandler())
+        writer.setFormatter(_JSONFormatter() if fmt == "json" else _TextFormatter(TEXT_FORMAT))
+        self.writer = writer
+        self.handler = _QueueHandler(queue.Queue(max_queue))
+        self.handler.addFilter(self.rate_limit)
+        self.listener = logging.handlers.QueueListener(self.handler.queue, writer, self.ring)
+        self.listener.start()
+
+        self.logger = logging.getLogger(ROOT)
+        self.logger.setLevel(level)
+        self.logger.addHandler(self.handler)
+        self.logger.propagate = False
+        REGISTRY.gauge("log", self.snapshot)
+
+    def snapshot(self):
+        return {
+            "level": logging.getLevelName(self.logger.level),
+            "queued": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "suppressed": self.rate_limit.suppressed,
+        }
+
+    def stop(self):
+        self.listener.stop()
+
+
+_state = None
+_setup_lock = threading.Lock()
+
+
+def setup(level=None, path=None, fmt=None, rate=None, burst=None, buffer=None):
+    """
+    Configure lighting logging (once per process; later calls return the existing setup).
+
+    Arguments left as None come from the LIGHT_LOG_* environment variables (see the module docstring).
+    """
+    global _state
+    with _setup_lock:
+        if _state is None:
+            env = os.environ.get
+            _state = _Logging(
+                level=(level or env("LIGHT_LOG_LEVEL") or "INFO").upper(),
+                path=path or env("LIGHT_LOG_FILE") or None,
+                fmt=(fmt or env("LIGHT_LOG_FORMAT") or "text").lower(),
+                rate=rate if rate is not None else float(env("LIGHT_LOG_RATE", 1.0)),
+                burst=burst if burst is not None else int(env("LIGHT_LOG_BURST", 10)),
+                buffer=buffer if buffer is not None else int(env("LIGHT_LOG_BUFFER", 1000)),
+            )
+            # write out what is still queued when the process exits
+            atexit.register(_state.stop)
+        return _state
+
+
+def get_logger(name):
+    """Logger `lighting.<name>` (the pipeline is set up on first use)."""
+    setup()
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+def adopt(name):
+    """Route another library's logger (e.g. "werkzeug") through the lighting pipeline instead of its own handlers."""
+    state = setup()
+    other = logging.getLogger(name)
+    for handler in list(other.handlers):
+        other.removeHandler(handler)
+    other.addHandler(state.handler)
+    other.propagate = False
+    return other
+
+
+def set_level(level):
+    """Change the lighting log level at runtime; raises ValueError for an unknown level."""
+    number = logging.getLevelName(str(level).upper())
+    if not isinstance(number, int):
+        raise ValueError(f"Unknown log level '{level}'")
+    setup().logger.setLevel(number)
+    return logging.getLevelName(number)
+
+
+def records(level=None, logger=None, since=None, limit=None):
+    """Buffered records for /debug/log (see RingBufferHandler.records)."""
+    return setup().ring.records(level, logger, since, limit)
+
+
+def flush():
+    """Wait until every queued record has been written (for shutdown and tests)."""
+    state = setup()
+    state.listener.stop()
+    state.listener.start()
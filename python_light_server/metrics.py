@@ -0,0 +1,124 @@
+import bisect
+import threading
+import time
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is open-ended)
+LATENCY_BUCKETS_MS = (0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; `observe` is a bisect plus a few adds under a lock."""
+
+    __slots__ = ("bounds", "counts", "count", "total", "max", "_lock")
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        ms = seconds * 1000.0
+        index = bisect.bisect_left(self.bounds, ms)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += ms
+            if ms > self.max:
+                self.max = ms
+
+    def percentile(self, pct, counts=None, count=None):
+        """Upper bound of the bucket holding the pct-th observation (max for the open bucket)."""
+        counts = self.counts if counts is None else counts
+        count = self.count if count is None else count
+        if not count:
+            return 0.0
+        rank = pct / 100.0 * count
+        seen = 0
+        for index, n in enumerate(counts):
+            seen += n
+            if seen >= rank and n:
+                return float(self.bounds[index]) if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        with self._lock:
+            counts, count, total, peak = list(self.counts), self.count, self.total, self.max
+        return {
+            "count": count,
+            "mean_ms": total / count if count else 0.0,
+            "max_ms": peak,
+            "p50_ms": self.percentile(50, counts, count),
+            "p95_ms": self.percentile(95, counts, count),
+            "p99_ms": self.percentile(99, counts, count),
+            "buckets_ms": {
+                (f"le_{bound}" if i < len(self.bounds) else "inf"): n
+                for i, (bound, n) in enumerate(zip(self.bounds + (None,), counts))
+            },
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters, histograms and gauges, safe to update from any thread.
+
+    Metrics are addressed by (name, label), e.g. ("gg_call", "game_event").
+    Histograms and counters are created on first use; gauges are callables
+    evaluated when a snapshot is taken.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self.started = time.time()
+
+    def histogram(self, name, label=""):
+        key = (name, label)
+        hist = self._histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(key, Histogram())
+        return hist
+
+    def observe(self, name, label, seconds):
+        self.histogram(name, label).observe(seconds)
+
+    def inc(self, name, label="", n=1):
+        key = (name, label)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def gauge(self, name, fn):
+        """Register `fn()` to be reported under `name` in snapshots."""
+        with self._lock:
+            self._gauges[name] = fn
+
+    def snapshot(self):
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = dict(self._counters)
+            gauges = list(self._gauges.items())
+        result = {"uptime_s": time.time() - self.started, "histograms": {}, "counters": {}, "gauges": {}}
+        for (name, label), hist in histograms:
+            result["histograms"].setdefault(name, {})[label] = hist.snapshot()
+        for (name, label), value in counters.items():
+            result["counters"].setdefault(name, {})[label] = value
+        for name, fn in gauges:
+            try:
+                result["gauges"][name] = fn()
+            except Exception as e:
+                result["gauges"][name] = f"error: {e}"
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+# Shared registry used by SteelSeriesLighting and light_server.py
+REGISTRY = MetricsRegistry()
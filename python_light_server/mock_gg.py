@@ -0,0 +1,264 @@
+"""
+Local stand-in for the SteelSeries GG GameSense API.
+
+Accepts the same JSON POSTs as the real engine (game_metadata,
+register_game_event, bind_game_event, game_event, multiple_game_events,
+game_heartbeat, remove_game), keeps the resulting state and counts every
+call, so the light server and benchmarks can run without GG installed:
+
+    python3 mock_gg.py --latency-ms 2 --failure-rate 0.01
+    STEELSERIES_COREPROPS=<printed path> python3 light_server.py
+
+Besides the GG endpoints it serves control endpoints for tools that run it
+in another process: GET /__stats (call counts and state), GET
+/__state?game=NAME (every event's last value and bound handlers) and
+POST /__reset.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GG_ENDPOINTS = (
+    "game_metadata",
+    "register_game_event",
+    "bind_game_event",
+    "game_event",
+    "multiple_game_events",
+    "game_heartbeat",
+    "remove_game",
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep the connection alive like they can with GG
+    protocol_version = "HTTP/1.1"
+    # send headers and body in one segment; unbuffered writes + Nagle stall keep-alive clients ~40ms
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.mock.record_connection(self.connection)
+
+    def finish(self):
+        super().finish()
+        self.server.mock.forget_connection(self.connection)
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        if path == "/__stats":
+            self._reply(200, self.server.mock.stats())
+        elif path == "/__state":
+            game = dict(part.split("=", 1) for part in query.split("&") if "=" in part).get("game")
+            self._reply(200, self.server.mock.state(game))
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        endpoint = self.path.lstrip("/")
+        if endpoint == "__reset":
+            self.server.mock.reset()
+            self._reply(200, {})
+            return
+        try:
+            payload = json.loads(raw) if raw else {}
+        except ValueError:
+            self._reply(400, {"error": "invalid JSON"})
+            return
+        status, body = self.server.mock.handle(endpoint, payload)
+        self._reply(status, body)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockGG:
+    """
+    Threaded mock GG server.
+
+    :param host: interface to bind (default loopback)
+    :param port: port to bind (0 = pick a free one)
+    :param latency_ms: delay added to every GG call
+    :param jitter_ms: extra uniformly random delay (0..jitter_ms) per call
+    :param failure_rate: probability (0..1) that a GG call answers HTTP 500
+    :param seed: random seed for jitter/failures (None = nondeterministic)
+    :param strict: answer HTTP 400 to game_event / multiple_game_events for events never registered or bound
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, seed=None,
+                 strict=False):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread = None
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.strict = strict
+        self.address = f"{host}:{self._server.server_address[1]}"
+        self.core_props_path = None
+        self.calls = Counter()
+        self.failures = Counter()
+        self.connections = 0
+        self._open = set()  # sockets of connections being served, closed by stop()
+        self.games = {}     # game -> metadata
+        self.events = {}    # (game, event) -> registration payload
+        self.bindings = {}  # (game, event) -> handlers
+        self.values = {}    # (game, event) -> last value
+
+    def handle(self, endpoint, payload):
+        """Apply one GG call; returns (status, body)."""
+        with self._lock:
+            delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+            fail = self.failure_rate > 0 and self._random.random() < self.failure_rate
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        if endpoint not in GG_ENDPOINTS:
+            return 404, {"error": f"unknown endpoint '{endpoint}'"}
+        with self._lock:
+            self.calls[endpoint] += 1
+            if fail:
+                self.failures[endpoint] += 1
+                return 500, {"error": "injected failure"}
+            return self._apply(endpoint, payload)
+
+    def _apply(self, endpoint, payload):
+        game = payload.get("game")
+        if not game:
+            return 400, {"error": "missing game"}
+        if endpoint == "game_metadata":
+            self.games[game] = payload
+        elif endpoint == "remove_game":
+            self.games.pop(game, None)
+            for table in (self.events, self.bindings, self.values):
+                for key in [k for k in table if k[0] == game]:
+                    del table[key]
+        elif endpoint == "register_game_event":
+            self.events[(game, payload.get("event"))] = payload
+        elif endpoint == "bind_game_event":
+            self.events.setdefault((game, payload.get("event")), payload)
+            self.bindings[(game, payload.get("event"))] = payload.get("handlers", [])
+        elif endpoint == "game_event":
+            if self.strict and (game, payload.get("event")) not in self.events:
+                return 400, {"error": f"event '{payload.get('event')}' is not registered"}
+            self.values[(game, payload.get("event"))] = payload.get("data", {}).get("value")
+        elif endpoint == "multiple_game_events":
+            items = payload.get("events", [])
+            unknown = self.strict and [item.get("event") for item in items
+                                       if (game, item.get("event")) not in self.events]
+            if unknown:
+                return 400, {"error": f"events {unknown} are not registered"}
+            for item in items:
+                self.values[(game, item.get("event"))] = item.get("data", {}).get("value")
+        return 200, {}
+
+    def record_connection(self, sock=None):
+        with self._lock:
+            self.connections += 1
+            if sock is not None:
+                self._open.add(sock)
+
+    def forget_connection(self, sock):
+        with self._lock:
+            self._open.discard(sock)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "failures": dict(self.failures),
+                "total_calls": sum(self.calls.values()),
+                "connections": self.connections,
+                "events": len(self.events),
+                "bindings": len(self.bindings),
+                "lit": sorted(f"{game}/{event}" for (game, event), value in self.values.items() if value),
+            }
+
+    def state(self, game):
+        """Last value and bound handlers of every event of `game`."""
+        with self._lock:
+            return {
+                "values": {event: value for (g, event), value in self.values.items() if g == game},
+                "bindings": {event: handlers for (g, event), handlers in self.bindings.items() if g == game},
+            }
+
+    def reset(self):
+        """Clear call counters (GG state is kept, like a long-running engine)."""
+        with self._lock:
+            self.calls.clear()
+            self.failures.clear()
+            self.connections = 0
+
+    def start(self):
+        """Start serving in a background thread and write a coreProps.json pointing at it."""
+        fd, self.core_props_path = tempfile.mkstemp(prefix="mock_gg_", suffix="_coreProps.json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"address": self.address}, f)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and drop kept-alive connections, like an engine that exits."""
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            sockets, self._open = self._open, set()
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self.core_props_path and os.path.exists(self.core_props_path):
+            os.remove(self.core_props_path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the SteelSeries GG GameSense API")
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_GG_PORT", "0")))
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--strict", action="store_true", help="reject values for events never registered")
+    args = parser.parse_args()
+
+    mock = MockGG(port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                  failure_rate=args.failure_rate, seed=args.seed, strict=args.strict).start()
+    print(f"Mock GG listening on http://{mock.address}", flush=True)
+    print(f"STEELSERIES_COREPROPS={mock.core_props_path}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Replays captured lighting traffic against light_server.py and the mock GG engine.
+
+Record real typing sessions with capture mode, then replay them against
+the same stack bench.py uses (mock_gg.py in its own process, the light
+server in-process on free ports), so server changes can be compared on
+identical traffic:
+
+    LIGHT_CAPTURE=lighting.trace python3 light_server.py
+    python3 replay.py lighting.trace                      # recorded timing (1x)
+    python3 replay.py lighting.trace --speed 4 --copies 8
+    python3 replay.py lighting.trace --speed 0 --json     # as fast as the server answers
+
+Every recorded session is replayed by its own thread, in order, at its
+recorded offset from the start of the trace divided by --speed (0 = no
+waiting); --copies replays each session that many times in parallel.
+Idle gaps longer than --max-gap seconds are shortened to it. Lesson ids
+in "advance" requests are rewritten to the lesson the replaying session
+started (the server has one current lesson, so parallel copies of lesson
+traffic mostly see 409s: that is what the server would answer them).
+
+The report has latency percentiles overall and per route, GG calls per
+keystroke, how far requests started behind schedule (lag: the client was
+still waiting for earlier answers), the server-side handler time per
+route (the rest of the latency is transport and queueing in front of the
+handlers) and the peak depth of the server's internal queues.
+"""
+import argparse
+import contextlib
+import json
+import sys
+import threading
+import time
+
+import requests
+
+from bench import Stack, summarize
+from capture import read_trace, sessions
+
+# requests that stand for one keystroke (for GG calls per keystroke)
+KEYSTROKE_PATHS = ("/lights_on_key", "/lights_batch", "/lesson/advance")
+KEYSTROKE_OPS = ("on", "batch", "advance")
+
+
+def schedule(entries, max_gap=None):
+    """Replay offsets (seconds from the first request) for time-sorted entries, gaps capped at max_gap."""
+    offsets = []
+    offset = 0.0
+    for index, entry in enumerate(entries):
+        if index:
+            gap = entry["at"] - entries[index - 1]["at"]
+            offset += min(gap, max_gap) if max_gap else gap
+        offsets.append(offset)
+    return offsets
+
+
+def route(entry):
+    if entry.get("via") == "channel":
+        return f"channel {(entry.get('body') or {}).get('op')}"
+    return f"{entry.get('method', 'POST')} {entry.get('path')}"
+
+
+def is_keystroke(entry):
+    if entry.get("via") == "channel":
+        return (entry.get("body") or {}).get("op") in KEYSTROKE_OPS
+    return entry.get("path") in KEYSTROKE_PATHS
+
+
+class Replayer(threading.Thread):
+    """One recorded session replayed in order; `results` holds (route, status, recorded status, latency, lag)."""
+
+    def __init__(self, stack, entries, offsets, start, speed):
+        super().__init__(daemon=True)
+        self.stack = stack
+        self.entries = entries
+        self.offsets = offsets
+        self.start_at = start
+        self.speed = speed
+        self.results = []
+        self.errors = 0
+        self._lesson = None   # id of the lesson this session started, for its advances
+
+    def _body(self, entry):
+        body = entry.get("body")
+        if isinstance(body, dict) and "lesson" in body and self._lesson is not None:
+            body = dict(body, lesson=self._lesson)
+        return body
+
+    def _started_lesson(self, entry, status, body):
+        op = (entry.get("body") or {}).get("op") if entry.get("via") == "channel" else entry.get("path")
+        if op in ("lesson", "/lesson") and entry.get("method", "POST") == "POST" and status == 200:
+            self._lesson = body.get("id")
+
+    def run(self):
+        http = requests.Session()
+        channel = None
+        for entry, offset in zip(self.entries, self.offsets):
+            due = self.start_at + (offset / self.speed if self.speed else 0.0)
+            now = time.perf_counter()
+            if now < due:
+                time.sleep(due - now)
+            t0 = time.perf_counter()
+            lag = max(0.0, t0 - due) if self.speed else 0.0
+            try:
+                if entry.get("via") == "channel":
+                    if channel is None:
+                        from ws_channel import ChannelClient
+                        channel = ChannelClient(port=self.stack.channel.port)
+                    ack = channel.request(self._body(entry))
+                    status, body = ack.get("status"), ack.get("body") or {}
+                else:
+                    response = http.request(entry.get("method", "POST"), f"{self.stack.url}{entry.get('path')}",
+                                            json=self._body(entry), timeout=30)
+                    status = response.status_code
+                    try:
+                        body = response.json()
+                    except ValueError:
+                        body = {}
+                self._started_lesson(entry, status, body)
+            except Exception:
+                self.errors += 1
+                status = None
+            self.results.append((route(entry), status, entry.get("status"), time.perf_counter() - t0, lag))
+        http.close()
+        if channel is not None:
+            channel.close()
+
+
+class QueueSampler(threading.Thread):
+    """Samples the server's queue gauges while a replay runs and keeps each one's peak."""
+
+    def __init__(self, metrics, interval=0.05):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.interval = interval
+        self.peaks = {}
+        self._stopped = threading.Event()
+
+    def _sample(self):
+        for name, value in self.metrics.snapshot()["gauges"].items():
+            if isinstance(value, dict):
+                value = value.get("pending")
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.peaks[name] = max(self.peaks.get(name, 0), value)
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self._sample()
+
+
+def replay(stack, entries, speed=1.0, copies=1, max_gap=None):
+    offsets = dict(zip(map(id, entries), schedule(entries, max_gap)))
+    grouped = sessions(entries)
+    stack.gg_reset()
+    server_metrics = stack.light_server.metrics
+    server_metrics.reset()
+    sampler = QueueSampler(server_metrics)
+    sampler.start()
+    start = time.perf_counter() + 0.05
+    workers = [Replayer(stack, session, [offsets[id(entry)] for entry in session], start, speed)
+               for session in grouped.values() for _ in range(copies)]
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    sampler.stop()
+    gg = stack.gg_stats()
+    server_routes = server_metrics.snapshot()["histograms"].get("route", {})
+
+    results = [result for w in workers for result in w.results]
+    keystrokes = sum(is_keystroke(entry) for entry in entries) * copies
+    routes = {}
+    for name in sorted({result[0] for result in results}):
+        mine = [result for result in results if result[0] == name]
+        statuses = {}
+        for _, status, _, _, _ in mine:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        server = server_routes.get(name)
+        routes[name] = {
+            "latency": summarize([result[3] for result in mine]),
+            "statuses": statuses,
+            "server_p50_ms": server["p50_ms"] if server else None,
+            "server_p95_ms": server["p95_ms"] if server else None,
+        }
+    return {
+        "requests": len(results),
+        "sessions": len(grouped),
+        "copies": copies,
+        "speed": speed,
+        "recorded_seconds": round(entries[-1]["at"] - entries[0]["at"], 3) if entries else 0.0,
+        "seconds": round(wall, 3),
+        "keystrokes": keystrokes,
+        "errors": sum(w.errors for w in workers),
+        "status_changed": sum(1 for result in results if result[2] is not None and result[1] != result[2]),
+        "latency": summarize([result[3] for result in results]),
+        "lag": summarize([result[4] for result in results]),
+        "routes": routes,
+        "queue_peaks": sampler.peaks,
+        "gg_calls": gg["calls"],
+        "gg_calls_total": gg["total_calls"],
+        "gg_calls_per_keystroke": gg["total_calls"] / keystrokes if keystrokes else 0.0,
+        "cpu_seconds": round(cpu, 3),
+    }
+
+
+def print_report(result):
+    lat, lag = result["latency"], result["lag"]
+    speed = f"{result['speed']}x" if result["speed"] else "max speed"
+    print(f"== replay: {result['requests']} requests from {result['sessions']} session(s) x{result['copies']} "
+          f"at {speed}: {result['seconds']}s (recorded {result['recorded_seconds']}s)")
+    print(f"   latency  p50 {lat['p50_ms']:.2f} ms  p95 {lat['p95_ms']:.2f} ms  "
+          f"p99 {lat['p99_ms']:.2f} ms  max {lat['max_ms']:.2f} ms")
+    print(f"   lag      p50 {lag['p50_ms']:.2f} ms  p95 {lag['p95_ms']:.2f} ms  max {lag['max_ms']:.2f} ms")
+    print(f"   GG calls {result['gg_calls_total']} ({result['gg_calls_per_keystroke']:.2f}/keystroke) {result['gg_calls']}")
+    print(f"   CPU {result['cpu_seconds']} s   errors {result['errors']}   "
+          f"status differs from capture {result['status_changed']}")
+    if result["queue_peaks"]:
+        print("   queue peaks " + "  ".join(f"{name} {peak}" for name, peak in sorted(result["queue_peaks"].items())))
+    for name, stats in result["routes"].items():
+        lat = stats["latency"]
+        server = (f"  handler p50 {stats['server_p50_ms']:.2f} p95 {stats['server_p95_ms']:.2f}"
+                  if stats["server_p50_ms"] is not None else "")
+        print(f"   {name:<32} n {lat['count']:<6} p50 {lat['p50_ms']:.2f}  p95 {lat['p95_ms']:.2f}  "
+              f"p99 {lat['p99_ms']:.2f}{server}  {stats['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured lighting traffic against the light server (mock GG)")
+    parser.add_argument("trace", help="trace file written with LIGHT_CAPTURE")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale (2 = twice as fast, 0 = no waiting)")
+    parser.add_argument("--copies", type=int, default=1, help="parallel replays of every recorded session")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="longest idle gap kept, in seconds (0 = all)")
+    parser.add_argument("--gg-latency-ms", type=float, default=1.0)
+    parser.add_argument("--gg-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--gg-failure-rate", type=float, default=0.0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    header, entries = read_trace(args.trace)
+    if not entries:
+        parser.error(f"{args.trace} has no captured requests")
+    # the server's own console output goes to stderr so stdout stays a clean report
+    with contextlib.redirect_stdout(sys.stderr):
+        stack = Stack(args.gg_latency_ms, args.gg_jitter_ms, args.gg_failure_rate)
+        try:
+            if header.get("layout") and header["layout"] != stack.light_server.layout.name:
+                print(f"[WARN] Trace was captured with layout '{header['layout']}', "
+                      f"replaying with '{stack.light_server.layout.name}'")
+            result = replay(stack, entries, args.speed, max(1, args.copies), args.max_gap)
+            stack.light_server.lighting.lights_off()
+        finally:
+            stack.close()
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
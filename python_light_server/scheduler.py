@@ -0,0 +1,138 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class Job:
+    """Handle for a scheduled call; pass it to `Scheduler.cancel`."""
+
+    __slots__ = ("deadline", "fn", "cancelled", "popped")
+
+    def __init__(self, deadline, fn):
+        self.deadline = deadline
+        self.fn = fn
+        self.cancelled = False
+        self.popped = False   # taken off the heap to run (cancelling it no longer leaves a heap entry)
+
+
+class Scheduler:
+    """
+    One worker thread running callbacks from a heap of deadlines.
+
+    `call_at`/`call_later` are O(log n). `cancel` is O(1): cancelled jobs stay
+    in the heap and are skipped when they come due; the heap is compacted
+    once they make up more than half of it. The worker sleeps until the
+    earliest deadline, so wakeups depend on what is due, not on how many
+    jobs are pending. Callbacks run on the worker thread and must not block
+    for long; exceptions they raise are swallowed.
+
+    Jobs due within `coalesce_window` seconds of each other run back to back
+    as one batch, after which `after_batch()` is called, so callers can
+    buffer work in their callbacks and flush it once per batch.
+    """
+
+    def __init__(self, name="lighting-scheduler", coalesce_window=0.005, after_batch=None):
+        self.name = name
+        self.coalesce_window = coalesce_window
+        self.after_batch = after_batch
+        self._heap = []
+        self._seq = itertools.count()
+        self._cancelled = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def call_at(self, deadline, fn):
+        """Run `fn()` at `deadline` (a `time.monotonic()` value)."""
+        job = Job(deadline, fn)
+        with self._cond:
+            self._ensure_worker()
+            heapq.heappush(self._heap, (deadline, next(self._seq), job))
+            # only wake the worker if this job is now the earliest
+            if self._heap[0][2] is job:
+                self._cond.notify()
+        return job
+
+    def call_later(self, delay, fn):
+        return self.call_at(time.monotonic() + max(0.0, delay), fn)
+
+    def call_soon(self, fn):
+        return self.call_at(time.monotonic(), fn)
+
+    def cancel(self, job):
+        if job is None or job.cancelled:
+            return
+        with self._cond:
+            job.cancelled = True
+            # a job already taken off the heap (running, or done) leaves no dead entry behind
+            if job.popped:
+                return
+            self._cancelled += 1
+            if self._cancelled > 64 and self._cancelled * 2 > len(self._heap):
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def pending(self):
+        """Number of live (not cancelled) jobs."""
+        with self._cond:
+            return len(self._heap) - self._cancelled
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _pop_due(self):
+        """Block until a job is due; return the due batch, or None once stopped."""
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                deadline, _, job = self._heap[0]
+                if job.cancelled:
+                    heapq.heappop(self._heap)
+                    self._cancelled -= 1
+                    continue
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                horizon = time.monotonic() + self.coalesce_window
+                batch = []
+                while self._heap and self._heap[0][0] <= horizon:
+                    _, _, job = heapq.heappop(self._heap)
+                    if job.cancelled:
+                        self._cancelled -= 1
+                    else:
+                        job.popped = True
+                        batch.append(job)
+                return batch
+            return None
+
+    def _run(self):
+        while True:
+            batch = self._pop_due()
+            if batch is None:
+                return
+            for job in batch:
+                # an earlier callback in the batch may have cancelled it
+                if job.cancelled:
+                    continue
+                try:
+                    job.fn()
+                except Exception:
+                    pass
+            if self.after_batch is not None:
+                try:
+                    self.after_batch()
+                except Exception:
+                    pass
@@ -0,0 +1,226 @@
+import collections
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import REGISTRY
+
+# The sequence test.py used to run in a separate interpreter: G green and the three regions
+# red/blue/cyan for 5 seconds each, all lit together
+DEFAULT_SEQUENCE = [
+    {"op": "on", "key": "g", "color": "#00FF00", "duration": 5},
+    {"op": "region_on", "key": "q", "color": "#FF0000", "duration": 5},
+    {"op": "region_on", "key": "f", "color": "#0000FF", "duration": 5},
+    {"op": "region_on", "key": "j", "color": "#00FFFF", "duration": 5},
+    {"op": "wait", "seconds": 5},
+]
+
+# what turns off the light a step turned on (used to clean up after a cancel or failure)
+OFF_OPS = {"on": "off", "region_on": "region_off"}
+
+
+class SelfTestJob:
+    """
+    One run of a test sequence: its state, per-step results and an event log clients can follow.
+
+    state is "pending", "running", "passed", "failed" or "cancelled".
+    """
+
+    def __init__(self, job_id, name, steps):
+        self.id = job_id
+        self.name = name
+        self.steps = steps
+        self.state = "pending"
+        self.results = []
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._events = []                 # progress events, in order (see `events`)
+        self._cond = threading.Condition()
+        self._cancel = threading.Event()
+
+    @property
+    def done(self):
+        return self.state in ("passed", "failed", "cancelled")
+
+    def cancel(self):
+        """Ask the job to stop; a running step finishes first, a wait ends at once."""
+        self._cancel.set()
+
+    def _emit(self, kind, **fields):
+        with self._cond:
+            self._events.append(dict(fields, type=kind, job=self.id, seq=len(self._events)))
+            self._cond.notify_all()
+
+    def events(self, since=0, timeout=None):
+        """
+        Yield progress events from index `since` as they happen, until the job is done.
+
+        :param timeout: stop waiting for the next event after this many seconds (None = until done)
+        """
+        while True:
+            with self._cond:
+                if len(self._events) <= since and not self.done:
+                    self._cond.wait(timeout)
+                pending = self._events[since:]
+                finished = self.done
+            for event in pending:
+                yield event
+            since += len(pending)
+            if not pending and (finished or timeout is not None):
+                return
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "job": self.id,
+                "name": self.name,
+                "state": self.state,
+                "progress": {"done": len(self.results), "total": len(self.steps)},
+                "results": list(self.results),
+                "error": self.error,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+            }
+
+
+class SelfTestRunner:
+    """
+    Runs lighting self-test sequences in-process, one job at a time, on a background thread.
+
+    Steps go through the same handlers as the HTTP endpoints and the
+    WebSocket channel (`handlers` maps an op to `handler(data) -> (body,
+    status)`), so a test exercises the real server path against the
+    already-connected lighting instance. A step is a dict with an "op" and
+    the op's fields, e.g. {"op": "on", "key": "g", "color": "#00FF00",
+    "duration": 5}; {"op": "wait", "seconds": 2} pauses the sequence.
+    A step passes if its status is below 400, or equals "expect" if given.
+    The first failing step ends the job; on failure or cancel, lights the
+    job turned on are turned off again.
+
+    :param handlers: op -> handler(data) returning (body, status)
+    :param keep: number of finished jobs kept for polling
+    :param metrics: metrics registry (default: the shared REGISTRY)
+    """
+
+    def __init__(self, handlers, keep=20, metrics=None):
+        self.handlers = handlers
+        self.keep = keep
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self._jobs = collections.OrderedDict()   # id -> SelfTestJob, oldest first
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="selftest")
+
+    def validate(self, steps):
+        """Raises ValueError if `steps` is not a runnable sequence."""
+        if not isinstance(steps, list) or not steps:
+            raise ValueError("No test steps provided")
+        for index, step in enumerate(steps):
+            if not isinstance(step, dict):
+                raise ValueError(f"Step {index} is not an object")
+            op = step.get("op")
+            if op == "wait":
+                try:
+                    float(step.get("seconds", 0))
+                except (TypeError, ValueError):
+                    raise ValueError(f"Step {index}: invalid wait seconds")
+            elif op not in self.handlers:
+                raise ValueError(f"Step {index}: unknown op '{op}'")
+
+    def submit(self, steps=None, name="default"):
+        """
+        Queue a test sequence (DEFAULT_SEQUENCE if none) and return its job at once.
+
+        :raises ValueError: if the steps are invalid
+        """
+        steps = DEFAULT_SEQUENCE if steps is None else steps
+        self.validate(steps)
+        with self._lock:
+            job = SelfTestJob(str(next(self._ids)), name, steps)
+            self._jobs[job.id] = job
+            # forget the oldest finished jobs
+            finished = [job_id for job_id, old in self._jobs.items() if old.done]
+            for job_id in finished[:max(0, len(self._jobs) - self.keep)]:
+                del self._jobs[job_id]
+        job._emit("queued", total=len(steps))
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(str(job_id))
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """Cancel a pending or running job; returns the job, or None if unknown."""
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def _run(self, job):
+        if job._cancel.is_set():
+            self._finish(job, "cancelled", [])
+            return
+        job.state = "running"
+        job.started = time.time()
+        job._emit("started", total=len(job.steps))
+        lit = []  # (op, key) turned on by this job, for cleanup
+        for index, step in enumerate(job.steps):
+            if job._cancel.is_set():
+                self._finish(job, "cancelled", lit)
+                return
+            result = self._run_step(job, step)
+            result["index"] = index
+            with job._cond:
+                job.results.append(result)
+            job._emit("step", **result)
+            if not result["passed"]:
+                job.error = f"Step {index} ({step.get('op')}) failed"
+                self._finish(job, "failed", lit)
+                return
+            if step.get("op") in OFF_OPS:
+                lit.append((step["op"], step.get("key")))
+        if job._cancel.is_set():
+            self._finish(job, "cancelled", lit)
+        else:
+            # timed lights go out by themselves; untimed ones are the sequence's to turn off
+            self._finish(job, "passed", [])
+
+    def _run_step(self, job, step):
+        op = step.get("op")
+        start = time.perf_counter()
+        if op == "wait":
+            job._cancel.wait(float(step.get("seconds", 0)))
+            body, status = {"waited": not job._cancel.is_set()}, 200
+        else:
+            data = {field: value for field, value in step.items() if field not in ("op", "expect")}
+            try:
+                body, status = self.handlers[op](data)
+            except Exception as e:
+                body, status = {"error": str(e)}, 500
+        elapsed = time.perf_counter() - start
+        self.metrics.observe("selftest_step", op, elapsed)
+        expect = step.get("expect")
+        passed = status == expect if expect is not None else status < 400
+        return {"op": op, "status": status, "body": body, "passed": passed, "ms": elapsed * 1000}
+
+    def _finish(self, job, state, lit):
+        for op, key in lit:
+            try:
+                self.handlers[OFF_OPS[op]]({"key": key})
+            except Exception:
+                pass
+        with job._cond:
+            job.state = state
+            job.finished = time.time()
+            # in the same critical section, so a follower never sees "done" state without the event
+            job._emit("done", state=state, error=job.error)
+        self.metrics.inc("selftest", state)
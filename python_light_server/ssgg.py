@@ -1,90 +1,209 @@
+import contextlib
+import heapq
+import itertools
 import json
+import math
 import os
+import re
 import time
 import requests
 import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional
 
+from layout import DEFAULT_LAYOUT, Layout, canonical_handlers, color_handlers, load_layout
+from log import get_logger
+from metrics import REGISTRY
+from scheduler import Scheduler
+from transport import CircuitBreaker, PooledTransport
+
+logger = get_logger(__name__)
+
+
+def read_core_props(core_props_path=None):
+    """
+    找到 coreProps.json 并读取 GG API 地址
+
+    :param core_props_path: coreProps.json 的路径（优先使用此值；若为空将自动探测）
+    :return: (address, 实际使用的 coreProps.json 路径)
+    """
+    # 1) 优先顺序：显式参数 > 环境变量 > 常见系统路径（GG/Engine 新旧版本）
+    candidates = [
+        core_props_path,
+        os.getenv("STEELSERIES_COREPROPS"),
+        r"C:\ProgramData\SteelSeries\SteelSeries Engine 3\coreProps.json",  # Windows (Engine 3)
+        r"C:\ProgramData\SteelSeries\SteelSeries GG\coreProps.json",       # Windows (GG)
+        "/Library/Application Support/SteelSeries Engine 3/coreProps.json", # macOS (Engine 3)
+        "/Library/Application Support/SteelSeries GG/coreProps.json",       # macOS (GG)
+        os.path.expanduser("~/.local/share/SteelSeries Engine 3/coreProps.json"),  # Linux (旧)
+        os.path.expanduser("~/.local/share/SteelSeries GG/coreProps.json"),        # Linux (GG)
+    ]
+
+    core_props_resolved = next((p for p in candidates if p and os.path.exists(p)), None)
+    if not core_props_resolved:
+        raise FileNotFoundError(
+            "coreProps.json not found. Ensure SteelSeries GG (Engine) is running.\n"
+            "Tip: set env STEELSERIES_COREPROPS to the file path, or pass core_props_path explicitly."
+        )
+
+    # 2) 读取 API 地址与端口
+    with open(core_props_resolved, "r", encoding="utf-8") as f:
+        core_props = json.load(f)
+
+    address = core_props.get("address")
+    if not address:
+        raise ValueError(f"Could not find 'address' in coreProps.json at {core_props_resolved}")
+    return address, core_props_resolved
+
 
 class SteelSeriesLighting:
-    
-    REGIONS = {
-        "region1": list("qweasdzxc"),
-        "region2": list("rtyfghvbn"),
-        "region3": list("ujmikolp")
-    }
+
+    # 默认布局的区域（实例实际使用 self.layout，见 layout.py）
+    REGIONS = load_layout(DEFAULT_LAYOUT).regions
 
     ALL_OFF_EVENT = "__ALL_OFF__"
 
-    def __init__(self, game="MYAPP", core_props_path=None, retry_interval=5):
+    # 调色板模式：事件注册为 0-100，每种颜色占 PALETTE_LEVELS 个亮度档位，0 为熄灭
+    PALETTE_LEVELS = 10
+    PALETTE_SIZE = 9
+
+    # 心跳保活：GG 在 deinitialize_timer_length_ms 内收不到任何请求才会释放应用，
+    # 心跳间隔取该时长乘以安全系数；未注册时按 GG 默认的 15 秒计算
+    DEFAULT_DEINITIALIZE_MS = 15000
+    HEARTBEAT_SAFETY = 0.5
+
+    # 按事件分片的锁数量：同一事件的操作按顺序执行，不同事件大多可以并行
+    EVENT_LOCK_STRIPES = 64
+
+    def __init__(self, game="MYAPP", core_props_path=None, retry_interval=0.2, transport=None, pool_size=4, metrics=None,
+                 layout=None):
             """
             初始化 SteelSeries Lighting 控制器
 
             :param game: 游戏/应用标识符（字符串，必须唯一，例如 "MYAPP"）
             :param core_props_path: coreProps.json 的路径（优先使用此值；若为空将自动探测）
-            :param retry_interval: SteelSeries GG 未启动时的重试间隔（秒）
+            :param retry_interval: GG 不可用时后台探测的间隔（秒）；构造函数不会等待 GG
+            :param transport: HTTP 传输层（需实现 post/close）；默认使用连接池 PooledTransport
+            :param pool_size: 默认传输层的长连接池大小
+            :param metrics: 指标注册表（默认使用全局 metrics.REGISTRY）
+            :param layout: 键盘布局（Layout，或 layouts/ 中的名称/文件路径）；默认 qwerty
             """
-            # 1) 优先顺序：显式参数 > 环境变量 > 常见系统路径（GG/Engine 新旧版本）
-            candidates = [
-                core_props_path,
-                os.getenv("STEELSERIES_COREPROPS"),
-                r"C:\ProgramData\SteelSeries\SteelSeries Engine 3\coreProps.json",  # Windows (Engine 3)
-                r"C:\ProgramData\SteelSeries\SteelSeries GG\coreProps.json",       # Windows (GG)
-                "/Library/Application Support/SteelSeries Engine 3/coreProps.json", # macOS (Engine 3)
-                "/Library/Application Support/SteelSeries GG/coreProps.json",       # macOS (GG)
-                os.path.expanduser("~/.local/share/SteelSeries Engine 3/coreProps.json"),  # Linux (旧)
-                os.path.expanduser("~/.local/share/SteelSeries GG/coreProps.json"),        # Linux (GG)
-            ]
-
-            core_props_resolved = next((p for p in candidates if p and os.path.exists(p)), None)
-            if not core_props_resolved:
-                raise FileNotFoundError(
-                    "coreProps.json not found. Ensure SteelSeries GG (Engine) is running.\n"
-                    "Tip: set env STEELSERIES_COREPROPS to the file path, or pass core_props_path explicitly."
-                )
-
-            # 2) 读取 API 地址与端口
-            with open(core_props_resolved, "r", encoding="utf-8") as f:
-                core_props = json.load(f)
-
-            address = core_props.get("address")
-            if not address:
-                raise ValueError(f"Could not find 'address' in coreProps.json at {core_props_resolved}")
+            # 1)+2) 找到 coreProps.json 并读取 API 地址与端口；GG 尚未安装/启动时文件可能还不存在，
+            #       此时地址未知，由断路器的 _probe 在后台重新读取
+            try:
+                address, core_props_resolved = read_core_props(core_props_path)
+            except (OSError, ValueError) as e:
+                address, core_props_resolved = None, None
+                core_props_error = e
 
+            self._core_props_arg = core_props_path
+            self.core_props_path = core_props_resolved
             self.game = game
-            self.base_url = f"http://{address}"
-
-            # 3) 自检：等待 SteelSeries GG Engine 启动
-            while not self._health_check():
-                print(f"[WARN] SteelSeries GG not available at {self.base_url}, retrying in {retry_interval}s...")
-                time.sleep(retry_interval)
+            self.base_url = f"http://{address}" if address is not None else None
+            self.transport = transport if transport is not None else PooledTransport(pool_size=pool_size)
+            self.metrics = metrics if metrics is not None else REGISTRY
+            # 按键 -> 键位/区域 的预编译索引，区域点亮与服务端共用同一份
+            self.layout = layout if isinstance(layout, Layout) else load_layout(layout)
 
-            print(f"[INFO] Connected to SteelSeries GG at {self.base_url} (coreProps: {core_props_resolved})")
+            # 断路器：GG 不可用时快速失败，后台探测，恢复后重放注册/绑定（见 _replay）
+            self.breaker = CircuitBreaker(probe=self._probe, on_recover=self._replay, probe_interval=retry_interval)
             self._bound_events = set()   # 事件/按键 绑定缓存
-            # event -> (thread, stop_event)
-            self._event_threads = {}
-            self._ensure_all_off_event()
+            self._event_colors = {}      # event -> (zones, hex color) last bound
+            self._bindings = {}          # event -> canonical handlers JSON that GG currently has
+            # 锁分片：事件按哈希映射到其中一把锁（见 _event_lock）
+            self._event_locks = tuple(threading.RLock() for _ in range(self.EVENT_LOCK_STRIPES))
+            self._startup_lock = threading.Lock()
+            self._game_metadata = None
+            # 清单文件：记录已注册/绑定的事件，重启时跳过重复绑定（见 prime）
+            self.manifest_path = None
+            self._manifest_save_job = None
+            # event -> _Refresher, all driven by one scheduler worker thread
+            self._refreshers = {}
+            self._scheduler = Scheduler(after_batch=self._flush_refresh)
+            # event -> value queued by refreshers during the current scheduler tick
+            self._pending_values = {}
+            self._pending_lock = threading.Lock()
+            self.refresh_stats = {
+                "ticks": 0,             # flushes that sent at least one event
+                "events": 0,            # event updates sent by refreshers
+                "requests": 0,          # HTTP requests actually made for them
+                "requests_saved": 0,    # events - requests, over all ticks
+                "last_tick_saved": 0,
+                "batch_failures": 0,    # multiple_game_events calls that fell back
+            }
+            self.metrics.gauge("refreshers_active", lambda: len(self._refreshers))
+            self.metrics.gauge("scheduler_pending_jobs", self._scheduler.pending)
+            self.metrics.gauge("refresh", lambda: dict(self.refresh_stats))
+            # 调色板颜色（小写 hex，无 #）与已按 0-100 注册的事件
+            self.palette = []
+            self._palette_events = set()
+            self._palette_colors = {}    # event -> 按调色板绑定时指定的颜色（见 bound_value）
+            # 可选的整键盘帧缓冲（见 enable_compositor），启用后开/关灯只写缓冲
+            self.compositor = None
+            # 保活方式："refresh" 为每个亮着的事件每 interval 秒重发；"heartbeat" 见 enable_heartbeat
+            self.keepalive = "refresh"
+            self.heartbeat_safety = self.HEARTBEAT_SAFETY
+            self._heartbeat_job = None
+            self._last_post = 0.0        # monotonic time of the last successful GG call
+            self.metrics.gauge("gg_circuit", self.breaker.snapshot)
+            # 后台低优先级预绑定（见 warm）；_demand_at 为最近一次前台开/关灯的时间，预绑定只在空闲时进行
+            self._demand_at = 0.0
+            self._warmer = _Warmer(self)
+            self.metrics.gauge("warmer", self._warmer.snapshot)
+
+            # 3) 自检：GG 未启动时不阻塞，交给断路器在后台等待
+            if address is None:
+                logger.warning("SteelSeries GG address unknown (%s), retrying in the background every %ss...",
+                               str(core_props_error).splitlines()[0], retry_interval)
+                self.breaker.trip()
+            elif self._health_check():
+                logger.info("Connected to SteelSeries GG at %s (coreProps: %s)", self.base_url, core_props_resolved)
+                self._ensure_all_off_event()
+            else:
+                logger.warning("SteelSeries GG not available at %s, retrying in the background every %ss...",
+                               self.base_url, retry_interval)
+                self.breaker.trip()
 
 
-    def _post(self, endpoint, payload):
+    def _post(self, endpoint, payload=None, body=None, timeout=None):
         """
         发送 POST 请求到 SteelSeries GG API（增强版）
-        —— 自动转 JSON，若 GG 返回错误则打印详细信息
+        —— 经由 self.transport（长连接池）发送，若 GG 返回错误则打印详细信息
+
+        :param payload: 请求体对象（自动转 JSON）
+        :param body: 预先序列化好的请求体（提供时忽略 payload）
+        :param timeout: 单次调用的超时（秒，或 (connect, read) 元组）
         """
-        url = f"{self.base_url}/{str(endpoint).lstrip('/')}"
+        name = str(endpoint).lstrip('/')
+        # GG 不可用时直接失败（CircuitOpenError 是 requests.ConnectionError），不占用线程等待超时
+        self.breaker.check()
+        url = f"{self.base_url}/{name}"
+        start = time.perf_counter()
         try:
-            r = requests.post(url, json=payload, headers={"Content-Type": "application/json"})
+            r = self.transport.post(url, payload=payload, body=body, timeout=timeout)
             r.raise_for_status()
-        except requests.HTTPError as e:
-            # 打印返回体，帮助调试 400 错误（如字段无效、值过大、重复注册）
-            print(f"[HTTP {r.status_code}] POST {url}")
-            print(f"Request payload: {json.dumps(payload, indent=2)}")
-            print(f"Response text: {r.text}")
+        except requests.RequestException as e:
+            self.metrics.observe("gg_call", name, time.perf_counter() - start)
+            self.metrics.inc("gg_call_errors", name)
+            if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                # GG 已停止或挂起：累计失败，达到阈值后断路器打开
+                self.breaker.record_failure()
+            if not isinstance(e, requests.HTTPError):
+                raise
+            # 记录返回体，帮助调试 400 错误（如字段无效、值过大、重复注册）；同类错误按频率限流
+            logger.warning("GG returned HTTP %d for POST %s: %s (request: %.500s)", r.status_code, url, r.text[:500],
+                           body if body is not None else json.dumps(payload, separators=(",", ":")),
+                           extra={"fields": {"endpoint": name, "status": r.status_code}})
             raise
+        self.metrics.observe("gg_call", name, time.perf_counter() - start)
+        self.breaker.record_success()
+        # 任何成功的调用都会重置 GG 的 deinitialize 计时，心跳据此跳过
+        self._last_post = time.monotonic()
         return r.json() if r.text else {}
 
 
-    def _health_check(self):
+    def _health_check(self, timeout=1):
         """
         检测 SteelSeries GG API 是否可用
         方法：尝试发送一个临时的 game_metadata 请求
@@ -97,16 +216,61 @@ class SteelSeriesLighting:
                 "developer": "Checker",
                 "deinitialize_timer_length_ms": 1000
             }
-            r = requests.post(
-                f"{self.base_url}/game_metadata",
-                headers={"Content-Type": "application/json"},
-                data=json.dumps(payload),
-                timeout=1
-            )
+            r = self.transport.post(f"{self.base_url}/game_metadata", payload=payload, timeout=timeout)
             return r.status_code in (200, 204)  # API 正常响应
         except requests.RequestException:
             return False
 
+    def _probe(self):
+        """断路器探测：重新读取 coreProps.json（GG 重启后端口会变化）并做一次健康检查"""
+        try:
+            address, self.core_props_path = read_core_props(self._core_props_arg)
+        except (OSError, ValueError):
+            return False
+        self.base_url = f"http://{address}"
+        return self._health_check(timeout=(0.25, 0.5))
+
+    def _replay(self):
+        """
+        GG 恢复后重放全部状态：应用元数据、事件注册、绑定，以及正在刷新的事件数值
+
+        按事件并行（同 prime），任何一步失败都会抛出，由断路器继续探测后重试。
+        """
+        start = time.perf_counter()
+        if self._game_metadata is not None:
+            self._post("game_metadata", self._game_metadata)
+        bindings = dict(self._bindings)
+        events = set(self._bound_events) | set(bindings)
+
+        def replay_one(event):
+            if event in self._bound_events:
+                if event in self._palette_events:
+                    self.register_event(event, min_value=0, max_value=100)
+                else:
+                    self.register_event(event)
+            if event in bindings:
+                handlers = [json.loads(h) for h in json.loads(bindings[event])]
+                self._post("bind_game_event", {"game": self.game, "event": event, "handlers": handlers})
+
+        if events:
+            workers = getattr(self.transport, "pool_size", 4)
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(events))), thread_name_prefix="gg-replay") as pool:
+                for future in [pool.submit(replay_one, event) for event in events]:
+                    future.result()
+        self._ensure_all_off_event()
+        values = {event: refresher.value for event, refresher in list(self._refreshers.items())}
+        if values:
+            self.set_event_values(values)
+        if self.compositor is not None:
+            self.compositor.invalidate()
+        self._schedule_manifest_save()
+        self.metrics.observe("gg_replay", "", time.perf_counter() - start)
+        logger.info("Reconnected to SteelSeries GG at %s; replayed %d event(s)", self.base_url, len(events))
+
+    def wait_until_connected(self, timeout=None):
+        """阻塞直到 GG 可用（断路器关闭）；超时返回 False"""
+        return self.breaker.wait_closed(timeout)
+
     def register_game(self, display_name="My Python App", developer="Me", deinitialize_timer_length_ms: Optional[int] = None):
         """
         注册应用（告诉 GG 有一个新应用接入）
@@ -123,7 +287,9 @@ class SteelSeriesLighting:
         }
         if deinitialize_timer_length_ms is not None:
             payload["deinitialize_timer_length_ms"] = int(deinitialize_timer_length_ms)
-        return self._post("game_metadata", payload)
+        result = self._post("game_metadata", payload)
+        self._game_metadata = payload
+        return result
 
     def register_event(self, event, min_value=0, max_value=1, icon_id=1):
         """
@@ -153,23 +319,262 @@ class SteelSeriesLighting:
         :param hex_color: 十六进制颜色 "#RRGGBB"
         :return: API 响应
         """
-        # 转换 hex 颜色码为 RGB
-        hex_color = hex_color.lstrip("#")
-        r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+        return self.bind_zones_color(event, [key], hex_color)
 
-        payload = {
-            "game": self.game,
-            "event": event,
-            "handlers": [
-                {
-                    "device-type": "keyboard",
-                    "zone": key,
-                    "mode": "color",
-                    "color": {"red": r, "green": g, "blue": b}
+    def bind_zones_color(self, event, zones, hex_color):
+        """
+        一次性把多个键位绑定到同一事件、同一颜色
+
+        :param event: 事件名称
+        :param zones: 键位标识列表
+        :param hex_color: 十六进制颜色 "#RRGGBB"
+        :return: API 响应
+        """
+        # handlers、缓存键与序列化结果按 (键位, 颜色) 预先生成，命中缓存时不做任何构建
+        compiled = color_handlers(zones, hex_color)
+        with self._event_lock(event):
+            result = self._bind(event, compiled.key, handlers_json=compiled.json)
+            self._event_colors[event] = (tuple(zones), compiled.color)
+            self._palette_colors.pop(event, None)
+            return result
+
+    @staticmethod
+    def _color_handlers(zones, hex_color):
+        # 单色 handlers（副本，调用方可修改）
+        return list(color_handlers(zones, hex_color).handlers)
+
+    # handler 顺序与字段顺序不影响 GG 的结果，规范化后作为缓存键
+    _canonical_handlers = staticmethod(canonical_handlers)
+
+    def bind_handlers(self, event, handlers):
+        """
+        绑定事件的 handlers；与 GG 当前已有的绑定完全相同时不发请求
+
+        :param event: 事件名称
+        :param handlers: bind_game_event 的 handlers 列表
+        :return: API 响应（缓存命中时为 {}）
+        """
+        return self._bind(event, self._canonical_handlers(handlers), handlers=handlers)
+
+    def _bind(self, event, key, handlers=None, handlers_json=None):
+        """bind_game_event unless GG already has `key` for `event`; handlers_json is the pre-serialized handlers list."""
+        with self._event_lock(event):
+            if self._bindings.get(event) == key:
+                self.metrics.inc("binding_cache", "hit")
+                return {}
+            self.metrics.inc("binding_cache", "miss")
+            if handlers_json is not None:
+                body = f'{{"game":{json.dumps(self.game)},"event":{json.dumps(event)},"handlers":{handlers_json}}}'
+                payload = None
+            else:
+                body = None
+                payload = {
+                    "game": self.game,
+                    "event": event,
+                    "handlers": handlers
                 }
-            ]
-        }
-        return self._post("bind_game_event", payload)
+            try:
+                result = self._post("bind_game_event", payload, body=body)
+            except Exception:
+                # GG 端状态未知，下次必须重新绑定
+                self._bindings.pop(event, None)
+                raise
+            self._bindings[event] = key
+            self._schedule_manifest_save()
+            return result
+
+    def _event_lock(self, event):
+        """The lock stripe that serializes every operation on `event` (re-entrant)."""
+        return self._event_locks[hash(event) % len(self._event_locks)]
+
+    @contextlib.contextmanager
+    def _events_locked(self, events=None):
+        """Hold the stripes of all `events` (every stripe if None), always taken in stripe order."""
+        if events is None:
+            stripes = range(len(self._event_locks))
+        else:
+            stripes = sorted({hash(event) % len(self._event_locks) for event in events})
+        with contextlib.ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self._event_locks[stripe])
+            yield
+
+    def invalidate_bindings(self):
+        """清空注册/绑定缓存（删除应用后调用），之后的 ensure_*/bind_* 会重新发请求；GG 重启由断路器重放处理"""
+        self._bound_events.clear()
+        self._event_colors.clear()
+        self._bindings.clear()
+        self._palette_events.clear()
+        self._palette_colors.clear()
+        if self.compositor is not None:
+            self.compositor.invalidate()
+
+    def enable_compositor(self, fps=30, keepalive=1.0):
+        """
+        启用帧缓冲合成：之后 lights_on_key / lights_on_region / lights_off / apply_batch
+        只修改缓冲，由 Compositor 按固定帧率把变化的键位一次性发给 GG
+
+        :param fps: 每秒最多刷新帧数
+        :param keepalive: 亮着的键位重发间隔（秒）
+        :return: Compositor
+        """
+        if self.compositor is None:
+            self.compositor = Compositor(self, fps=fps, keepalive=keepalive).start()
+            self.metrics.gauge("compositor", lambda: dict(self.compositor.stats))
+        return self.compositor
+
+    def enable_heartbeat(self, safety=None):
+        """
+        启用心跳保活：亮着的事件不再每秒重发，只在状态变化时发送 game_event；
+        整个应用每个心跳周期最多发送一次 game_heartbeat（期间有其他调用则跳过）
+
+        心跳周期 = register_game 时的 deinitialize_timer_length_ms × safety。
+        合成模式下帧缓冲也不再按 keepalive 重发亮着的键位。
+
+        :param safety: 安全系数（0-1），默认 HEARTBEAT_SAFETY
+        :return: 心跳周期（秒）
+        """
+        if safety is not None:
+            self.heartbeat_safety = safety
+        self.keepalive = "heartbeat"
+        if self._heartbeat_job is None:
+            self._heartbeat_job = self._scheduler.call_later(self.heartbeat_interval(), self._heartbeat)
+        return self.heartbeat_interval()
+
+    def heartbeat_interval(self):
+        """心跳周期（秒），由已注册的 deinitialize_timer_length_ms 与安全系数决定"""
+        metadata = self._game_metadata or {}
+        deinitialize_ms = metadata.get("deinitialize_timer_length_ms", self.DEFAULT_DEINITIALIZE_MS)
+        return max(0.1, deinitialize_ms / 1000.0 * self.heartbeat_safety)
+
+    def send_heartbeat(self):
+        """
+        发送一次 game_heartbeat，重置 GG 的 deinitialize 计时（不改变任何灯光）
+
+        :return: API 响应
+        """
+        return self._post("game_heartbeat", {"game": self.game})
+
+    def _heartbeat(self):
+        # scheduler job: only send if nothing else reached GG within the last period
+        interval = self.heartbeat_interval()
+        idle = time.monotonic() - self._last_post
+        if idle >= interval * 0.95:
+            try:
+                self.send_heartbeat()
+                self.metrics.inc("heartbeat", "sent")
+            except requests.RequestException:
+                self.metrics.inc("heartbeat", "failed")
+            delay = interval
+        else:
+            self.metrics.inc("heartbeat", "skipped")
+            delay = interval - idle
+        self._heartbeat_job = self._scheduler.call_later(delay, self._heartbeat)
+
+    def set_palette(self, colors):
+        """
+        设置调色板：调色板内的颜色通过事件数值切换，无需重新 bind
+
+        每个事件只需按 0-100 注册并绑定一次值区间颜色（见 ensure_palette_bound），
+        之后换色、调亮度都只是一次 set_event_value。更换调色板会使这些绑定在下次使用时重绑。
+
+        :param colors: 十六进制颜色列表 "#RRGGBB"，最多 PALETTE_SIZE 个
+        """
+        palette = []
+        for color in colors:
+            color = str(color).lstrip("#").lower()
+            if len(color) != 6 or any(c not in "0123456789abcdef" for c in color):
+                raise ValueError(f"Invalid color '{color}'")
+            if color not in palette:
+                palette.append(color)
+        if len(palette) > self.PALETTE_SIZE:
+            raise ValueError(f"Palette holds at most {self.PALETTE_SIZE} colors")
+        self.palette = palette
+
+    def palette_value(self, hex_color, intensity=1.0):
+        """
+        颜色在调色板中对应的事件数值；不在调色板中时返回 None
+
+        :param hex_color: 十六进制颜色 "#RRGGBB"
+        :param intensity: 亮度 0-1（按 PALETTE_LEVELS 档取整，至少 1 档）
+        """
+        try:
+            slot = self.palette.index(str(hex_color).lstrip("#").lower())
+        except ValueError:
+            return None
+        level = max(1, min(self.PALETTE_LEVELS, round(float(intensity) * self.PALETTE_LEVELS)))
+        return slot * self.PALETTE_LEVELS + level
+
+    def _palette_handlers(self, zones):
+        ranges = []
+        for slot, color in enumerate(self.palette):
+            r, g, b = tuple(int(color[i:i+2], 16) for i in (0, 2, 4))
+            for level in range(1, self.PALETTE_LEVELS + 1):
+                value = slot * self.PALETTE_LEVELS + level
+                ranges.append({
+                    "low": value,
+                    "high": value,
+                    "color": {
+                        "red": r * level // self.PALETTE_LEVELS,
+                        "green": g * level // self.PALETTE_LEVELS,
+                        "blue": b * level // self.PALETTE_LEVELS,
+                    },
+                })
+        return [
+            {"device-type": "keyboard", "zone": zone, "mode": "color", "color": ranges}
+            for zone in zones
+        ]
+
+    def ensure_palette_bound(self, event, zones, hex_color=None):
+        """
+        确保事件按 0-100 注册并绑定到当前调色板（每个事件、每个调色板只绑定一次）
+
+        :param event: 事件名称
+        :param zones: 键位标识列表
+        :param hex_color: 事件的颜色（调色板中的颜色）；记录后不指定颜色的点亮使用它（见 bound_value）
+        """
+        with self._event_lock(event):
+            if hex_color is not None:
+                self._palette_colors[event] = hex_color
+            signature = (tuple(zones), "palette:" + "-".join(self.palette))
+            if self._event_colors.get(event) == signature and event in self._bindings:
+                self.metrics.inc("binding_cache", "hit")
+                return
+            if event not in self._palette_events:
+                self.register_event(event, min_value=0, max_value=100)
+                self._palette_events.add(event)
+                self._bound_events.add(event)
+            self.bind_handlers(event, self._palette_handlers(zones))
+            self._event_colors[event] = signature
+
+    def bound_value(self, event):
+        """
+        不指定颜色点亮事件时发送的数值：按调色板绑定的事件为其颜色对应的数值（值 1 只是第 0 色的 10% 亮度），
+        其余事件为 1（颜色已由 bind 决定）
+
+        :param event: 事件名称
+        """
+        color = self._palette_colors.get(event)
+        value = self.palette_value(color) if color is not None else None
+        return value if value is not None else 1
+
+    def set_event_color(self, event, hex_color, intensity=1.0):
+        """
+        调色板事件换色/调亮度：只发送一次 set_event_value，并更新正在刷新的数值
+
+        :param event: 已通过 ensure_palette_bound 绑定的事件
+        :param hex_color: 调色板中的颜色
+        :param intensity: 亮度 0-1
+        """
+        with self._event_lock(event):
+            value = self.palette_value(hex_color, intensity)
+            if value is None:
+                raise ValueError(f"Color '{hex_color}' is not in the palette")
+            self._palette_colors[event] = hex_color
+            refresher = self._refreshers.get(event)
+            if refresher is not None:
+                refresher.value = value
+            return self.set_event_value(event, value)
 
     def set_event_value(self, event, value=1):
         """
@@ -181,19 +586,47 @@ class SteelSeriesLighting:
         """
         payload = {"game": self.game, "event": event, "data": {"value": value}}
         return self._post("game_event", payload)
+
+    def set_event_values(self, values):
+        """
+        一次请求触发多个事件（multiple_game_events）
+
+        :param values: {事件名称: 数值}
+        :return: API 响应
+        """
+        payload = {
+            "game": self.game,
+            "events": [{"event": event, "data": {"value": value}} for event, value in values.items()]
+        }
+        return self._post("multiple_game_events", payload)
     
     def ensure_key_bound(self, event, key, hex_color):
         """
-        确保事件与按键绑定，仅在第一次使用时注册/绑定，避免闪烁
+        确保事件与按键绑定，仅在第一次使用时注册/绑定，避免闪烁（按需绑定）
+
+        同一事件的并发首次请求都在该事件的锁上等待同一次注册/绑定完成，之后直接命中缓存。
 
         :param event: 事件名称
         :param key: 键位标识
         :param hex_color: 十六进制颜色 "#RRGGBB"
         """
-        if event not in self._bound_events:
-            self.register_event(event)
+        with self._event_lock(event):
+            if event not in self._bound_events:
+                self.register_event(event)
+                self._bound_events.add(event)
             self.bind_key_color(event, key, hex_color)
-            self._bound_events.add(event)
+
+    def ensure_event_registered(self, event):
+        """
+        确保事件已注册（不绑定颜色），已注册则不发请求
+
+        :param event: 事件名称
+        """
+        with self._event_lock(event):
+            if event not in self._bound_events:
+                self.register_event(event)
+                self._bound_events.add(event)
+                self._schedule_manifest_save()
 
     def lights_on_key(self, event, key, hex_color="#FFFFFF", interval=1, duration=3600):
         """
@@ -201,136 +634,857 @@ class SteelSeriesLighting:
         如果 duration 为 None -> 无限刷新直到调用 lights_off()。
         返回前不会阻塞主线程。
         """
-        self.ensure_key_bound(event, key, hex_color)
-        # ensure any existing refresher for this event is stopped
-        self._stop_event_refresher(event)
-        # start background refresher
-        self._start_event_refresher(event, interval=interval, duration=duration)
+        self._demand_at = time.monotonic()
+        with self._event_lock(event):
+            if self.compositor is not None:
+                self.compositor.paint(event, "key", [key], hex_color, duration)
+                return
+            # 颜色在调色板中：只需设置数值，不再 bind
+            value = self.palette_value(hex_color)
+            if value is not None:
+                self.ensure_palette_bound(event, [key], hex_color)
+            else:
+                self.ensure_key_bound(event, key, hex_color)
+                value = 1
+            # start background refresher (supersedes any existing refresher for this event)
+            self._start_event_refresher(event, interval=interval, duration=duration, value=value)
 
     def lights_on_region(self, event, key, hex_color="#FFFFFF", interval=1, duration=3600):
         """
         区域点亮：输入区域内任意 key，点亮整个区域
         结束后自动执行 lights_off()
         """
-        # 找到这个 key 属于哪个区域
-        region = None
-        for name, keys in self.REGIONS.items():
-            if key in keys:
-                region = keys
-                break
+        self._demand_at = time.monotonic()
+        # 找到这个 key 属于哪个区域（布局预编译的索引，一次查表）
+        region = self.layout.region_keys(key)
         if not region:
             raise ValueError(f"Key '{key}' not in any region")
 
-        self.register_event(event)
+        if self.compositor is not None:
+            self.compositor.paint(event, "region", region, hex_color, duration)
+            return
 
-        # 转换 hex 颜色码为 RGB
-        hex_color = hex_color.lstrip("#")
-        r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+        with self._event_lock(event):
+            value = self.palette_value(hex_color)
+            if value is not None:
+                self.ensure_palette_bound(event, region, hex_color)
+            else:
+                self.ensure_event_registered(event)
+                # 一次性绑定整个区域（与已有绑定相同则跳过）
+                self.bind_zones_color(event, region, hex_color)
+                value = 1
 
-        # 一次性绑定整个区域
-        handlers = []
-        for k in region:
-            handlers.append({
-                "device-type": "keyboard",
-                "zone": k,
-                "mode": "color",
-                "color": {"red": r, "green": g, "blue": b}
-            })
+            # start background refresher for region (non-blocking); it supersedes any existing one
+            # when duration is provided the refresher will stop after duration; if None, it runs until lights_off()
+            self._start_event_refresher(event, interval=interval, duration=duration, value=value,
+                                        on_finish=(self.lights_off if duration is not None else None))
 
-        payload = {
-            "game": self.game,
-            "event": event,
-            "handlers": handlers
-        }
-        self._post("bind_game_event", payload)
+    def light_event(self, event, interval=1, duration=None):
+        """
+        点亮已绑定好颜色的事件（不重新 bind），由后台刷新保持亮着
 
-        # start background refresher for region (non-blocking)
-        # stop any existing refresher for this event first
-        self._stop_event_refresher(event)
-        # when duration is provided the refresher will stop after duration; if None, it runs until lights_off()
-        self._start_event_refresher(event, interval=interval, duration=duration, on_finish=(self.lights_off if duration is not None else None))
+        :param event: 事件名称
+        :param interval: 刷新间隔（秒）
+        :param duration: 持续秒数，None 表示直到关闭
+        """
+        self._demand_at = time.monotonic()
+        with self._event_lock(event):
+            self._start_event_refresher(event, interval=interval, duration=duration, value=self.bound_value(event))
+
+    def lights_off_event(self, event):
+        """
+        熄灭单个事件（按键或区域）：停止其刷新并置 0
+
+        :param event: 事件名称
+        """
+        self._demand_at = time.monotonic()
+        with self._event_lock(event):
+            if self.compositor is not None:
+                self.compositor.clear(event)
+                return
+            self._stop_event_refresher(event)
+            # 从未注册/绑定的事件不可能亮着；发送 0 只会让 GG 隐式创建一个没有绑定的事件
+            if event not in self._bound_events and event not in self._bindings:
+                return
+            self.set_event_value(event, 0)
+
+    def apply_batch(self, ops):
+        """
+        按顺序应用一组开/关操作，并合并为尽量少的 GG 调用
+
+        同一事件的多个操作只保留最后一个（例如 on→off→on 只执行最后的 on），
+        颜色未变化的事件不会重新 bind；所有开/关值通过一次
+        multiple_game_events 发送。批次持有其涉及事件的分片锁，同一事件的操作不会与
+        其他批次交错，不相关事件的批次可以并行。
+
+        :param ops: 操作列表，每项为 dict：
+            event    - 事件名称
+            action   - "on" 或 "off"
+            zones    - （on）要绑定的键位列表；省略则沿用已有绑定
+            color    - （on）十六进制颜色，默认 "#FFFFFF"
+            duration - （on）持续秒数，None 表示直到关闭
+            interval - （on）刷新间隔，默认 1
+            intensity - （on，调色板颜色）亮度 0-1，默认 1
+            layer    - （on，仅合成模式）绘制图层，默认单键为 "key"、多键为 "region"
+        :return: 与 ops 一一对应的结果列表 {"event", "action", "status"[, "error"]}，
+                 status 为 "ok" / "coalesced" / "error"
+        """
+        self._demand_at = time.monotonic()
+        results = [{"event": op.get("event"), "action": op.get("action"), "status": "coalesced"} for op in ops]
+        last = {}
+        for i, op in enumerate(ops):
+            last[op.get("event")] = i
+
+        if self.compositor is not None:
+            for event, i in last.items():
+                op = ops[i]
+                try:
+                    if op.get("action") == "on":
+                        zones = op.get("zones") or []
+                        layer = op.get("layer") or ("key" if len(zones) == 1 else "region")
+                        self.compositor.paint(event, layer, zones, op.get("color", "#FFFFFF"), op.get("duration"))
+                    elif op.get("action") == "off":
+                        self.compositor.clear(event)
+                    else:
+                        raise ValueError(f"Unknown action '{op.get('action')}'")
+                    results[i]["status"] = "ok"
+                except Exception as e:
+                    results[i]["status"] = "error"
+                    results[i]["error"] = str(e)
+            return results
+
+        with self._events_locked(last):
+            values = {}
+            lit = []
+            for event, i in last.items():
+                op = ops[i]
+                action = op.get("action")
+                try:
+                    if action == "on":
+                        value = self._prepare_on(event, op)
+                        values[event] = value
+                        lit.append((event, op))
+                    elif action == "off":
+                        self._stop_event_refresher(event)
+                        # 与 lights_off_event 相同：从未注册/绑定的事件不可能亮着，不发送 0
+                        if event in self._bound_events or event in self._bindings:
+                            values[event] = 0
+                    else:
+                        raise ValueError(f"Unknown action '{action}'")
+                    results[i]["status"] = "ok"
+                except Exception as e:
+                    results[i]["status"] = "error"
+                    results[i]["error"] = str(e)
+
+            try:
+                if len(values) == 1:
+                    self.set_event_value(*next(iter(values.items())))
+                elif values:
+                    self.set_event_values(values)
+            except Exception as e:
+                for result in results:
+                    if result["status"] == "ok":
+                        result["status"] = "error"
+                        result["error"] = str(e)
+                return results
+
+            # already lit by the batch call above; refreshers only keep them alive
+            for event, op in lit:
+                self._start_event_refresher(
+                    event,
+                    interval=op.get("interval", 1),
+                    duration=op.get("duration"),
+                    lit=True,
+                    value=values[event],
+                )
+        return results
+
+    def _prepare_on(self, event, op):
+        """Register/bind `event` for an apply_batch "on" op and return the value that lights it."""
+        zones = op.get("zones")
+        color = op.get("color", "#FFFFFF")
+        value = self.palette_value(color, op.get("intensity", 1.0)) if zones else None
+        if value is not None:
+            self.ensure_palette_bound(event, zones, color)
+            return value
+        self.ensure_event_registered(event)
+        if not zones:
+            # 沿用已有绑定：调色板事件需发送其颜色对应的数值
+            return self.bound_value(event)
+        self.bind_zones_color(event, zones, color)
+        return 1
+
+    def prebind(self, ops):
+        """
+        预先完成 apply_batch "on" 操作所需的注册/绑定（不点亮），
+        之后真正点亮时只剩一次 set_event_value(s)
+
+        每个操作单独持锁，不会长时间阻塞正在进行的批次；合成模式下无需绑定，直接返回。
+
+        :param ops: apply_batch 格式的操作列表（非 "on" 操作被忽略）
+        :return: 出错的事件 {事件名称: 错误信息}
+        """
+        errors = {}
+        if self.compositor is not None:
+            return errors
+        for op in ops:
+            if op.get("action") != "on":
+                continue
+            try:
+                with self._event_lock(op["event"]):
+                    self._prepare_on(op["event"], op)
+            except Exception as e:
+                errors[op.get("event")] = str(e)
+        return errors
+
+    def warm(self, ops, priority=0):
+        """
+        后台低优先级预绑定：把之后可能用到的事件提前注册/绑定，首次点亮时不必等待
+
+        只在最近 idle 秒内没有前台开/关灯时逐个绑定，已注册并绑定过的事件直接跳过
+        （不会覆盖其现有颜色）。重复提交同一事件时保留更高的优先级。
+
+        :param ops: apply_batch 格式的 "on" 操作，越可能先用到越靠前
+        :param priority: 第一个操作的优先级（越小越先绑定），之后依次加 1
+        :return: 仍在排队的事件数
+        """
+        self._warmer.submit(ops, priority)
+        return self._warmer.pending()
 
     def lights_off(self):
         """
-        熄灭所有键（无闪烁版）：只触发已预绑定的全黑事件
+        熄灭所有键（无闪烁版）：取消全部后台刷新，并通过一次批量请求
+        把仍亮着的事件置 0、同时触发已预绑定的全黑事件
+
+        不等待任何线程，GG 调用次数与当前亮着的键数量无关
         """
+        if self.compositor is not None:
+            self.compositor.clear_all()
+            return
         # 确保已完成一次性预绑定（容错)
         self._ensure_all_off_event()
-        # stop all background refreshers first
-        for event in list(self._event_threads.keys()):
-            self._stop_event_refresher(event)
-        # 仅触发事件，不再重新 bind
-        self._post("game_event", {"game": self.game, "event": self.ALL_OFF_EVENT, "data": {"value": 1}})
-        print("[INFO] All keys lights off (no-flash)")
-
+        with self._events_locked():
+            # cancel every refresher at once; superseded stops skip the per-event value 0 and on_finish
+            refreshers, self._refreshers = self._refreshers, {}
+            for refresher in refreshers.values():
+                refresher.stop(superseded=True)
+            with self._pending_lock:
+                self._pending_values.clear()
+            values = dict.fromkeys(refreshers, 0)
+            # 仅触发事件，不再重新 bind
+            values[self.ALL_OFF_EVENT] = 1
+            if len(values) == 1:
+                self.set_event_value(self.ALL_OFF_EVENT, 1)
+            else:
+                self.set_event_values(values)
+        logger.debug("All keys lights off (no-flash)")
 
     def remove_game(self):
-        return self._post("remove_game", {"game": self.game})
-    
+        result = self._post("remove_game", {"game": self.game})
+        # GG 已丢弃该应用的全部事件与绑定，本地缓存随之失效
+        self.invalidate_bindings()
+        self._schedule_manifest_save()
+        return result
+
     def _ensure_all_off_event(self):
         """只在第一次把 ALL_OFF_EVENT 绑定到全键黑色，后续仅触发 event 即可"""
         if self.ALL_OFF_EVENT in self._bound_events:
             return
-        # 注册事件
-        self.register_event(self.ALL_OFF_EVENT)
-        # 绑定全键黑色
-        payload = {
-            "game": self.game,
-            "event": self.ALL_OFF_EVENT,
-            "handlers": [{
-                "device-type": "keyboard",
-                "zone": "all",
-                "mode": "color",
-                "color": {"red": 0, "green": 0, "blue": 0}
-            }]
-        }
-        self._post("bind_game_event", payload)
-        self._bound_events.add(self.ALL_OFF_EVENT)
+        # 注册事件，并绑定全键黑色
+        self.ensure_event_registered(self.ALL_OFF_EVENT)
+        self.bind_zones_color(self.ALL_OFF_EVENT, ["all"], "#000000")
+
+    def prime_startup(self, plan, manifest_path=None, display_name="My Python App", developer="Me",
+                      deinitialize_timer_length_ms: Optional[int] = None):
+        """
+        启动预热：读取清单、（冷启动时）删除旧应用、注册应用、并发预热 plan、写回清单
+
+        多个调用方（例如多个 HTTP 进程经由 lighting_daemon）会依次执行；清单写入后，
+        后来者走热启动路径，几乎不发请求。
+
+        :param plan: 见 prime()
+        :param manifest_path: 清单文件路径；None 表示不使用清单（总是冷启动）
+        :return: prime() 的结果，另加 "warm": 是否为热启动
+        """
+        with self._startup_lock:
+            known = self.load_manifest(manifest_path) if manifest_path else None
+            if known is None:
+                # 冷启动：清除 GG 中该应用的残留事件与绑定
+                try:
+                    self.remove_game()
+                except Exception:
+                    pass
+            self.register_game(display_name, developer, deinitialize_timer_length_ms=deinitialize_timer_length_ms)
+            if manifest_path:
+                self.manifest_path = manifest_path
+            result = self.prime(plan, known=known)
+            self.save_manifest()
+            result["warm"] = known is not None
+            return result
+
+    def prime(self, plan, known=None, workers=None):
+        """
+        并发预热：注册（并可选绑定）一组事件
+
+        同一事件内先注册后绑定，不同事件之间并行执行。known 中与计划完全一致的
+        事件视为 GG 已有，直接记入本地缓存而不发请求（热重启）。
+
+        :param plan: [(event, zones, hex_color)]；zones 为 None 表示只注册不绑定
+        :param known: load_manifest() 返回的 {event: {"zones", "color"}}，可为 None
+        :param workers: 并发线程数，默认等于传输层连接池大小
+        :return: {"primed": 数量, "skipped": 数量, "failed": {event: 错误信息}}
+        """
+        known = known or {}
+        todo = []
+        skipped = 0
+        for event, zones, hex_color in plan:
+            entry = self._manifest_entry(zones, hex_color)
+            if known.get(event) == entry:
+                self._bound_events.add(event)
+                if zones is not None:
+                    self._event_colors[event] = (tuple(zones), entry["color"])
+                    self._bindings[event] = color_handlers(zones, entry["color"]).key
+                skipped += 1
+            else:
+                todo.append((event, zones, hex_color))
+
+        def prime_one(event, zones, hex_color):
+            self.register_event(event)
+            if zones is not None:
+                self.bind_zones_color(event, zones, hex_color)
+            self._bound_events.add(event)
+
+        failed = {}
+        if workers is None:
+            workers = getattr(self.transport, "pool_size", 4)
+        if todo:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(todo))), thread_name_prefix="gg-prime") as pool:
+                futures = {pool.submit(prime_one, *item): item[0] for item in todo}
+                for future in as_completed(futures):
+                    error = future.exception()
+                    if error is not None:
+                        failed[futures[future]] = str(error)
+        self._schedule_manifest_save()
+        return {"primed": len(todo) - len(failed), "skipped": skipped, "failed": failed}
+
+    @staticmethod
+    def _manifest_entry(zones, hex_color):
+        if zones is None:
+            return {"zones": None, "color": None}
+        return {"zones": list(zones), "color": hex_color.lstrip("#").lower()}
+
+    def load_manifest(self, path):
+        """
+        读取清单文件；仅当它属于同一应用、同一 GG 地址时返回 {event: entry}，否则返回 None
+        （GG 重启后端口会变化，旧清单即失效）
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("game") != self.game or manifest.get("address") != self.base_url:
+            return None
+        return manifest.get("events") or {}
+
+    def save_manifest(self, path=None):
+        """把当前已注册/绑定的事件写入清单文件（原子替换）"""
+        path = path or self.manifest_path
+        if not path:
+            return
+        events = {}
+        for event in list(self._bound_events):
+            zones, color = self._event_colors.get(event, (None, None))
+            events[event] = {"zones": list(zones) if zones is not None else None, "color": color}
+        manifest = {"game": self.game, "address": self.base_url, "events": events}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def _schedule_manifest_save(self, delay=2.0):
+        """绑定变化后延迟写清单（合并短时间内的多次变化，写文件在调度线程上进行）"""
+        if not self.manifest_path or self._manifest_save_job is not None:
+            return
 
-    def _start_event_refresher(self, event, interval=1, duration=None, on_finish=None):
-        """Start a background thread that repeatedly sets event value to 1.
+        def save():
+            self._manifest_save_job = None
+            try:
+                self.save_manifest()
+            except OSError as e:
+                logger.warning("Could not write manifest %s: %s", self.manifest_path, e)
+
+        self._manifest_save_job = self._scheduler.call_later(delay, save)
+
+    def _start_event_refresher(self, event, interval=1, duration=None, on_finish=None, lit=False, value=1):
+        """Schedule a refresher that repeatedly sets event value to `value` (1 unless a palette value).
         If duration is None, it runs until _stop_event_refresher is called.
         on_finish (callable) is invoked after the refresher exits (if provided).
+        lit=True means the caller already sent the value, so the first tick is skipped.
+        An existing refresher for `event` is superseded: it stops without sending
+        value 0 or calling its on_finish, since the new refresher now owns the event.
+        All refreshers share the single scheduler worker; no thread is started per event.
         """
-        stop_evt = threading.Event()
+        with self._event_lock(event):
+            refresher = _Refresher(self, event, interval, duration, on_finish, value)
+            previous = self._refreshers.get(event)
+            self._refreshers[event] = refresher
+            if previous is not None:
+                previous.stop(superseded=True)
+            # a value the previous refresher queued (e.g. its final 0) must not override the new state
+            with self._pending_lock:
+                self._pending_values.pop(event, None)
+            refresher.start(lit=lit)
+
+    def _stop_event_refresher(self, event):
+        """Stop and remove the refresher for `event` if present (does not block)."""
+        with self._event_lock(event):
+            refresher = self._refreshers.pop(event, None)
+            if refresher:
+                refresher.stop()
+                # drop a keep-alive queued this tick so it cannot relight the key after the caller turns it off
+                with self._pending_lock:
+                    self._pending_values.pop(event, None)
+
+    def _queue_event_value(self, event, value):
+        """Buffer a refresher update; sent by _flush_refresh at the end of the scheduler tick."""
+        with self._pending_lock:
+            self._pending_values[event] = value
 
-        def worker():
-            start = time.time()
+    def _flush_refresh(self):
+        """Send every update queued in this tick as one multiple_game_events POST.
+        Falls back to one game_event per event if the batch call fails.
+        """
+        with self._pending_lock:
+            events = list(self._pending_values)
+        if not events:
+            return
+        # hold the events' stripes while sending, so an on/off issued meanwhile for one of them
+        # reaches GG after this value instead of being overwritten by it
+        with self._events_locked(events):
+            with self._pending_lock:
+                values = {event: self._pending_values.pop(event) for event in events if event in self._pending_values}
+            if values:
+                self._send_refresh(values)
+
+    def _send_refresh(self, values):
+        requests_made = 1
+        if len(values) == 1:
+            event, value = next(iter(values.items()))
             try:
-                while not stop_evt.is_set():
-                    self.set_event_value(event, 1)
-                    # debug log
-                    print(f"[INFO] Event '{event}' refreshed, keeping light alive...")
-                    # check duration
-                    if duration is not None and (time.time() - start) >= duration:
-                        break
-                    time.sleep(interval)
-            finally:
-                # if duration was specified we should turn off the event
-                if duration is not None:
-                    try:
-                        self.set_event_value(event, 0)
-                    except Exception:
-                        pass
-                if callable(on_finish):
+                self.set_event_value(event, value)
+            except Exception:
+                pass
+        else:
+            try:
+                self.set_event_values(values)
+            except Exception:
+                self.refresh_stats["batch_failures"] += 1
+                requests_made += len(values)
+                for event, value in values.items():
                     try:
-                        on_finish()
+                        self.set_event_value(event, value)
                     except Exception:
                         pass
+        saved = len(values) - requests_made
+        stats = self.refresh_stats
+        stats["ticks"] += 1
+        stats["events"] += len(values)
+        stats["requests"] += requests_made
+        stats["requests_saved"] += saved
+        stats["last_tick_saved"] = saved
+        # runs every tick: only a level check unless DEBUG, and then one record per 60 ticks, written off-thread
+        logger.debug("Refreshed %d event(s) in %d request(s)", len(values), requests_made, extra={"sample": 60})
 
-        t = threading.Thread(target=worker, daemon=True)
-        self._event_threads[event] = (t, stop_evt)
-        t.start()
 
-    def _stop_event_refresher(self, event):
-        """Stop and remove the background refresher for `event` if present."""
-        entry = self._event_threads.pop(event, None)
-        if not entry:
+class _Refresher:
+    """
+    Keeps one event lit on the shared scheduler.
+
+    Mirrors the old per-event thread: `value` (1, or a palette value) is re-sent every `interval`
+    seconds; when its duration elapses a timed refresher sends value 0 (a
+    stopped one leaves that to whoever stopped it), and `on_finish` is
+    called in either case.
+
+    Only the first tick is immediate; later ticks are aligned to multiples of
+    `interval` on the monotonic clock, so refreshers with the same interval
+    come due together and are flushed as one batch.
+    """
+
+    def __init__(self, lighting, event, interval, duration, on_finish, value=1):
+        self.lighting = lighting
+        self.event = event
+        self.interval = interval
+        self.duration = duration
+        self.on_finish = on_finish
+        self.value = value
+        self._job = None
+        self._done = False
+        self._ticked = False
+        self._lock = threading.Lock()
+
+    def start(self, lit=False):
+        self._start = time.monotonic()
+        self._end = self._start + self.duration if self.duration is not None else None
+        first = self._start
+        if lit and self.lighting.keepalive == "heartbeat":
+            # nothing to re-send; only a timed refresher needs a job, to turn the event off
+            self._ticked = True
+            if self._end is not None:
+                self._job = self.lighting._scheduler.call_at(self._end, self._tick)
+            return
+        if lit:
+            self._ticked = True
+            first = (math.floor(self._start / self.interval) + 1) * self.interval
+            if self._end is not None:
+                first = min(first, self._end)
+        self._job = self.lighting._scheduler.call_at(first, self._tick)
+
+    def stop(self, superseded=False):
+        with self._lock:
+            if self._done:
+                return
+            self._done = True
+            self.lighting._scheduler.cancel(self._job)
+        if superseded:
+            return
+        # on_finish still runs on the worker, after any tick already queued
+        self.lighting._scheduler.call_soon(self._finish)
+
+    def _tick(self):
+        with self._lock:
+            if self._done:
+                return
+            # how late the scheduler ran this tick (jobs may run up to the coalesce window early)
+            self.lighting.metrics.observe("refresher_tick_drift", "", max(0.0, time.monotonic() - self._job.deadline))
+            # like the old thread loop, light at least once even for a zero duration
+            if self._ticked and self._end is not None and self._job.deadline >= self._end:
+                self._done = True
+                expired = True
+            else:
+                expired = False
+            self._ticked = True
+            if not expired:
+                # queued under the lock: once stop() returns, no stale value can follow it
+                self.lighting._queue_event_value(self.event, self.value)
+        if expired:
+            self._finish()
+            return
+        if self.lighting.keepalive == "heartbeat":
+            # the game heartbeat keeps the value alive; wake up again only to end a timed refresher
+            if self._end is None:
+                return
+            next_at = self._end
+        else:
+            # next tick on the shared grid (no drift), never after the end
+            next_at = (math.floor(self._job.deadline / self.interval + 1e-9) + 1) * self.interval
+            if self._end is not None:
+                next_at = min(next_at, self._end)
+        with self._lock:
+            if not self._done:
+                self._job = self.lighting._scheduler.call_at(next_at, self._tick)
+
+    def _finish(self):
+        with self.lighting._event_lock(self.event):
+            refreshers = self.lighting._refreshers
+            # a stopped refresher was already removed by its caller, which sends value 0 itself;
+            # a later refresher for the event owns it now, so a stale 0 must not be queued
+            if refreshers.get(self.event) is self:
+                refreshers.pop(self.event, None)
+                # if duration was specified we should turn off the event
+                if self.duration is not None:
+                    self.lighting._queue_event_value(self.event, 0)
+        if callable(self.on_finish):
+            try:
+                self.on_finish()
+            except Exception:
+                pass
+
+
+class _Warmer:
+    """
+    Low-priority background binder behind `SteelSeriesLighting.warm`.
+
+    Ops wait in a heap ordered by priority. One worker thread (started on
+    the first submit) registers and binds one op at a time, only once no
+    foreground lighting call has happened for `idle` seconds, and sleeps
+    `pause` seconds between binds, so it never competes with keystrokes for
+    GG or the event locks. An event that is already bound (on demand, or
+    with another color) is skipped under its lock, so warming never changes
+    a color that is in use. While GG is down the worker waits for it.
+    """
+
+    def __init__(self, lighting, idle=0.25, pause=0.02):
+        self.lighting = lighting
+        self.idle = idle
+        self.pause = pause
+        self._heap = []        # (priority, seq, op)
+        self._queued = {}      # event -> priority of its live heap entry
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {"warmed": 0, "skipped": 0, "failed": 0}
+
+    def submit(self, ops, priority=0):
+        with self._cond:
+            for rank, op in enumerate(ops, priority):
+                event = op.get("event")
+                if op.get("action", "on") != "on" or not op.get("zones"):
+                    continue
+                if event in self._queued and self._queued[event] <= rank:
+                    continue
+                self._queued[event] = rank
+                heapq.heappush(self._heap, (rank, next(self._seq), op))
+            if self._thread is None and self._heap:
+                self._thread = threading.Thread(target=self._run, name="lighting-warmer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._queued)
+
+    def snapshot(self):
+        return dict(self.stats, pending=self.pending())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._heap)
+            quiet = time.monotonic() - self.lighting._demand_at
+            if quiet < self.idle:
+                time.sleep(self.idle - quiet)
+                continue
+            with self._cond:
+                rank, _, op = heapq.heappop(self._heap)
+                if self._queued.get(op["event"]) != rank:
+                    continue  # replaced by a higher-priority submit
+                del self._queued[op["event"]]
+            self._warm_one(rank, op)
+            time.sleep(self.pause)
+
+    def _warm_one(self, rank, op):
+        lighting = self.lighting
+        event = op["event"]
+        if lighting.compositor is not None:
+            # frame buffer zones are bound by the compositor itself
+            self.stats["skipped"] += 1
+            return
+        try:
+            with lighting._event_lock(event):
+                if event in lighting._bound_events and event in lighting._bindings:
+                    self.stats["skipped"] += 1
+                    return
+                lighting._prepare_on(event, op)
+            self.stats["warmed"] += 1
+            lighting.metrics.inc("warmer", "warmed")
+        except requests.ConnectionError:
+            # GG went away: put the op back and wait for the breaker to see it return
+            self.submit([op], rank)
+            lighting.wait_until_connected()
+        except Exception as e:
+            self.stats["failed"] += 1
+            lighting.metrics.inc("warmer", "failed")
+            logger.warning("Failed to pre-bind %s: %s", event, e)
+
+
+class Compositor:
+    """
+    Whole-keyboard frame buffer flushed to GG at a fixed frame rate.
+
+    Each zone has one pixel per layer (packed 0xRRGGBB in an `array`, -1 for
+    transparent); the visible color is the topmost opaque layer, black if
+    none. Writers paint or clear zones on behalf of an owner (normally the
+    event name they used to light), which only ever clears its own pixels.
+
+    Every zone gets its own `ZONE_<zone>` event bound once in context-color
+    mode, so a color change is a frame value rather than a rebind. A flush
+    sends every zone whose visible color changed since the last frame in one
+    multiple_game_events call; lit zones are re-sent every `keepalive`
+    seconds instead of running a refresher per event. GG traffic is
+    therefore bounded by `fps`, however many writes arrive in between.
+    """
+
+    LAYERS = ("base", "region", "key", "effect")
+    FRAME_KEY = "zone-color"
+
+    def __init__(self, lighting, fps=30, keepalive=1.0):
+        self.lighting = lighting
+        self.fps = fps
+        self.keepalive = keepalive
+        self._lock = threading.Lock()
+        self._zones = []                # index -> zone
+        self._index = {}                # zone -> index
+        self._pixels = [array("l") for _ in self.LAYERS]
+        self._owners = [[] for _ in self.LAYERS]
+        self._visible = array("l")      # composited color per zone
+        self._sent = array("l")         # color GG last got per zone (-1 = never sent)
+        self._dirty = set()
+        self._expiry = {}               # owner -> scheduler job clearing it
+        self._frame_job = None
+        self._keepalive_job = None
+        self._bound = set()             # zone events already bound in context-color mode
+        self.stats = {"frames": 0, "zones_sent": 0, "writes": 0, "failures": 0}
+
+    def _zone_index(self, zone):
+        index = self._index.get(zone)
+        if index is None:
+            index = self._index[zone] = len(self._zones)
+            self._zones.append(zone)
+            for layer in range(len(self.LAYERS)):
+                self._pixels[layer].append(-1)
+                self._owners[layer].append(None)
+            self._visible.append(0)
+            self._sent.append(-1)
+            self._dirty.add(index)
+        return index
+
+    def _recompose(self, index):
+        color = 0
+        for layer in range(len(self.LAYERS) - 1, -1, -1):
+            pixel = self._pixels[layer][index]
+            if pixel >= 0:
+                color = pixel
+                break
+        if color != self._visible[index] or self._sent[index] < 0:
+            self._visible[index] = color
+            self._dirty.add(index)
+
+    def paint(self, owner, layer, zones, hex_color, duration=None):
+        """Set `zones` on `layer` to `hex_color` for `owner`; cleared again after `duration` seconds."""
+        layer = self.LAYERS.index(layer)
+        color = int(hex_color.lstrip("#"), 16)
+        with self._lock:
+            self._clear_owner(owner)
+            for zone in zones:
+                index = self._zone_index(zone)
+                self._pixels[layer][index] = color
+                self._owners[layer][index] = owner
+                self._recompose(index)
+            self.stats["writes"] += 1
+            if duration is not None:
+                self._expiry[owner] = self.lighting._scheduler.call_later(duration, lambda: self.clear(owner))
+            self._request_frame()
+
+    def clear(self, owner):
+        """Remove every pixel painted by `owner`."""
+        with self._lock:
+            self._clear_owner(owner)
+            self.stats["writes"] += 1
+            self._request_frame()
+
+    def clear_all(self):
+        """Clear all layers (the whole keyboard goes dark on the next frame)."""
+        with self._lock:
+            for job in self._expiry.values():
+                self.lighting._scheduler.cancel(job)
+            self._expiry.clear()
+            for layer in range(len(self.LAYERS)):
+                for index in range(len(self._zones)):
+                    self._pixels[layer][index] = -1
+                    self._owners[layer][index] = None
+            for index in range(len(self._zones)):
+                self._recompose(index)
+            self.stats["writes"] += 1
+            self._request_frame()
+
+    def _clear_owner(self, owner):
+        self.lighting._scheduler.cancel(self._expiry.pop(owner, None))
+        for layer, owners in enumerate(self._owners):
+            for index, current in enumerate(owners):
+                if current == owner:
+                    owners[index] = None
+                    self._pixels[layer][index] = -1
+                    self._recompose(index)
+
+    def frame(self):
+        """Current visible color of every known zone, {zone: "#rrggbb"}."""
+        with self._lock:
+            return {zone: f"#{self._visible[i]:06x}" for i, zone in enumerate(self._zones)}
+
+    def _request_frame(self):
+        # called with the lock held; at most one frame is pending, on the fps grid
+        if self._dirty and self._frame_job is None:
+            period = 1.0 / self.fps
+            now = time.monotonic()
+            self._frame_job = self.lighting._scheduler.call_at((math.floor(now / period) + 1) * period, self._flush)
+
+    @staticmethod
+    def zone_event(zone):
+        return "ZONE_" + re.sub(r"[^A-Z0-9_-]", "_", str(zone).upper())
+
+    def _bind_zone(self, zone):
+        event = self.zone_event(zone)
+        self.lighting.ensure_event_registered(event)
+        self.lighting.bind_handlers(event, [{
+            "device-type": "keyboard",
+            "zone": zone,
+            "mode": "context-color",
+            "context-frame-key": self.FRAME_KEY,
+        }])
+        self._bound.add(zone)
+
+    def _flush(self):
+        with self._lock:
+            self._frame_job = None
+            dirty, self._dirty = self._dirty, set()
+            changes = [(i, self._zones[i], self._visible[i]) for i in dirty if self._visible[i] != self._sent[i]]
+        if not changes:
+            return
+        try:
+            for _, zone, _ in changes:
+                if zone not in self._bound:
+                    self._bind_zone(zone)
+            events = []
+            for _, zone, color in changes:
+                rgb = {"red": color >> 16, "green": (color >> 8) & 0xFF, "blue": color & 0xFF}
+                events.append({"event": self.zone_event(zone), "data": {"value": 1 if color else 0, "frame": {self.FRAME_KEY: rgb}}})
+            self.lighting._post("multiple_game_events", {"game": self.lighting.game, "events": events})
+        except Exception:
+            # retry these zones on the next frame
+            self.stats["failures"] += 1
+            with self._lock:
+                self._dirty.update(i for i, _, _ in changes)
+                self._request_frame()
+            return
+        with self._lock:
+            for i, _, color in changes:
+                self._sent[i] = color
+            self.stats["frames"] += 1
+            self.stats["zones_sent"] += len(changes)
+
+    def _keepalive(self):
+        # GG drops events that are not refreshed; re-send every lit zone once per keepalive period
+        if self.lighting.keepalive == "heartbeat":
+            # the game heartbeat keeps the frame alive
+            with self._lock:
+                self._keepalive_job = None
             return
-        t, stop_evt = entry
-        stop_evt.set()
-        # give thread a short time to exit
-        t.join(timeout=2)
+        with self._lock:
+            for i, color in enumerate(self._sent):
+                if color > 0:
+                    self._sent[i] = -1
+                    self._dirty.add(i)
+            self._request_frame()
+            self._keepalive_job = self.lighting._scheduler.call_later(self.keepalive, self._keepalive)
 
+    def invalidate(self):
+        """Forget what GG has (after remove_game or a GG restart): rebind zones and resend the frame."""
+        with self._lock:
+            self._bound.clear()
+            for i in range(len(self._zones)):
+                self._sent[i] = -1
+                self._dirty.add(i)
+            self._request_frame()
 
+    def start(self):
+        with self._lock:
+            if self._keepalive_job is None:
+                self._keepalive_job = self.lighting._scheduler.call_later(self.keepalive, self._keepalive)
+        return self
 
+    def stop(self):
+        with self._lock:
+            self.lighting._scheduler.cancel(self._keepalive_job)
+            self.lighting._scheduler.cancel(self._frame_job)
+            self._keepalive_job = self._frame_job = None
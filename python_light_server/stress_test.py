@@ -0,0 +1,252 @@
+"""
+Concurrency stress test for SteelSeriesLighting against the mock GG engine.
+
+Fires thousands of overlapping on/off/region/batch operations for a small
+set of keys from many threads, so the same events are hit concurrently,
+then checks that:
+
+  - no operation raised and no thread was leaked,
+  - every event GG shows lit has a refresher and vice versa,
+  - the handlers GG has bound match the binding cache (no wrong color),
+    also right after bursts that light one key in several colors at once,
+  - after lights_off() nothing is lit and no refresher keeps sending.
+
+    python3 stress_test.py --ops 5000 --workers 64
+    python3 stress_test.py --keys asdfjkl --gg-jitter-ms 5 --keepalive heartbeat
+
+Exits with status 1 if any check fails.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from ssgg import SteelSeriesLighting
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COLORS = ("#ff0000", "#00ff00", "#0000ff", "#ffff00")
+GAME = "STRESS"
+
+
+def key_event(key):
+    return f"{key.upper()}KEY_EVENT"
+
+
+def region_event(key):
+    for name, keys in SteelSeriesLighting.REGIONS.items():
+        if key in keys:
+            return f"{name.upper()}_STRESS_EVENT"
+    return None
+
+
+def start_mock(latency_ms, jitter_ms=0.0):
+    """mock_gg.py in its own process, so its threads are not counted here; returns (process, url, coreProps path)."""
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "mock_gg.py"), "--latency-ms", str(latency_ms),
+         "--jitter-ms", str(jitter_ms), "--seed", "1"],
+        stdout=subprocess.PIPE, text=True,
+    )
+    url = core_props = None
+    for line in mock.stdout:
+        if line.startswith("Mock GG listening on "):
+            url = line.split()[-1]
+        if line.startswith("STEELSERIES_COREPROPS="):
+            core_props = line.strip().split("=", 1)[1]
+            break
+    return mock, url, core_props
+
+
+class Stress:
+    """Random concurrent operations on `keys`, recording failures per operation kind."""
+
+    def __init__(self, lighting, keys, interval, seed):
+        self.lighting = lighting
+        self.keys = keys
+        self.interval = interval
+        self.random = random.Random(seed)
+        self.errors = []
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def _duration(self):
+        # mostly untimed (lit until turned off), some short timed lights that expire mid-test
+        return self.random.choice((None, None, None, 0.05, 0.2))
+
+    def one(self, _):
+        with self._lock:
+            kind = self.random.choice(("on", "on", "off", "off", "region_on", "region_off", "batch"))
+            key = self.random.choice(self.keys)
+            color = self.random.choice(COLORS)
+            duration = self._duration()
+            batch = [(self.random.choice(("on", "off")), self.random.choice(self.keys), self.random.choice(COLORS))
+                     for _ in range(self.random.randint(2, 4))]
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+        lighting = self.lighting
+        try:
+            if kind == "on":
+                lighting.lights_on_key(key_event(key), key, color, interval=self.interval, duration=duration)
+            elif kind == "off":
+                lighting.lights_off_event(key_event(key))
+            elif kind == "region_on" and region_event(key):
+                # untimed, as light_server does (a timed region light turns everything off when it ends)
+                lighting.lights_on_region(region_event(key), key, color, interval=self.interval, duration=None)
+            elif kind == "region_off" and region_event(key):
+                lighting.lights_off_event(region_event(key))
+            elif kind == "batch":
+                ops = [{"event": key_event(k), "action": action, "zones": [k], "color": c, "interval": self.interval}
+                       for action, k, c in batch]
+                for result in lighting.apply_batch(ops):
+                    if result["status"] == "error":
+                        raise RuntimeError(result.get("error"))
+        except Exception as e:
+            with self._lock:
+                self.errors.append(f"{kind} {key}: {e!r}")
+
+    def events(self):
+        events = {key_event(key) for key in self.keys}
+        events.update(region_event(key) for key in self.keys if region_event(key))
+        return events
+
+
+def color_bursts(lighting, gg_url, keys, bursts, seed):
+    """
+    Light one key in every color at once, from one thread per color, `bursts` times;
+    returns how many bursts left GG's binding or lit state out of step with the lighting object.
+    """
+    rng = random.Random(seed)
+    broken = 0
+    for _ in range(bursts):
+        key = rng.choice(keys)
+        threads = [threading.Thread(target=lighting.lights_on_key, args=(key_event(key), key, color),
+                                    kwargs={"duration": None}) for color in COLORS]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # the first value goes out on the scheduler's next tick
+        time.sleep(0.05)
+        broken += bool(check_state(lighting, gg_url, {key_event(key)}))
+    return broken
+
+
+def check_state(lighting, gg_url, events):
+    """Compare GG's state with what the lighting object believes; returns a list of problems."""
+    state = requests.get(f"{gg_url}/__state", params={"game": GAME}, timeout=5).json()
+    problems = []
+    for event in sorted(events):
+        lit_gg = bool(state["values"].get(event))
+        lit_local = event in lighting._refreshers
+        if lit_gg != lit_local:
+            problems.append(f"{event}: GG lit={lit_gg} but refresher present={lit_local}")
+        cached = lighting._bindings.get(event)
+        bound = state["bindings"].get(event)
+        if cached is not None and (bound is None or lighting._canonical_handlers(bound) != cached):
+            problems.append(f"{event}: GG binding differs from the binding cache")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent on/off stress test for SteelSeriesLighting (mock GG)")
+    parser.add_argument("--ops", type=int, default=5000, help="operations to fire")
+    parser.add_argument("--workers", type=int, default=64, help="concurrent threads")
+    parser.add_argument("--keys", default="asdfjkl", help="keys to hit (few keys = more overlap)")
+    parser.add_argument("--interval", type=float, default=0.2, help="refresher interval in seconds")
+    parser.add_argument("--keepalive", choices=("refresh", "heartbeat"), default="refresh")
+    parser.add_argument("--gg-latency-ms", type=float, default=0.0)
+    parser.add_argument("--gg-jitter-ms", type=float, default=2.0,
+                        help="random extra GG latency, so concurrent calls complete out of order")
+    parser.add_argument("--bursts", type=int, default=100, help="same-key concurrent color bursts")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    # the lighting object's console output goes to stderr so stdout stays a clean report
+    with contextlib.redirect_stdout(sys.stderr):
+        mock, gg_url, core_props = start_mock(args.gg_latency_ms, args.gg_jitter_ms)
+        failures = []
+        try:
+            lighting = SteelSeriesLighting(game=GAME, core_props_path=core_props, pool_size=8)
+            lighting.register_game("Stress Test", "Me", deinitialize_timer_length_ms=60000)
+            if args.keepalive == "heartbeat":
+                lighting.enable_heartbeat()
+            stress = Stress(lighting, list(args.keys), args.interval, args.seed)
+            # warm up so lazily created threads (scheduler worker) exist before the baseline
+            warm = key_event(args.keys[0])
+            lighting.lights_on_key(warm, args.keys[0], COLORS[0], interval=args.interval)
+            time.sleep(0.1)
+            lighting.lights_off_event(warm)
+            baseline = {t.ident: t.name for t in threading.enumerate()}
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                list(pool.map(stress.one, range(args.ops)))
+            elapsed = time.perf_counter() - start
+            # let timed lights expire and the last refresher ticks go out
+            time.sleep(0.2 + 2 * args.interval)
+
+            failures += stress.errors[:20]
+            leaked = [t.name for t in threading.enumerate() if t.ident not in baseline]
+            if leaked:
+                failures.append(f"threads leaked: {leaked}")
+            pending = lighting._scheduler.pending()
+            if pending > len(lighting._refreshers) + 3:
+                failures.append(f"{pending} scheduler jobs for {len(lighting._refreshers)} refreshers")
+            events = stress.events()
+            failures += check_state(lighting, gg_url, events)
+            broken_bursts = color_bursts(lighting, gg_url, list(args.keys), args.bursts, args.seed)
+            if broken_bursts:
+                failures.append(f"{broken_bursts}/{args.bursts} same-key color bursts left GG out of step")
+            lit_before_off = len(lighting._refreshers)
+
+            lighting.lights_off()
+            requests.post(f"{gg_url}/__reset", timeout=5)
+            time.sleep(2 * args.interval + 0.2)
+            state = requests.get(f"{gg_url}/__state", params={"game": GAME}, timeout=5).json()
+            still_lit = sorted(event for event in events if state["values"].get(event))
+            if still_lit:
+                failures.append(f"lit after lights_off: {still_lit}")
+            if lighting._refreshers:
+                failures.append(f"refreshers left after lights_off: {sorted(lighting._refreshers)}")
+            calls = requests.get(f"{gg_url}/__stats", timeout=5).json()["calls"]
+            sent = calls.get("game_event", 0) + calls.get("multiple_game_events", 0)
+            if sent:
+                failures.append(f"{sent} event call(s) after lights_off (orphaned refresher)")
+        finally:
+            mock.terminate()
+            mock.wait(timeout=5)
+
+    report = {
+        "ops": args.ops,
+        "workers": args.workers,
+        "keys": args.keys,
+        "keepalive": args.keepalive,
+        "seconds": round(elapsed, 3),
+        "ops_per_second": round(args.ops / elapsed, 1) if elapsed else 0.0,
+        "op_counts": stress.counts,
+        "lit_before_lights_off": lit_before_off,
+        "errors": len(stress.errors),
+        "failures": failures,
+        "passed": not failures,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"== {args.ops} ops from {args.workers} threads on keys '{args.keys}' "
+              f"in {report['seconds']}s ({report['ops_per_second']}/s), keepalive {args.keepalive}")
+        print(f"   ops {stress.counts}  lit before lights_off {lit_before_off}  errors {len(stress.errors)}")
+        for failure in failures:
+            print(f"   FAIL {failure}")
+        print("   PASS" if not failures else f"   {len(failures)} check(s) failed")
+    sys.exit(0 if not failures else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Shared fixtures: an in-process MockGG and lighting objects pointed at it.
+
+The modules live flat in python_light_server/, so that directory is put on
+sys.path the way the scripts there import each other.
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_gg import MockGG  # noqa: E402
+from ssgg import SteelSeriesLighting  # noqa: E402
+
+GAME = "TEST"
+
+
+@pytest.fixture
+def gg():
+    with MockGG() as mock:
+        yield mock
+
+
+@pytest.fixture
+def make_lighting(gg):
+    """Factory for SteelSeriesLighting instances on the mock; the game is registered."""
+    made = []
+
+    def make(**kwargs):
+        kwargs.setdefault("game", GAME)
+        lighting = SteelSeriesLighting(core_props_path=gg.core_props_path, **kwargs)
+        lighting.register_game("Test", "Tests", deinitialize_timer_length_ms=60000)
+        made.append(lighting)
+        return lighting
+
+    yield make
+    for lighting in made:
+        lighting.lights_off()
+
+
+@pytest.fixture
+def lighting(make_lighting):
+    return make_lighting()
+
+
+def bound_color(gg, game, event):
+    """(red, green, blue) of the first handler GG has bound for `event`, or None."""
+    handlers = gg.state(game)["bindings"].get(event)
+    if not handlers:
+        return None
+    color = handlers[0]["color"]
+    return color["red"], color["green"], color["blue"]
+
+
+def drain(command_queue, timeout=5):
+    """Wait until everything submitted to `command_queue` so far has been applied."""
+    done = threading.Event()
+    command_queue.run_after(done.set)
+    assert done.wait(timeout), "command queue did not drain"
+
+
+@pytest.fixture(scope="session")
+def server():
+    """light_server imported against its own MockGG (write-behind on, event log and capture off)."""
+    mock = MockGG().start()
+    state = tempfile.mkdtemp(prefix="light_server_test_")
+    os.environ.update(
+        STEELSERIES_COREPROPS=mock.core_props_path,
+        LIGHT_MANIFEST=os.path.join(state, "manifest.json"),
+        LIGHT_EVENT_LOG="off",
+        LIGHT_CAPTURE="off",
+        LIGHT_WRITE_BEHIND="1",
+    )
+    os.environ.pop("LIGHT_DAEMON", None)
+    import light_server
+    assert light_server.wait_until_ready(timeout=30), light_server.priming_status
+    light_server.gg = mock
+    yield light_server
+    light_server.lighting.lights_off()
+    mock.stop()
+
+
+@pytest.fixture
+def strict_gg():
+    """A MockGG that, like a strict engine, rejects values for events never registered."""
+    with MockGG(strict=True) as mock:
+        yield mock
+
+
+@pytest.fixture
+def core_props(gg, tmp_path):
+    """A coreProps.json pointing at `gg` that outlives it, for clients that must survive a GG restart."""
+    path = tmp_path / "coreProps.json"
+    path.write_text(json.dumps({"address": gg.address}))
+    return str(path)
+
+
+
+def wait_for(condition, timeout=2):
+    """Poll `condition` until it is true (refreshers send their first value on the scheduler thread)."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
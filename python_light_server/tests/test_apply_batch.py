@@ -0,0 +1,39 @@
+from conftest import GAME
+from ssgg import SteelSeriesLighting
+
+
+def on(event, zone, color="#00ff00", **fields):
+    return dict({"event": event, "action": "on", "zones": [zone], "color": color}, **fields)
+
+
+def test_batch_is_one_value_call(gg, lighting):
+    lighting.apply_batch([on("AKEY_EVENT", "a"), on("BKEY_EVENT", "b")])
+    gg.reset()
+    results = lighting.apply_batch([{"event": "AKEY_EVENT", "action": "off"}, on("BKEY_EVENT", "b"),
+                                    on("CKEY_EVENT", "c")])
+    assert [result["status"] for result in results] == ["ok", "ok", "ok"]
+    calls = gg.stats()["calls"]
+    # B keeps its binding; only C needs one, and all three values go in one multiple_game_events
+    assert calls.get("multiple_game_events") == 1 and "game_event" not in calls
+    assert calls.get("bind_game_event") == 1
+    values = gg.state(GAME)["values"]
+    assert (values["AKEY_EVENT"], values["BKEY_EVENT"], values["CKEY_EVENT"]) == (0, 1, 1)
+
+
+def test_batch_keeps_the_last_op_per_event(gg, lighting):
+    results = lighting.apply_batch([on("AKEY_EVENT", "a"), {"event": "AKEY_EVENT", "action": "off"},
+                                    on("AKEY_EVENT", "a", color="#0000ff")])
+    assert [result["status"] for result in results] == ["coalesced", "coalesced", "ok"]
+    color = gg.state(GAME)["bindings"]["AKEY_EVENT"][0]["color"]
+    assert (color["red"], color["green"], color["blue"]) == (0, 0, 255)
+    assert gg.state(GAME)["values"]["AKEY_EVENT"] == 1
+
+
+def test_off_for_unregistered_event_is_not_sent(strict_gg):
+    lighting = SteelSeriesLighting(game=GAME, core_props_path=strict_gg.core_props_path)
+    lighting.register_game("Test", "Tests", deinitialize_timer_length_ms=60000)
+    results = lighting.apply_batch([{"event": "NEVERKEY_EVENT", "action": "off"}, on("AKEY_EVENT", "a")])
+    # a strict engine would have rejected the whole multiple_game_events call
+    assert [result["status"] for result in results] == ["ok", "ok"]
+    assert strict_gg.state(GAME)["values"] == {"AKEY_EVENT": 1}
+    lighting.lights_off()
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+import requests
+
+from async_ssgg import AsyncSteelSeriesLighting
+from conftest import GAME, bound_color
+from mock_gg import MockGG
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_timed_region_light_turns_everything_off_at_the_end(gg):
+    async def scenario():
+        async with AsyncSteelSeriesLighting(game=GAME, core_props_path=gg.core_props_path) as lighting:
+            await lighting.register_game("Test", "Tests")
+            await lighting.lights_on_key("GKEY_EVENT", "g", "#00ff00", duration=None)
+            await lighting.lights_on_region("LEFT_REGION_EVENT", "q", "#ff0000", duration=0.2)
+            await asyncio.sleep(0.5)
+            return gg.state(GAME)["values"]
+
+    values = run(scenario())
+    # like the sync client, the region's end runs lights_off(), which also turns off the untimed key
+    assert values["LEFT_REGION_EVENT"] == 0
+    assert values["GKEY_EVENT"] == 0
+    assert values[AsyncSteelSeriesLighting.ALL_OFF_EVENT] == 1
+
+
+def test_operations_on_one_event_are_serialized(gg):
+    async def scenario():
+        async with AsyncSteelSeriesLighting(game=GAME, core_props_path=gg.core_props_path) as lighting:
+            await lighting.register_game("Test", "Tests")
+            # the off is issued while the on is still binding; it must not overtake it
+            await asyncio.gather(lighting.lights_on_key("AKEY_EVENT", "a", "#00ff00", duration=None),
+                                 lighting.lights_off_event("AKEY_EVENT"))
+            return gg.state(GAME)["values"]["AKEY_EVENT"]
+
+    assert run(scenario()) == 0
+
+
+def test_bindings_are_replayed_after_gg_restarts(gg, core_props):
+    async def scenario():
+        async with AsyncSteelSeriesLighting(game=GAME, core_props_path=core_props, retry_interval=0.05) as lighting:
+            await lighting.register_game("Test", "Tests")
+            await lighting.lights_on_key("AKEY_EVENT", "a", "#00ff00", duration=None, interval=0.05)
+            port = int(gg.address.rsplit(":", 1)[1])
+            gg.stop()
+            # the refresher's failing calls open the breaker
+            await asyncio.sleep(0.3)
+            assert lighting.breaker.state != lighting.breaker.CLOSED
+            mock = MockGG(port=port).start()
+            assert await lighting.wait_until_connected(timeout=5)
+            await asyncio.sleep(0.1)
+            gg.stop = mock.stop  # the fixture stops whichever mock is running at the end
+            return mock
+
+    # the new engine has none of the state; the breaker replayed it
+    mock = run(scenario())
+    assert bound_color(mock, GAME, "AKEY_EVENT") == (0, 255, 0)
+    assert mock.state(GAME)["values"]["AKEY_EVENT"] == 1
+
+
+def test_calls_fail_fast_while_the_breaker_is_open(gg, core_props):
+    async def scenario():
+        lighting = await AsyncSteelSeriesLighting(game=GAME, core_props_path=core_props, retry_interval=60).connect()
+        gg.stop()
+        gg.stop = lambda: None
+        for _ in range(2):
+            with pytest.raises(requests.ConnectionError):
+                await lighting.set_event_value("AKEY_EVENT", 1)
+        start = time.perf_counter()
+        with pytest.raises(requests.ConnectionError, match="circuit open"):
+            await lighting.set_event_value("AKEY_EVENT", 1)
+        elapsed = time.perf_counter() - start
+        await lighting.close()
+        return elapsed
+
+    assert run(scenario()) < 0.05
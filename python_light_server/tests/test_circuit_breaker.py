@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from conftest import GAME, bound_color
+from mock_gg import MockGG
+from ssgg import SteelSeriesLighting
+from transport import CircuitBreaker, CircuitOpenError
+
+
+def test_breaker_opens_after_the_threshold_and_closes_after_recovery():
+    up = threading.Event()
+    recovered = []
+    breaker = CircuitBreaker(probe=up.is_set, on_recover=lambda: recovered.append(True),
+                             failure_threshold=2, probe_interval=0.01)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert not breaker.wait_closed(0.05)
+    up.set()
+    assert breaker.wait_closed(2)
+    assert recovered == [True]
+    assert breaker.snapshot()["state"] == "closed" and breaker.stats["recovered"] == 1
+
+
+def test_failed_recovery_keeps_probing():
+    attempts = []
+
+    def recover():
+        attempts.append(True)
+        if len(attempts) < 3:
+            raise requests.ConnectionError("GG went away again")
+
+    breaker = CircuitBreaker(probe=lambda: True, on_recover=recover, probe_interval=0.01)
+    breaker.trip()
+    assert breaker.wait_closed(2)
+    assert len(attempts) == 3
+
+
+def test_construction_does_not_wait_for_gg(core_props, gg):
+    gg.stop()
+    gg.stop = lambda: None
+    start = time.perf_counter()
+    lighting = SteelSeriesLighting(game=GAME, core_props_path=core_props, retry_interval=0.05)
+    assert time.perf_counter() - start < 2
+    assert lighting.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(requests.ConnectionError):
+        lighting.lights_on_key("AKEY_EVENT", "a", "#00ff00")
+    assert not lighting.wait_until_connected(timeout=0.1)
+
+
+def test_construction_without_core_props_waits_for_the_file(gg, tmp_path, monkeypatch):
+    monkeypatch.delenv("STEELSERIES_COREPROPS", raising=False)
+    path = tmp_path / "coreProps.json"
+    lighting = SteelSeriesLighting(game=GAME, core_props_path=str(path), retry_interval=0.05)
+    assert lighting.breaker.state == CircuitBreaker.OPEN
+    assert not lighting.wait_until_connected(timeout=0.1)
+    path.write_text(json.dumps({"address": gg.address}))
+    assert lighting.wait_until_connected(timeout=5)
+    assert lighting.core_props_path == str(path) and lighting.base_url == f"http://{gg.address}"
+    lighting.register_game("Test", "Tests", deinitialize_timer_length_ms=60000)
+    lighting.lights_on_key("AKEY_EVENT", "a", "#00ff00")
+    assert bound_color(gg, GAME, "AKEY_EVENT") == (0, 255, 0)
+    lighting.lights_off()
+
+
+def test_bindings_and_lit_keys_are_replayed_after_gg_restarts(gg, core_props):
+    lighting = SteelSeriesLighting(game=GAME, core_props_path=core_props, retry_interval=0.05)
+    lighting.register_game("Test", "Tests", deinitialize_timer_length_ms=60000)
+    lighting.lights_on_key("AKEY_EVENT", "a", "#00ff00", interval=0.05, duration=None)
+    port = int(gg.address.rsplit(":", 1)[1])
+    gg.stop()
+    # the refresher's failing calls open the breaker
+    deadline = time.monotonic() + 5
+    while lighting.breaker.state == CircuitBreaker.CLOSED and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert lighting.breaker.state != CircuitBreaker.CLOSED
+
+    with MockGG(port=port) as restarted:
+        gg.stop = lambda: None
+        assert lighting.wait_until_connected(timeout=5)
+        # the new engine has none of the state; the breaker replayed it
+        assert restarted.state(GAME)["values"]["AKEY_EVENT"] == 1
+        assert bound_color(restarted, GAME, "AKEY_EVENT") == (0, 255, 0)
+        assert GAME in restarted.games
+        lighting.lights_off()
+
+
+def test_ready_endpoint(server):
+    response = server.app.test_client().get("/ready")
+    assert response.status_code == 200
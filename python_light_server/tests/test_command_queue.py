@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+from command_queue import CommandQueue
+from conftest import bound_color, drain, wait_for
+
+
+class RecordingLighting:
+    """Stands in for SteelSeriesLighting: records each apply_batch, optionally holding it until released."""
+
+    def __init__(self):
+        self.batches = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def apply_batch(self, ops):
+        self.entered.set()
+        self.release.wait(5)
+        self.batches.append(ops)
+        return [{"event": op["event"], "action": op["action"], "status": "ok"} for op in ops]
+
+
+def test_commands_for_one_event_coalesce_while_waiting():
+    lighting = RecordingLighting()
+    queue = CommandQueue(lighting)
+    lighting.release.clear()
+    # the first command is picked up and held in apply_batch; the rest wait behind it
+    queue.submit({"event": "A", "action": "on"})
+    assert lighting.entered.wait(5)
+    assert [queue.submit({"event": "B", "action": action}) for action in ("on", "off", "on")] == \
+        ["queued", "coalesced", "coalesced"]
+    lighting.release.set()
+    drain(queue)
+    assert lighting.batches[-1] == [{"event": "B", "action": "on"}]
+    assert sum(len(batch) for batch in lighting.batches) == 2
+
+
+def test_commands_keep_submission_order_across_events():
+    lighting = RecordingLighting()
+    queue = CommandQueue(lighting)
+    lighting.release.clear()
+    queue.submit({"event": "A", "action": "on"})
+    assert lighting.entered.wait(5)
+    for event in ("C", "B", "D"):
+        queue.submit({"event": event, "action": "on"})
+    lighting.release.set()
+    drain(queue)
+    assert [op["event"] for batch in lighting.batches[1:] for op in batch] == ["C", "B", "D"]
+
+
+@pytest.fixture(params=["write-behind", "sync"])
+def mode(request, server, monkeypatch):
+    """Runs a test with the write-behind queue and again with LIGHT_WRITE_BEHIND off."""
+    if request.param == "sync":
+        drain(server.command_queue)
+        monkeypatch.setattr(server, "command_queue", None)
+    return request.param
+
+
+def settle(server):
+    if server.command_queue is not None:
+        drain(server.command_queue)
+
+
+def test_region_light_without_color_keeps_bound_region_color(server, mode):
+    client = server.app.test_client()
+    event = server.REGION_EVENTS[server.get_region_for_key("q")]
+    assert client.post("/bind_regions_color", json={"color": "#123456"}).status_code == 200
+
+    assert client.post("/lights_on_region", json={"key": "q"}).status_code < 300
+    settle(server)
+    assert bound_color(server.gg, server.lighting.game, event) == (18, 52, 86)
+    assert wait_for(lambda: server.gg.state(server.lighting.game)["values"].get(event) == 1)
+    client.post("/lights_off_region_for_key", json={"key": "q"})
+    settle(server)
+
+
+def test_region_light_with_color_binds_it(server, mode):
+    client = server.app.test_client()
+    event = server.REGION_EVENTS[server.get_region_for_key("j")]
+    client.post("/bind_regions_color", json={"color": "#123456"})
+    assert client.post("/lights_on_region", json={"key": "j", "color": "#00ff00"}).status_code < 300
+    settle(server)
+    assert bound_color(server.gg, server.lighting.game, event) == (0, 255, 0)
+    client.post("/lights_off_region_for_key", json={"key": "j"})
+    settle(server)
+
+
+def test_batch_region_on_without_color_keeps_bound_color(server, mode):
+    client = server.app.test_client()
+    event = server.REGION_EVENTS[server.get_region_for_key("f")]
+    client.post("/bind_regions_color", json={"color": "#123456"})
+    response = client.post("/lights_batch", json={"ops": [{"op": "region_on", "key": "f"}]})
+    assert response.status_code < 300
+    settle(server)
+    assert bound_color(server.gg, server.lighting.game, event) == (18, 52, 86)
+    client.post("/lights_off_region_for_key", json={"key": "f"})
+    settle(server)
@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+import eventlog
+from eventlog import KEYSTROKE, EventLog
+from layout import load_layout
+
+
+@pytest.fixture(params=["numpy", "python"])
+def log(request, tmp_path, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(eventlog, "np", None)
+    elif eventlog.np is None:
+        pytest.skip("NumPy is not installed")
+    log = EventLog(str(tmp_path / "keys.log"), load_layout())
+    yield log
+    log.close()
+
+
+def test_burst_is_not_extrapolated_to_a_huge_rate(log):
+    region = log.layout.region_of("f")
+    for _ in range(30):
+        log.record(KEYSTROKE, "f", value=200.0)
+    stats = log.regions()[region]
+    # 30 keystrokes within microseconds are 30 over the minimum one-minute window
+    assert stats["keystrokes"] == 30
+    assert stats["per_minute"] == 30.0
+
+
+def test_rate_covers_the_queried_period(log):
+    region = log.layout.region_of("f")
+    for _ in range(30):
+        log.record(KEYSTROKE, "f", value=200.0)
+    assert log.regions(since=time.time() - 600)[region]["per_minute"] == pytest.approx(3.0, abs=0.1)
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from layout import KEYBOARD_ZONES, Layout, layout_names, load_layout
+
+
+@pytest.mark.parametrize("name", layout_names())
+def test_shipped_layouts_load(name):
+    layout = load_layout(name)
+    assert layout.name == name
+    assert layout.regions
+    # every region zone is a real GG zone (a typo would light nothing)
+    for zones in layout.regions.values():
+        assert set(zones) <= set(KEYBOARD_ZONES)
+
+
+def test_default_layout_is_qwerty():
+    layout = load_layout()
+    assert layout.name == "qwerty"
+    assert layout.region_of("q") == "region1"
+    assert layout.region_of("Q") == "region1"
+    assert layout.region_keys("k") == tuple("ujmikolp")
+    assert layout.region_of("1") is None
+    assert layout.zone(";") == "semicolon"
+    assert layout.zone("Enter") == "return"
+
+
+def test_keymap_maps_typed_keys_to_their_zones():
+    layout = load_layout("dvorak")
+    # Dvorak "o" is on the QWERTY "s" key
+    assert layout.zone("o") == "s"
+    assert layout.region_of("o") == "region1"
+    assert layout.zone(";") == "z"
+
+
+def test_layout_from_a_file(tmp_path):
+    path = tmp_path / "mine.json"
+    path.write_text(json.dumps({"regions": {"home": "asdf", "thumb": ["spacebar"]}, "keymap": {"x": "a"}}))
+    layout = load_layout(str(path))
+    assert layout.name == "mine"
+    assert layout.region_keys("x") == ("a", "s", "d", "f")
+    assert layout.region_of(" ") == "thumb"
+    assert Layout.from_dict(layout.to_dict()).regions == layout.regions
+
+
+@pytest.mark.parametrize("data, message", [
+    ({"regions": {"a b": "q"}}, "invalid region name"),
+    ({"regions": {"one": "qw", "two": "w"}}, "is in both"),
+    ({"keymap": {}}, "has no regions"),
+    ({"regions": {"one": "q"}, "keymap": ["q"]}, "keymap must be an object"),
+])
+def test_malformed_layouts_are_rejected(tmp_path, data, message):
+    path = tmp_path / "bad.json"
+    path.write_text(json.dumps(data))
+    with pytest.raises(ValueError, match=message):
+        load_layout(str(path))
+
+
+def test_unknown_layout():
+    with pytest.raises(ValueError, match="Unknown layout 'nope'"):
+        load_layout("nope")
@@ -0,0 +1,77 @@
+import os
+import tempfile
+
+from conftest import GAME, drain
+from lesson import Lessons
+from lighting_daemon import LightingClient, LightingDaemon
+
+
+def key_op(char):
+    return {"event": f"{char.upper()}KEY_EVENT", "action": "on", "zones": [char], "color": "#00ff00"}
+
+
+def values(gg):
+    return {event: value for event, value in gg.state(GAME)["values"].items() if value}
+
+
+def test_advance_moves_the_light(gg, lighting):
+    lessons = Lessons(lighting, lighting.apply_batch)
+    body, status = lessons.start("abc", "key", [key_op(c) for c in "abc"])
+    assert (status, body["cursor"]) == (200, 0)
+    assert values(gg) == {"AKEY_EVENT": 1}
+
+    assert lessons.advance(body["id"])[0] == {"lesson": body["id"], "cursor": 1, "done": False}
+    assert values(gg) == {"BKEY_EVENT": 1}
+    assert lessons.advance(body["id"], cursor=3)[0]["done"]
+    assert values(gg) == {}
+
+
+def test_late_absolute_cursor_is_ignored(gg, lighting):
+    lessons = Lessons(lighting, lighting.apply_batch)
+    lesson_id = lessons.start("abcd", "key", [key_op(c) for c in "abcd"])[0]["id"]
+    lessons.advance(lesson_id, cursor=2)
+    lessons.advance(lesson_id, cursor=3)
+    # the advance to 2 arriving again (out of order) must not move the light back
+    assert lessons.advance(lesson_id, cursor=2)[0]["cursor"] == 3
+    assert values(gg) == {"DKEY_EVENT": 1}
+    assert lessons.advance(lesson_id, cursor=0, restart=True)[0]["cursor"] == 0
+    assert values(gg) == {"AKEY_EVENT": 1}
+
+
+def test_stale_and_missing_lessons(lighting):
+    lessons = Lessons(lighting, lighting.apply_batch)
+    assert lessons.advance()[1] == 404
+    first = lessons.start("ab", "key", [key_op(c) for c in "ab"])[0]["id"]
+    second = lessons.start("cd", "key", [key_op(c) for c in "cd"])[0]["id"]
+    body, status = lessons.advance(first)
+    assert (status, body["lesson"]) == (409, second)
+    assert lessons.end()[1] == 200
+    assert lessons.get()[1] == 404
+
+
+def test_workers_share_the_daemon_lesson(gg, lighting):
+    path = os.path.join(tempfile.mkdtemp(), "lighting.sock")
+    daemon = LightingDaemon(lighting, path).start()
+    try:
+        worker_a, worker_b = LightingClient(path).lessons, LightingClient(path).lessons
+        lesson_id = worker_a.start("abc", "key", [key_op(c) for c in "abc"])[0]["id"]
+        assert worker_b.advance(lesson_id, cursor=1) == ({"lesson": lesson_id, "cursor": 1, "done": False}, 200)
+        assert worker_a.get()[0]["cursor"] == 1
+        assert worker_a.advance(lesson_id + 1)[1] == 409
+        drain(daemon.commands)
+        assert values(gg) == {"BKEY_EVENT": 1}
+        assert worker_b.end()[1] == 200
+    finally:
+        daemon.stop()
+
+
+def test_lesson_endpoints(server):
+    client = server.app.test_client()
+    body = client.post("/lesson", json={"text": "hi", "mode": "key"}).get_json()
+    response = client.post("/lesson/advance", json={"lesson": body["id"], "cursor": 1})
+    assert response.get_json() == {"lesson": body["id"], "cursor": 1, "done": False}
+    assert client.post("/lesson/advance", json={"lesson": body["id"], "cursor": 0}).get_json()["cursor"] == 1
+    assert client.post("/lesson/advance", json={"lesson": body["id"] + 1}).status_code == 409
+    assert client.post("/lesson/advance", json={"cursor": "x"}).status_code == 400
+    assert client.delete("/lesson").status_code == 200
+    assert client.get("/lesson").status_code == 404
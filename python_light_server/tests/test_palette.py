@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import drain, wait_for
+
+
+@pytest.fixture
+def palette(server):
+    yield server.lighting
+    server.lighting.set_palette([])
+
+
+@pytest.mark.parametrize("queued", [True, False], ids=["write-behind", "sync"])
+@pytest.mark.parametrize("route, body", [
+    ("/lights_on_region", {"key": "q"}),
+    ("/lights_batch", {"ops": [{"op": "region_on", "key": "q"}]}),
+], ids=["region", "batch"])
+def test_colorless_region_on_sends_the_bound_palette_value(server, palette, monkeypatch, queued, route, body):
+    client = server.app.test_client()
+    if not queued:
+        monkeypatch.setattr(server, "command_queue", None)
+    event = server.REGION_EVENTS[server.get_region_for_key("q")]
+    assert client.post("/palette", json={"colors": ["#336699", "#123456"]}).status_code == 200
+    assert client.post("/bind_regions_color", json={"color": "#123456"}).status_code == 200
+
+    assert client.post(route, json=body).status_code < 300
+    if queued:
+        drain(server.command_queue)
+    # slot 1 at full brightness; value 1 would be slot 0 at a tenth of it
+    assert palette.bound_value(event) == palette.palette_value("#123456") == 20
+    assert wait_for(lambda: server.gg.state(palette.game)["values"].get(event) == 20)
+
+    client.post("/lights_off_region_for_key", json={"key": "q"})
+    if queued:
+        drain(server.command_queue)
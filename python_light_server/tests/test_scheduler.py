@@ -0,0 +1,56 @@
+import threading
+import time
+
+from scheduler import Scheduler
+
+
+def test_cancelling_a_job_that_already_ran_keeps_pending_at_zero():
+    scheduler = Scheduler()
+    ran = threading.Event()
+    job = scheduler.call_soon(ran.set)
+    assert ran.wait(2)
+    scheduler.cancel(job)
+    assert scheduler.pending() == 0
+    scheduler.stop()
+
+
+def test_job_cancelling_itself_while_running():
+    scheduler = Scheduler()
+    jobs = []
+    for _ in range(5):
+        done = threading.Event()
+        job = scheduler.call_soon(lambda done=done: (scheduler.cancel(jobs[-1]), done.set()))
+        jobs.append(job)
+        assert done.wait(2)
+    live = scheduler.call_later(60, lambda: None)
+    assert scheduler.pending() == 1
+    scheduler.cancel(live)
+    assert scheduler.pending() == 0
+    scheduler.stop()
+
+
+def test_job_cancelled_by_an_earlier_job_of_its_batch_does_not_run():
+    scheduler = Scheduler(coalesce_window=1.0)
+    ran = []
+    at = time.monotonic() + 0.05
+    later = [None]
+    scheduler.call_at(at, lambda: scheduler.cancel(later[0]))
+    later[0] = scheduler.call_at(at + 0.01, lambda: ran.append(True))
+    finished = threading.Event()
+    scheduler.call_at(at + 0.02, finished.set)
+    assert finished.wait(2)
+    assert ran == [] and scheduler.pending() == 0
+    scheduler.stop()
+
+
+def test_expiring_compositor_paints_keep_the_gauge_right(gg, lighting):
+    compositor = lighting.enable_compositor()
+    for _ in range(5):
+        lighting.lights_on_key("AKEY_EVENT", "a", "#00ff00", duration=0.05)
+        time.sleep(0.1)
+    # each expiry job cancels itself while it runs; pending() must still count the live heap entries
+    scheduler = lighting._scheduler
+    with scheduler._cond:
+        live = sum(1 for _, _, job in scheduler._heap if not job.cancelled)
+    assert scheduler.pending() == live
+    compositor.stop()
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+from conftest import wait_for
+from lighting_daemon import LightingClient, LightingDaemon
+
+
+def test_selftest_job_runs_through_the_handlers(server):
+    client = server.app.test_client()
+    steps = [{"op": "on", "key": "g", "color": "#00FF00"}, {"op": "off", "key": "g"}]
+    job = client.post("/run_test", json={"steps": steps}).get_json()["job"]
+    events = client.get(f"/run_test/{job}/events").get_data(as_text=True)
+    assert "event: done" in events
+    snapshot = client.get(f"/run_test/{job}").get_json()
+    assert snapshot["state"] == "passed"
+    assert [result["passed"] for result in snapshot["results"]] == [True, True]
+
+
+def test_daemon_counts_live_workers(lighting):
+    path = os.path.join(tempfile.mkdtemp(), "lighting.sock")
+    daemon = LightingDaemon(lighting, path).start()
+    other = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        client = LightingClient(path)
+        assert client.register_worker(os.getpid()) == 1
+        assert client.register_worker(os.getpid()) == 1
+        assert client.register_worker(other.pid) == 2
+        other.kill()
+        other.wait()
+        assert client.worker_count() == 1
+    finally:
+        other.kill()
+        daemon.stop()
+
+
+def test_daemon_clears_lights_only_for_the_first_worker(gg, lighting):
+    path = os.path.join(tempfile.mkdtemp(), "lighting.sock")
+    daemon = LightingDaemon(lighting, path).start()
+    try:
+        first, second = LightingClient(path), LightingClient(path)
+        assert first.startup_clear() is True
+        first.lights_on_key("GKEY_EVENT", "g", "#00FF00")
+        assert wait_for(lambda: gg.state(lighting.game)["values"].get("GKEY_EVENT", 0) > 0)
+        assert second.startup_clear() is False
+        assert gg.state(lighting.game)["values"]["GKEY_EVENT"] > 0
+        first.lights_off()
+    finally:
+        daemon.stop()
@@ -0,0 +1,21 @@
+import threading
+
+from transport import PooledTransport
+
+
+def test_pooled_transport_reuses_one_connection_across_threads(gg):
+    transport = PooledTransport(pool_size=2)
+    url = f"http://{gg.address}/game_event"
+    statuses = []
+
+    def post():
+        statuses.append(transport.post(url, {"game": "TEST", "event": "E", "data": {"value": 1}}).status_code)
+
+    # one short-lived thread after another, like request threads
+    for _ in range(20):
+        thread = threading.Thread(target=post)
+        thread.start()
+        thread.join()
+    transport.close()
+    assert statuses == [200] * 20
+    assert gg.stats()["connections"] == 1
@@ -0,0 +1,365 @@
+import asyncio
+import collections
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from log import get_logger
+
+logger = get_logger(__name__)
+
+
+class RequestsTransport:
+    """
+    Legacy transport: a bare `requests.post` per call (new TCP connection every time).
+    Kept for comparison in benchmarks and for environments where pooling misbehaves.
+    """
+
+    def __init__(self, connect_timeout=0.5, read_timeout=2.0):
+        self.timeout = (connect_timeout, read_timeout)
+
+    def post(self, url, payload=None, body=None, timeout=None):
+        if body is None:
+            body = json.dumps(payload)
+        return requests.post(
+            url,
+            data=body,
+            headers={"Content-Type": "application/json"},
+            timeout=timeout or self.timeout,
+        )
+
+    def close(self):
+        pass
+
+
+class PooledTransport:
+    """
+    Keep-alive transport for the GG API.
+
+    One `requests.Session` over one urllib3 connection pool is shared by
+    every thread, so concurrent callers (Flask workers, refresher threads)
+    reuse warm connections instead of opening a new socket for every POST.
+    The pool is thread-safe and GG sets no cookies, so sharing the session
+    costs nothing and short-lived request threads leave nothing behind.
+
+    :param pool_size: maximum number of kept-alive connections to GG
+    :param connect_timeout: seconds to wait for the TCP connection
+    :param read_timeout: seconds to wait for GG's response
+    """
+
+    def __init__(self, pool_size=4, connect_timeout=0.5, read_timeout=2.0):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self._session = requests.Session()
+        # GG listens on loopback: skip the per-request proxy/netrc environment lookups
+        self._session.trust_env = False
+        self._session.headers["Content-Type"] = "application/json"
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0))
+
+    def post(self, url, payload=None, body=None, timeout=None):
+        """
+        POST to GG.
+
+        :param payload: JSON-serialisable object (ignored when `body` is given)
+        :param body: pre-serialised request body (str or bytes)
+        :param timeout: per-call override, a float or (connect, read) tuple
+        """
+        if body is None:
+            body = json.dumps(payload, separators=(",", ":"))
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        return self._session.post(url, data=body, timeout=timeout or self.timeout)
+
+    def close(self):
+        self._session.close()
+
+
+class AsyncResponse:
+    """Response returned by `AsyncPooledTransport.post` (the subset of `requests.Response` we use)."""
+
+    __slots__ = ("status_code", "content", "url")
+
+    def __init__(self, status_code, content, url):
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+
+class _AsyncConnection:
+    """
+    One keep-alive HTTP/1.1 connection with pipelining.
+
+    Requests are written as soon as they are submitted; a reader task
+    matches responses to them in order. If the connection breaks, every
+    request still waiting on it fails with `requests.ConnectionError`.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = collections.deque()
+        self.closed = False
+        self._reader_task = asyncio.ensure_future(self._read_responses())
+
+    def submit(self, request, url):
+        # write and enqueue without yielding, so the response order matches the write order
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((future, url))
+        self.writer.write(request)
+        return future
+
+    async def _read_head(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n"):
+                return status, headers
+            if not line:
+                raise ConnectionError("Connection closed by server")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    async def _read_body(self, headers):
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    return bytes(body)
+                body += await self.reader.readexactly(size)
+                await self.reader.readline()
+        length = int(headers.get("content-length") or 0)
+        return await self.reader.readexactly(length) if length else b""
+
+    async def _read_responses(self):
+        try:
+            while True:
+                status, headers = await self._read_head()
+                body = await self._read_body(headers)
+                future, url = self.pending.popleft()
+                if not future.done():
+                    future.set_result(AsyncResponse(status, body, url))
+                if headers.get("connection", "").lower() == "close":
+                    raise ConnectionError("Server closed the connection")
+        except (OSError, EOFError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+            self.close(e)
+        except asyncio.CancelledError:
+            self.close(ConnectionError("Transport closed"))
+
+    def close(self, error=None):
+        self.closed = True
+        while self.pending:
+            future, _ = self.pending.popleft()
+            if not future.done():
+                future.set_exception(requests.ConnectionError(str(error or "Connection closed")))
+        self.writer.close()
+        if self._reader_task is not asyncio.current_task():
+            self._reader_task.cancel()
+
+
+class AsyncPooledTransport:
+    """
+    asyncio keep-alive transport for the GG API (standard library only).
+
+    Up to `pool_size` HTTP/1.1 connections are opened per host. Each call
+    goes to the least busy one and is pipelined behind the requests already
+    in flight there, so hundreds of concurrent calls share a few sockets
+    without a thread per call. Errors are raised as the same `requests`
+    exceptions the blocking transports raise.
+
+    :param pool_size: maximum number of connections per host
+    :param pipeline_depth: in-flight requests per connection before another connection is opened
+    :param connect_timeout: seconds to wait for the TCP connection
+    :param read_timeout: seconds to wait for GG's response
+    """
+
+    def __init__(self, pool_size=4, pipeline_depth=8, connect_timeout=0.5, read_timeout=2.0):
+        self.pool_size = pool_size
+        self.pipeline_depth = pipeline_depth
+        self.timeout = (connect_timeout, read_timeout)
+        self._pools = {}    # (host, port) -> [_AsyncConnection]
+        self._opening = {}  # (host, port) -> connections being opened
+
+    async def _connection(self, host, port, connect_timeout):
+        key = (host, port)
+        pool = self._pools.setdefault(key, [])
+        pool[:] = [conn for conn in pool if not conn.closed]
+        idle = min(pool, key=lambda conn: len(conn.pending), default=None)
+        if idle is not None and (len(idle.pending) < self.pipeline_depth
+                                 or len(pool) + self._opening.get(key, 0) >= self.pool_size):
+            return idle
+        if len(pool) + self._opening.get(key, 0) >= self.pool_size:
+            # every slot is still connecting; wait for one instead of exceeding the pool
+            await asyncio.sleep(0)
+            return await self._connection(host, port, connect_timeout)
+        self._opening[key] = self._opening.get(key, 0) + 1
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), connect_timeout)
+        except asyncio.TimeoutError:
+            raise requests.ConnectTimeout(f"Timed out connecting to {host}:{port}")
+        except OSError as e:
+            raise requests.ConnectionError(str(e))
+        finally:
+            self._opening[key] -= 1
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = _AsyncConnection(reader, writer)
+        pool.append(conn)
+        return conn
+
+    async def post(self, url, payload=None, body=None, timeout=None):
+        """
+        POST to GG.
+
+        :param payload: JSON-serialisable object (ignored when `body` is given)
+        :param body: pre-serialised request body (str or bytes)
+        :param timeout: per-call override, a float or (connect, read) tuple
+        """
+        if body is None:
+            body = json.dumps(payload, separators=(",", ":"))
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        timeout = timeout or self.timeout
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        head = (
+            f"POST {parts.path or '/'} HTTP/1.1\r\n"
+            f"Host: {parts.netloc}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode("latin-1")
+        conn = await self._connection(host, port, connect_timeout)
+        future = conn.submit(head + body, url)
+        try:
+            return await asyncio.wait_for(future, read_timeout)
+        except asyncio.TimeoutError:
+            # later responses on this connection would be misattributed; drop it
+            conn.close(requests.ReadTimeout("Read timed out"))
+            raise requests.ReadTimeout(f"Read timed out after {read_timeout}s: {url}")
+
+    async def close(self):
+        for pool in self._pools.values():
+            for conn in pool:
+                conn.close()
+        self._pools.clear()
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of calling GG while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Fail-fast guard for calls to GG.
+
+    After `failure_threshold` consecutive connection failures or timeouts
+    the circuit opens: `check()` raises `CircuitOpenError` immediately, so
+    callers stop piling up on a dead or hung engine. One background thread
+    then runs `probe()` every `probe_interval` seconds. When it succeeds
+    the circuit is half-open (calls go through again) while `on_recover()`
+    restores GG state; if that succeeds the circuit closes, otherwise
+    probing resumes.
+
+    :param probe: callable returning True once GG answers again
+    :param on_recover: callable run after a successful probe (e.g. replay bindings)
+    :param failure_threshold: consecutive failures that open the circuit
+    :param probe_interval: seconds between probes while open
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, probe, on_recover=None, failure_threshold=2, probe_interval=0.2):
+        self.probe = probe
+        self.on_recover = on_recover
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.stats = {"opened": 0, "recovered": 0, "rejected": 0, "last_outage_s": None}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._closed.set()
+
+    def check(self):
+        if self.state == self.OPEN:
+            self.stats["rejected"] += 1
+            raise CircuitOpenError("GG is unavailable (circuit open)")
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            # while half-open the probe thread is replaying state and decides what happens next
+            if self.state == self.CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def trip(self):
+        """Open the circuit now (e.g. GG was not reachable at startup)."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                self._open()
+
+    def _open(self):
+        # called with the lock held
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        self._closed.clear()
+        threading.Thread(target=self._probe_loop, name="gg-probe", daemon=True).start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.probe_interval)
+            try:
+                if not self.probe():
+                    continue
+                self.state = self.HALF_OPEN
+                self.failures = 0
+                if self.on_recover is not None:
+                    self.on_recover()
+            except Exception as e:
+                logger.warning("GG recovery failed, still probing: %s", e)
+                self.state = self.OPEN
+                continue
+            with self._lock:
+                self.state = self.CLOSED
+                self.failures = 0
+                self.stats["recovered"] += 1
+                self.stats["last_outage_s"] = time.monotonic() - self.opened_at
+                self._closed.set()
+            return
+
+    def wait_closed(self, timeout=None):
+        """Block until the circuit is closed; returns False on timeout."""
+        return self._closed.wait(timeout)
+
+    def snapshot(self):
+        return dict(self.stats, state=self.state, failures=self.failures)
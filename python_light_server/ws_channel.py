@@ -0,0 +1,266 @@
+"""
+Persistent WebSocket channel for keystroke lighting messages.
+
+Each client keeps one connection open and sends small JSON text frames:
+
+    {"id": 7, "op": "on", "key": "a", "color": "#00ff00"}
+    {"id": 8, "op": "batch", "ops": [{"op": "off", "key": "a"}, {"op": "on", "key": "b"}]}
+
+and gets one acknowledgement per message:
+
+    {"id": 7, "status": 200, "body": {"status": "Key 'a' lit using lights_on_key()"}}
+
+`op` selects a handler from the table passed in by the light server; the
+handlers are the same functions behind the HTTP endpoints, so both paths
+behave identically. Only the standard library is used (RFC 6455, text
+frames, no extensions).
+"""
+import base64
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+MAX_MESSAGE_SIZE = 1 << 20
+
+
+class _ChannelHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        # acks are tiny; don't let Nagle hold them back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_lock = threading.Lock()
+        self.session = "%s:%s" % self.client_address[:2]
+
+    def handle(self):
+        if not self._handshake():
+            return
+        message = bytearray()
+        message_op = None
+        while True:
+            frame = self._read_frame()
+            if frame is None:
+                return
+            fin, opcode, payload = frame
+            if opcode == OP_CLOSE:
+                self._send_frame(OP_CLOSE, payload[:2])
+                return
+            if opcode == OP_PING:
+                self._send_frame(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode != OP_CONTINUATION:
+                message_op = opcode
+                message = bytearray()
+            message += payload
+            if len(message) > MAX_MESSAGE_SIZE:
+                self._send_frame(OP_CLOSE, struct.pack("!H", 1009))
+                return
+            if fin and message_op == OP_TEXT:
+                self._send_text(self.server.channel.dispatch(bytes(message), self.session))
+
+    def _handshake(self):
+        request_line = self.rfile.readline(65537)
+        headers = {}
+        while True:
+            line = self.rfile.readline(65537)
+            if not line or line in (b"\r\n", b"\n"):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get("sec-websocket-key")
+        if not request_line.startswith(b"GET ") or "websocket" not in headers.get("upgrade", "").lower() or not key:
+            self.wfile.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1(key.encode() + _GUID).digest()).decode()
+        self.wfile.write(
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+        return True
+
+    def _read_exact(self, n):
+        data = self.rfile.read(n)
+        return data if len(data) == n else None
+
+    def _read_frame(self):
+        header = self._read_exact(2)
+        if header is None:
+            return None
+        fin = bool(header[0] & 0x80)
+        opcode = header[0] & 0x0F
+        masked = bool(header[1] & 0x80)
+        length = header[1] & 0x7F
+        if length == 126:
+            ext = self._read_exact(2)
+            if ext is None:
+                return None
+            length = struct.unpack("!H", ext)[0]
+        elif length == 127:
+            ext = self._read_exact(8)
+            if ext is None:
+                return None
+            length = struct.unpack("!Q", ext)[0]
+        if length > MAX_MESSAGE_SIZE:
+            return None
+        mask = self._read_exact(4) if masked else None
+        if masked and mask is None:
+            return None
+        payload = self._read_exact(length) if length else b""
+        if payload is None:
+            return None
+        if mask:
+            payload = bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+        return fin, opcode, payload
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        with self._send_lock:
+            try:
+                self.wfile.write(header + payload)
+            except OSError:
+                pass
+
+    def _send_text(self, text):
+        self._send_frame(OP_TEXT, text.encode("utf-8"))
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LightingChannel:
+    """
+    WebSocket server dispatching lighting messages to request handlers.
+
+    :param handlers: {op: handler(data) -> (body, status)}
+    :param host: interface to bind
+    :param port: port to bind (0 = pick a free one)
+    :param capture: TraceRecorder every handled message is recorded in (None = no capture)
+    """
+
+    def __init__(self, handlers, host="127.0.0.1", port=5051, capture=None):
+        self.handlers = handlers
+        self.capture = capture
+        self._server = _ThreadingServer((host, port), _ChannelHandler)
+        self._server.channel = self
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    def dispatch(self, raw, session=None):
+        """Handle one text message from connection `session` and return the JSON acknowledgement."""
+        at, start = time.time(), time.perf_counter()
+        try:
+            message = json.loads(raw)
+            if not isinstance(message, dict):
+                raise ValueError("message must be a JSON object")
+        except ValueError as e:
+            return json.dumps({"id": None, "status": 400, "body": {"error": f"Invalid message: {e}"}})
+        handler = self.handlers.get(message.get("op"))
+        if handler is None:
+            body, status = {"error": f"Unknown op '{message.get('op')}'"}, 400
+        else:
+            try:
+                body, status = handler(message)
+            except Exception as e:
+                body, status = {"error": str(e)}, 500
+        if self.capture is not None:
+            self.capture.record(session, "channel", {k: v for k, v in message.items() if k != "id"}, status,
+                                (time.perf_counter() - start) * 1000, at=at)
+        return json.dumps({"id": message.get("id"), "status": status, "body": body})
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="lighting-channel", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class ChannelClient:
+    """
+    Minimal blocking client for the lighting channel (used by benchmarks and tools).
+
+    :param host: channel host
+    :param port: channel port
+    """
+
+    def __init__(self, host="127.0.0.1", port=5051):
+        self._sock = socket.create_connection((host, port))
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        self._next_id = 0
+        key = base64.b64encode(os.urandom(16)).decode()
+        self._sock.sendall(
+            f"GET / HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n".encode()
+        )
+        status = self._file.readline()
+        if b" 101 " not in status:
+            raise ConnectionError(f"WebSocket handshake failed: {status!r}")
+        while self._file.readline() not in (b"\r\n", b"\n", b""):
+            pass
+
+    def request(self, message):
+        """Send one message ({op, ...}) and wait for its acknowledgement."""
+        self._next_id += 1
+        message = dict(message, id=self._next_id)
+        payload = json.dumps(message).encode("utf-8")
+        mask = os.urandom(4)
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | OP_TEXT, 0x80 | length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | OP_TEXT, 0x80 | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | OP_TEXT, 0x80 | 127, length)
+        self._sock.sendall(header + mask + bytes(b ^ mask[i & 3] for i, b in enumerate(payload)))
+        while True:
+            head = self._file.read(2)
+            if len(head) < 2:
+                raise ConnectionError("Channel closed")
+            opcode = head[0] & 0x0F
+            length = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._file.read(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._file.read(8))[0]
+            data = self._file.read(length)
+            if opcode == OP_TEXT:
+                return json.loads(data)
+            if opcode == OP_CLOSE:
+                raise ConnectionError("Channel closed")
+
+    def close(self):
+        try:
+            self._sock.sendall(struct.pack("!BB", 0x80 | OP_CLOSE, 0x80) + os.urandom(4))
+        except OSError:
+            pass
+        self._file.close()
+        self._sock.close()